@@ -0,0 +1,99 @@
+"""
+agendador_lote.py - Execução de matrizes grandes de relatórios com limite adaptativo
+
+Com centenas de cursos, o gargalo é a fila de geração do portal: cada
+relatório passa minutos em processamento enquanto a thread só espera.
+Um número fixo de workers deixa o portal ocioso (poucos) ou sobrecarregado
+(muitos). O agendador mantém até `maximo` trabalhos em andamento, com o
+limite ajustado por AIMD (controle_concorrencia.LimiteAIMD): cresce
+enquanto os relatórios terminam bem e cai pela metade quando falham
+(erro no servidor, timeout, sessão).
+
+Com um prazo (fim da janela noturna), trabalhos que não terminariam a
+tempo pela duração mediana observada não são iniciados; ficam em
+`adiados` para a próxima execução (executar_lote.py --retomar).
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from config import CONCORRENCIA_AGENDADOR
+from controle_concorrencia import LimiteAIMD
+
+logger = logging.getLogger(__name__)
+
+
+class AgendadorLote:
+    """Executa (mensagem, função) com um limite AIMD de trabalhos em andamento"""
+
+    def __init__(self, inicial: int = CONCORRENCIA_AGENDADOR[0], maximo: int = CONCORRENCIA_AGENDADOR[1],
+                 prazo: Optional[float] = None):
+        # Duração de um relatório depende do tamanho, não da carga: só falhas reduzem o limite
+        self.limite = LimiteAIMD('relatorios', min(inicial, maximo), 1, maximo, fator_latencia=float('inf'))
+        self.prazo = prazo
+        self.adiados: List[str] = []
+        self.concluidos = 0
+        self.falhas = 0
+        self._duracoes = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def duracao_mediana(self) -> Optional[float]:
+        with self._lock:
+            return statistics.median(self._duracoes) if self._duracoes else None
+
+    def _cabe_no_prazo(self) -> bool:
+        if self.prazo is None:
+            return True
+        return time.time() + (self.duracao_mediana() or 0) <= self.prazo
+
+    def executar(self, trabalhos: Sequence[Tuple[str, Callable]], executar: Callable) -> None:
+        """Chama executar(mensagem, função) para cada trabalho; `executar` devolve a lista de resultados"""
+        total = len(trabalhos)
+        inicio = time.time()
+
+        def rodar(trabalho):
+            self.limite.adquirir()
+            if not self._cabe_no_prazo():
+                self.limite.devolver()
+                with self._lock:
+                    self.adiados.append(trabalho[0])
+                return
+            inicio_trabalho = time.perf_counter()
+            erro = True
+            try:
+                novos = executar(*trabalho) or []
+                erro = any(not resultado.get('success') for resultado in novos)
+            finally:
+                duracao = time.perf_counter() - inicio_trabalho
+                self.limite.liberar(duracao, erro)
+                with self._lock:
+                    self.concluidos += 1
+                    self.falhas += erro
+                    if not erro:
+                        self._duracoes.append(duracao)
+                    concluidos = self.concluidos
+                self._registrar_progresso(concluidos, total, inicio)
+
+        # Uma thread por vaga máxima; o LimiteAIMD decide quantas trabalham ao mesmo tempo
+        with ThreadPoolExecutor(max_workers=int(self.limite.maximo), thread_name_prefix='agendador') as pool:
+            list(pool.map(rodar, trabalhos))
+
+        if self.adiados:
+            logger.warning(f"{len(self.adiados)} trabalhos adiados: não terminariam dentro do prazo")
+
+    def _registrar_progresso(self, concluidos: int, total: int, inicio: float):
+        decorrido = time.time() - inicio
+        restantes = total - concluidos - len(self.adiados)
+        eta = restantes * decorrido / concluidos if concluidos else 0
+        logger.info(f"Agendador: {concluidos}/{total} trabalhos ({self.falhas} com falha), "
+                    f"limite {self.limite.limite:.1f}, restante estimado {eta / 60:.0f}min")
+
+    def snapshot(self):
+        estado = self.limite.snapshot()
+        estado.update(concluidos=self.concluidos, falhas=self.falhas, adiados=len(self.adiados),
+                      duracao_mediana_s=round(self.duracao_mediana() or 0, 1))
+        return estado
@@ -0,0 +1,120 @@
+"""
+analise_incremental.py - Consolidação dos relatórios à medida que são baixados
+
+Produtor/consumidor: as threads de geração entregam cada resultado assim
+que baixar_relatorio termina, e uma thread de análise lê o arquivo, conta
+as categorias (TabelaEvasao) e indexa os alunos (IndiceAlunos) enquanto os
+demais relatórios ainda estão na fila do portal. Ao fim do lote sobra
+apenas o último relatório para analisar, em vez de uma segunda passada
+por todos os arquivos.
+"""
+import logging
+import queue
+import threading
+from typing import Dict, List, Optional
+
+from rastreamento import span
+
+logger = logging.getLogger(__name__)
+
+_FIM = object()
+
+
+class AnaliseIncremental:
+    """Consumidor dos relatórios baixados; o resultado equivale a consolidar_dados_todos_relatorios"""
+
+    def __init__(self, cursos: List[str], processador=None):
+        self.cursos = list(cursos)
+        self.processador = processador
+        self.tabela = None
+        self.indice_alunos = None
+        self.analisados = 0
+        self._fila = queue.Queue()
+        self._vistos = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._consumir, name='analise', daemon=True)
+        self._thread.start()
+
+    def enviar(self, resultado: Dict):
+        """Entrega um resultado de geração (chamado pelas threads de download)"""
+        if not resultado.get('success') or not resultado.get('caminho_arquivo'):
+            return
+        with self._lock:
+            if resultado['caminho_arquivo'] in self._vistos:
+                return
+            self._vistos.add(resultado['caminho_arquivo'])
+        self._fila.put(resultado)
+
+    def _consumir(self):
+        # pandas e a consolidação são importados aqui, fora da thread da interface
+        from consolidacao import TabelaEvasao
+        from gerador_relatorios import ProcessadorDadosRelatorios
+        from indice_alunos import IndiceAlunos
+
+        self.processador = self.processador or ProcessadorDadosRelatorios()
+        self.tabela = TabelaEvasao()
+        self.indice_alunos = IndiceAlunos()
+        for curso in self.cursos:
+            self.tabela.registrar_curso(curso)
+
+        while True:
+            resultado = self._fila.get()
+            if resultado is _FIM:
+                break
+            self._analisar(resultado)
+
+    def _analisar(self, resultado: Dict):
+        try:
+            self._contar(resultado)
+        except Exception as e:
+            logger.error(f"Erro ao analisar {resultado['caminho_arquivo']}: {str(e)}")
+
+    def _contar(self, resultado: Dict):
+        df = self.processador.ler_relatorio_excel(resultado['caminho_arquivo'])
+        if df is None:
+            return
+        curso, periodo = resultado['curso'], resultado.get('periodo')
+        with span('processador.contar_relatorio', curso=curso, periodo=periodo):
+            self.tabela.adicionar_relatorio(df, curso, periodo)
+        self.indice_alunos.adicionar_relatorio(df, curso, periodo, resultado['caminho_arquivo'])
+        self.analisados += 1
+
+    def finalizar(self):
+        """Aguarda a análise dos relatórios já entregues e encerra a thread"""
+        if self._thread.is_alive():
+            self._fila.put(_FIM)
+            self._thread.join()
+        # Entregues depois do encerramento: analisados nesta thread
+        while not self._fila.empty():
+            resultado = self._fila.get_nowait()
+            if resultado is not _FIM:
+                self._analisar(resultado)
+
+    def dados_consolidados(self, resultados_geracao: Dict) -> Optional[Dict]:
+        """Dados consolidados de `resultados_geracao`, analisando só o que ainda não foi entregue
+
+        Retorna None se a análise incluiu relatórios que não fazem parte
+        de `resultados_geracao` (ex.: outro lote); nesse caso o chamador
+        deve consolidar do zero.
+        """
+        caminhos = {
+            resultado['caminho_arquivo']
+            for resultados_curso in resultados_geracao.values()
+            for resultado in resultados_curso
+            if resultado.get('success') and resultado.get('caminho_arquivo')
+        }
+        with self._lock:
+            if not self._vistos <= caminhos:
+                return None
+        if list(resultados_geracao) != self.cursos:
+            return None
+
+        for resultados_curso in resultados_geracao.values():
+            for resultado in resultados_curso:
+                self.enviar(resultado)
+        self.finalizar()
+        logger.info(f"Análise incremental: {self.analisados} relatório(s) analisados")
+        return {
+            'tabela': self.tabela,
+            'resumo_geral': self.tabela.resumo_geral()
+        }
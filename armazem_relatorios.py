@@ -0,0 +1,272 @@
+"""
+armazem_relatorios.py - Armazém analítico embutido (SQLite) com os relatórios baixados
+
+Cada relatório é ingerido uma única vez: as linhas de alunos vão para a
+tabela `alunos` e as contagens de cada dimensão para tabelas indexadas
+(`situacoes`, `cancelamentos`, `modalidades`). Consultas ad hoc e as abas da
+planilha consolidada passam a ser respondidas com SQL, sem reler os XLSX.
+"""
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from consolidacao import (
+    CATEGORIA_TOTAL, COLUNAS_CONTAGEM, DIMENSAO_CANCELAMENTO, DIMENSAO_MODALIDADE,
+    DIMENSAO_SITUACAO, DIMENSAO_TOTAL, PREFIXOS_MODALIDADE, TabelaEvasao,
+    classificar_motivos, contar_relatorio, normalizar_situacoes
+)
+from gestor_disco import caminho_disponivel
+from indice_alunos import COLUNAS_MATRICULA
+
+logger = logging.getLogger(__name__)
+
+# Tabela de contagens de cada dimensão
+TABELAS_DIMENSAO = {
+    DIMENSAO_SITUACAO: 'situacoes',
+    DIMENSAO_CANCELAMENTO: 'cancelamentos',
+    DIMENSAO_MODALIDADE: 'modalidades'
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS relatorios (
+    id INTEGER PRIMARY KEY,
+    caminho TEXT NOT NULL UNIQUE,
+    curso TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    tamanho INTEGER,
+    modificado_em REAL,
+    total_registros INTEGER NOT NULL,
+    ingerido_em TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_relatorios_curso_periodo ON relatorios (curso, periodo);
+
+CREATE TABLE IF NOT EXISTS alunos (
+    relatorio_id INTEGER NOT NULL REFERENCES relatorios (id),
+    curso TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    matricula TEXT,
+    situacao TEXT,
+    situacao_categoria TEXT,
+    motivo TEXT,
+    motivo_categoria TEXT,
+    modalidade TEXT,
+    modalidade_grupo TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_alunos_relatorio ON alunos (relatorio_id);
+CREATE INDEX IF NOT EXISTS idx_alunos_curso_periodo ON alunos (curso, periodo);
+CREATE INDEX IF NOT EXISTS idx_alunos_matricula ON alunos (matricula);
+CREATE INDEX IF NOT EXISTS idx_alunos_modalidade ON alunos (modalidade_grupo, periodo);
+CREATE INDEX IF NOT EXISTS idx_alunos_motivo ON alunos (motivo_categoria, periodo);
+"""
+
+ESQUEMA_DIMENSAO = """
+CREATE TABLE IF NOT EXISTS {tabela} (
+    relatorio_id INTEGER NOT NULL REFERENCES relatorios (id),
+    curso TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    categoria TEXT NOT NULL,
+    quantidade INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_{tabela}_relatorio ON {tabela} (relatorio_id);
+CREATE INDEX IF NOT EXISTS idx_{tabela}_curso_periodo ON {tabela} (curso, periodo, categoria);
+"""
+
+
+def _grupo_modalidade(modalidades: pd.Series) -> np.ndarray:
+    """Ampla Concorrência / Ações Afirmativas pelo prefixo do código da modalidade"""
+    texto = modalidades.fillna('').astype(str)
+    condicoes = [texto.str.startswith(prefixo).to_numpy() for prefixo in PREFIXOS_MODALIDADE.values()]
+    return np.select(condicoes, list(PREFIXOS_MODALIDADE), default='')
+
+
+def _coluna_texto(df: pd.DataFrame, coluna: str) -> pd.Series:
+    if coluna not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    serie = df[coluna]
+    return serie.astype(object).where(serie.notna(), None).map(lambda v: v if v is None else str(v))
+
+
+class ArmazemRelatorios:
+    """Banco SQLite local com uma ingestão por relatório e consultas SQL sobre todos eles"""
+
+    def __init__(self, caminho_banco: str):
+        self.caminho_banco = caminho_banco
+        pasta = os.path.dirname(caminho_banco)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.conexao = sqlite3.connect(caminho_banco)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        self._criar_esquema()
+
+    def _criar_esquema(self):
+        with self.conexao:
+            self.conexao.executescript(ESQUEMA)
+            for tabela in TABELAS_DIMENSAO.values():
+                self.conexao.executescript(ESQUEMA_DIMENSAO.format(tabela=tabela))
+
+    def fechar(self):
+        self.conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def _relatorio_existente(self, caminho: str):
+        return self.conexao.execute(
+            "SELECT id, tamanho, modificado_em FROM relatorios WHERE caminho = ?", (caminho,)
+        ).fetchone()
+
+    def esta_atualizado(self, caminho: str) -> bool:
+        """Indica se o arquivo já foi ingerido e não mudou desde então"""
+        existente = self._relatorio_existente(os.path.abspath(caminho))
+        if not existente or not os.path.exists(caminho):
+            return False
+        estado = os.stat(caminho)
+        return existente[1] == estado.st_size and existente[2] == estado.st_mtime
+
+    def ingerir_relatorio(self, caminho: str, curso: str, periodo: str,
+                          df: Optional[pd.DataFrame] = None) -> bool:
+        """Ingere um relatório; retorna False se ele já estava atualizado no banco"""
+        # Comprimido pelo GestorDisco: restaurado com o mesmo tamanho e mtime
+        caminho = caminho_disponivel(caminho) or caminho
+        if self.esta_atualizado(caminho):
+            return False
+        if df is None:
+            df = pd.read_excel(caminho)
+
+        caminho_abs = os.path.abspath(caminho)
+        estado = os.stat(caminho)
+        periodo = str(periodo)
+
+        with self.conexao:
+            existente = self._relatorio_existente(caminho_abs)
+            if existente:
+                self._remover_linhas(existente[0])
+                self.conexao.execute("DELETE FROM relatorios WHERE id = ?", (existente[0],))
+
+            cursor = self.conexao.execute(
+                "INSERT INTO relatorios (caminho, curso, periodo, tamanho, modificado_em, "
+                "total_registros, ingerido_em) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (caminho_abs, curso, periodo, estado.st_size, estado.st_mtime, len(df),
+                 datetime.now().isoformat(timespec='seconds'))
+            )
+            relatorio_id = cursor.lastrowid
+
+            contagens = contar_relatorio(df, curso, periodo)
+            for dimensao, tabela in TABELAS_DIMENSAO.items():
+                parte = contagens[contagens['dimensao'] == dimensao]
+                self.conexao.executemany(
+                    f"INSERT INTO {tabela} (relatorio_id, curso, periodo, categoria, quantidade) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(relatorio_id, curso, periodo, categoria, int(quantidade))
+                     for categoria, quantidade in zip(parte['categoria'], parte['quantidade'])]
+                )
+
+            self._inserir_alunos(relatorio_id, df, curso, periodo)
+
+        logger.info(f"Relatório ingerido no armazém: {os.path.basename(caminho)} ({len(df)} linhas)")
+        return True
+
+    def _remover_linhas(self, relatorio_id: int):
+        for tabela in ['alunos'] + list(TABELAS_DIMENSAO.values()):
+            self.conexao.execute(f"DELETE FROM {tabela} WHERE relatorio_id = ?", (relatorio_id,))
+
+    def _inserir_alunos(self, relatorio_id: int, df: pd.DataFrame, curso: str, periodo: str):
+        if df.empty:
+            return
+        coluna_matricula = next((c for c in COLUNAS_MATRICULA if c in df.columns), None)
+        motivos = _coluna_texto(df, 'MOTIVO DO CANCELAMENTO')
+        cancelado = motivos.notna() & (motivos != '')
+        motivo_categoria = pd.Series('', index=df.index, dtype=object)
+        if cancelado.any():
+            motivo_categoria[cancelado] = classificar_motivos(pd.Index(motivos[cancelado]))
+        situacoes = _coluna_texto(df, 'SITUAÇÃO')
+        modalidades = _coluna_texto(df, 'MODALIDADE')
+
+        alunos = pd.DataFrame({
+            'relatorio_id': relatorio_id,
+            'curso': curso,
+            'periodo': periodo,
+            'matricula': _coluna_texto(df, coluna_matricula) if coluna_matricula else None,
+            'situacao': situacoes,
+            'situacao_categoria': normalizar_situacoes(situacoes),
+            'motivo': motivos,
+            'motivo_categoria': motivo_categoria,
+            'modalidade': modalidades,
+            'modalidade_grupo': _grupo_modalidade(modalidades)
+        })
+        alunos.to_sql('alunos', self.conexao, if_exists='append', index=False, chunksize=10000)
+
+    def consultar(self, sql: str, parametros: Iterable = ()) -> pd.DataFrame:
+        """Executa uma consulta SQL ad hoc e retorna um DataFrame"""
+        return pd.read_sql_query(sql, self.conexao, params=tuple(parametros))
+
+    def linhas_por_relatorio(self) -> Dict:
+        """Maior número de linhas já observado por (curso, período) - estimativas do planejador"""
+        cursor = self.conexao.execute(
+            "SELECT curso, periodo, MAX(total_registros) FROM relatorios GROUP BY curso, periodo"
+        )
+        return {(curso, periodo): total for curso, periodo, total in cursor}
+
+    def _filtro_caminhos(self, caminhos: Optional[List[str]]) -> str:
+        """Restringe as consultas aos relatórios informados (tabela temporária)"""
+        if caminhos is None:
+            return ''
+        with self.conexao:
+            self.conexao.execute("CREATE TEMP TABLE IF NOT EXISTS selecao (caminho TEXT PRIMARY KEY)")
+            self.conexao.execute("DELETE FROM selecao")
+            self.conexao.executemany(
+                "INSERT OR IGNORE INTO selecao (caminho) VALUES (?)",
+                [(os.path.abspath(c),) for c in caminhos]
+            )
+        return "WHERE r.caminho IN (SELECT caminho FROM selecao)"
+
+    def contagens(self, caminhos: Optional[List[str]] = None) -> pd.DataFrame:
+        """Contagens em formato longo (mesmo formato de consolidacao.contar_relatorio)"""
+        filtro = self._filtro_caminhos(caminhos)
+        partes = [
+            f"SELECT r.curso, r.periodo, '{DIMENSAO_TOTAL}' AS dimensao, "
+            f"'{CATEGORIA_TOTAL}' AS categoria, r.total_registros AS quantidade, r.id AS ordem "
+            f"FROM relatorios r {filtro}"
+        ]
+        for dimensao, tabela in TABELAS_DIMENSAO.items():
+            partes.append(
+                f"SELECT d.curso, d.periodo, '{dimensao}', d.categoria, d.quantidade, r.id "
+                f"FROM {tabela} d JOIN relatorios r ON r.id = d.relatorio_id {filtro}"
+            )
+        sql = " UNION ALL ".join(partes) + " ORDER BY ordem"
+        return self.consultar(sql)[COLUNAS_CONTAGEM]
+
+    def tabela_evasao(self, cursos: Optional[List[str]] = None,
+                      caminhos: Optional[List[str]] = None) -> TabelaEvasao:
+        """TabelaEvasao (e portanto as quatro abas) a partir das contagens no banco"""
+        tabela = TabelaEvasao()
+        for curso in cursos or []:
+            tabela.registrar_curso(curso)
+        tabela.adicionar_contagens(self.contagens(caminhos))
+        return tabela
+
+    def evasao_por_modalidade(self, periodo_inicial: Optional[str] = None) -> pd.DataFrame:
+        """Evasão por curso e modalidade de ingresso, opcionalmente a partir de um período"""
+        return self.consultar(
+            """
+            SELECT curso,
+                   modalidade_grupo AS modalidade,
+                   COUNT(*) AS total,
+                   SUM(motivo_categoria <> '') AS cancelamentos,
+                   ROUND(100.0 * SUM(motivo_categoria <> '') / COUNT(*), 2) AS percentual
+            FROM alunos
+            WHERE periodo >= ?
+            GROUP BY curso, modalidade_grupo
+            ORDER BY curso, modalidade_grupo
+            """,
+            (str(periodo_inicial or ''),)
+        )
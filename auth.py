@@ -2,11 +2,14 @@
 auth.py - Módulo de autenticação no sistema UFF (versão funcional)
 """
 import requests
-from bs4 import BeautifulSoup
 import re
 import logging
 from urllib.parse import urlparse, urljoin
 from config import *
+from utils import criar_soup
+from instrumentacao_http import instrumentar_sessao
+from cassete_http import montar_cassete
+from rastreamento import rastrear
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +21,14 @@ class UFFAuthenticator:
         self.password = password
         self.session = requests.Session()
         self.session.headers.update(HEADERS)
+        instrumentar_sessao(self.session)
+        montar_cassete(self.session)
         self.is_authenticated = False
         self.auth_data = {}
     
     def extract_login_parameters(self, html_content):
         """Extrai parâmetros do formulário de login (função que estava funcionando)"""
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = criar_soup(html_content)
         
         # Primeiro, tentar encontrar o formulário pelo ID
         login_form = soup.find('form', {'id': 'kc-form-login'})
@@ -51,6 +56,7 @@ class UFFAuthenticator:
             'hidden_fields': hidden_inputs
         }
     
+    @rastrear('auth.login')
     def login(self, username=None, password=None):
         """Realiza login no sistema UFF usando a lógica que estava funcionando"""
         if username:
@@ -135,7 +141,7 @@ class UFFAuthenticator:
                     return True
                 else:
                     # Verificar se há mensagem de erro
-                    soup = BeautifulSoup(login_response.text, 'html.parser')
+                    soup = criar_soup(login_response.text)
                     error_div = soup.find('div', {'id': 'kc-error-message'}) or \
                                soup.find('span', class_='kc-feedback-text') or \
                                soup.find('div', class_='alert-error')
@@ -157,7 +163,7 @@ class UFFAuthenticator:
     
     def _extract_csrf_token(self, html_content):
         """Extrai token CSRF do HTML"""
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = criar_soup(html_content)
         
         # Procurar meta tag CSRF
         meta_token = soup.find('meta', {'name': 'csrf-token'})
@@ -0,0 +1,421 @@
+"""
+benchmark.py - Medições de desempenho do processamento de relatórios
+
+Uso:
+    python benchmark.py escrita [--linhas 20000]
+    python benchmark.py suite [--tamanhos 100 1000 10000] [--saida benchmark.json]
+    python benchmark.py importacao [--repeticoes 3]
+    python benchmark.py concorrencia [--threads 24] [--requisicoes 600]
+    python benchmark.py memoria [--trabalhos 5000] [--tamanho-html 60000]
+"""
+import argparse
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config import IMPORTACOES_TARDIAS, ORCAMENTO_IMPORTACAO_MS
+from consolidacao import CATEGORIAS_CANCELAMENTO, CATEGORIAS_SITUACAO
+from escritor_planilha import eh_coluna_percentual, escrever_planilha
+from gerador_relatorios import ProcessadorDadosRelatorios
+from gerador_sintetico import gerar_relatorio_sintetico
+from registros import ResultadoRelatorio, StatusRelatorio, SubmissaoFormulario
+from utils import salvar_json
+
+TAMANHOS_PADRAO = [100, 1000, 10000, 100000]
+
+
+def criar_aba_detalhes_sintetica(n_linhas: int, semente: int = 42) -> pd.DataFrame:
+    """Cria uma aba DETALHES com n_linhas no mesmo formato de TabelaEvasao.aba_detalhes"""
+    rng = np.random.default_rng(semente)
+    total = rng.integers(20, 200, n_linhas)
+    detalhes = pd.DataFrame({
+        'Curso': [f'Curso {i % 500:03d}' for i in range(n_linhas)],
+        'Período': [f'{2013 + (i // 2) % 13}/{1 + i % 2}' for i in range(n_linhas)],
+        'Total Registros': total,
+        'Matrículas Ativas': rng.integers(0, 20, n_linhas),
+        'Ampla Concorrência': rng.integers(0, 100, n_linhas),
+        'Ações Afirmativas': rng.integers(0, 100, n_linhas)
+    })
+    for categoria in CATEGORIAS_SITUACAO:
+        quantidade = rng.integers(0, 20, n_linhas)
+        detalhes[f'{categoria} (qtd)'] = quantidade
+        detalhes[f'{categoria} (%)'] = np.round(quantidade / total * 100, 2)
+    for categoria in CATEGORIAS_CANCELAMENTO:
+        detalhes[f'Cancel: {categoria}'] = rng.integers(0, 10, n_linhas)
+    return detalhes
+
+
+def escrever_planilha_legado(abas, caminho_saida):
+    """Reprodução da escrita anterior: to_excel + reescrita célula a célula + autofit"""
+    with pd.ExcelWriter(caminho_saida, engine='xlsxwriter') as writer:
+        workbook = writer.book
+        format_percent = workbook.add_format({'num_format': '0.00%'})
+        format_header = workbook.add_format({'bold': True, 'bg_color': '#366092', 'font_color': 'white'})
+        for nome_aba, df in abas.items():
+            df.to_excel(writer, sheet_name=nome_aba, index=False)
+            worksheet = writer.sheets[nome_aba]
+            for col_num, value in enumerate(df.columns.values):
+                worksheet.write(0, col_num, value, format_header)
+            for col_num, col_name in enumerate(df.columns):
+                if eh_coluna_percentual(col_name):
+                    for row in range(1, len(df) + 1):
+                        worksheet.write(row, col_num, df.iloc[row-1][col_name]/100, format_percent)
+            worksheet.autofit()
+
+
+def _cronometrar(funcao, *args, repeticoes=1):
+    """Menor tempo entre as repetições e o resultado da última chamada"""
+    melhor = None
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor, resultado
+
+
+def benchmark_escrita(n_linhas: int = 10000) -> dict:
+    """Compara a escrita vetorizada com a escrita anterior para a aba DETALHES"""
+    abas = {'DETALHES': criar_aba_detalhes_sintetica(n_linhas)}
+    with tempfile.TemporaryDirectory() as pasta:
+        tempo_legado, _ = _cronometrar(escrever_planilha_legado, abas, os.path.join(pasta, 'legado.xlsx'))
+        tempo_vetorizado, _ = _cronometrar(escrever_planilha, abas, os.path.join(pasta, 'vetorizado.xlsx'))
+    return {
+        'linhas': n_linhas,
+        'legado_s': round(tempo_legado, 3),
+        'vetorizado_s': round(tempo_vetorizado, 3),
+        'aceleracao': round(tempo_legado / tempo_vetorizado, 1) if tempo_vetorizado > 0 else None
+    }
+
+
+def _resultados_sinteticos(caminho: str, n_relatorios: int) -> dict:
+    """resultados_geracao com n_relatorios apontando para o mesmo arquivo sintético"""
+    resultados = {}
+    for i in range(n_relatorios):
+        curso = f"Curso Sintético {i % 3 + 1}"
+        periodo = f"{2013 + i // 6}{i // 3 % 2 + 1}"
+        resultados.setdefault(curso, []).append(
+            {'success': True, 'caminho_arquivo': caminho, 'periodo': periodo}
+        )
+    return resultados
+
+
+def _medir_tamanho(processador, caminho: str, n_linhas: int, n_relatorios: int,
+                   pasta: str, repeticoes: int) -> dict:
+    tempos = {}
+    tempos['ler_relatorio_excel'], df = _cronometrar(
+        processador.ler_relatorio_excel, caminho, repeticoes=repeticoes)
+    tempos['extrair_dados_relatorio'], _ = _cronometrar(
+        processador.extrair_dados_relatorio, df, 'Curso Sintético 1', '20131', repeticoes=repeticoes)
+    tempos['consolidar_dados_todos_relatorios'], dados = _cronometrar(
+        processador.consolidar_dados_todos_relatorios, _resultados_sinteticos(caminho, n_relatorios),
+        repeticoes=repeticoes)
+    tempos['gerar_planilha_consolidada'], _ = _cronometrar(
+        processador.gerar_planilha_consolidada, dados, os.path.join(pasta, f'consolidada_{n_linhas}.xlsx'),
+        repeticoes=repeticoes)
+    return {
+        'linhas': n_linhas,
+        'relatorios': n_relatorios,
+        'tamanho_arquivo_bytes': os.path.getsize(caminho),
+        'tempos_s': {etapa: round(tempo, 4) for etapa, tempo in tempos.items()}
+    }
+
+
+def benchmark_processamento(tamanhos=None, n_relatorios: int = 6, repeticoes: int = 1,
+                            pasta_dados: str = None) -> dict:
+    """Mede as etapas do ProcessadorDadosRelatorios sobre relatórios sintéticos de vários tamanhos
+
+    Os relatórios sintéticos são reaproveitados entre execuções quando
+    pasta_dados é informada.
+    """
+    processador = ProcessadorDadosRelatorios()
+    medicoes = []
+    with tempfile.TemporaryDirectory() as temporaria:
+        pasta = pasta_dados or temporaria
+        os.makedirs(pasta, exist_ok=True)
+        for n_linhas in tamanhos or TAMANHOS_PADRAO:
+            caminho = os.path.join(pasta, f'sintetico_{n_linhas}.xlsx')
+            if not os.path.exists(caminho):
+                gerar_relatorio_sintetico(n_linhas, caminho)
+            medicoes.append(_medir_tamanho(processador, caminho, n_linhas, n_relatorios, temporaria, repeticoes))
+
+    return {
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'repeticoes': repeticoes,
+        'medicoes': medicoes
+    }
+
+
+def medir_importacao(modulo: str, repeticoes: int = 3, base: str = 'requests') -> dict:
+    """Tempo cumulativo de `import modulo` em um interpretador novo (menor entre as repetições)
+
+    `acrescimo_ms` desconta o `import base` feito dentro do mesmo import: o
+    tempo de requests varia com a máquina e não é do projeto.
+    """
+    melhor = None
+    carregados = set()
+    for _ in range(repeticoes):
+        processo = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if processo.returncode != 0:
+            raise RuntimeError(f"Falha ao importar {modulo}: {processo.stderr.strip().splitlines()[-1]}")
+        tempo, tempo_base = None, 0.0
+        for linha in processo.stderr.splitlines():
+            if not linha.startswith('import time:') or '|' not in linha:
+                continue
+            _, cumulativo, nome = linha.split('|')
+            nome = nome.rstrip()
+            carregados.add(nome.strip())
+            if nome == f' {modulo}':
+                tempo = int(cumulativo) / 1000
+            elif nome.strip() == base:
+                tempo_base = int(cumulativo) / 1000
+        if tempo is not None and (melhor is None or tempo - tempo_base < melhor[0] - melhor[1]):
+            melhor = (tempo, tempo_base)
+    return {
+        'modulo': modulo,
+        'tempo_ms': round(melhor[0], 1),
+        'base_ms': round(melhor[1], 1),
+        'acrescimo_ms': round(melhor[0] - melhor[1], 1),
+        'tardias_carregadas': sorted(m for m in IMPORTACOES_TARDIAS if m in carregados)
+    }
+
+
+def verificar_orcamento_importacao(orcamentos=None, repeticoes: int = 3) -> list:
+    """Mede cada módulo e marca os que estouram o orçamento ou carregam bibliotecas pesadas"""
+    resultados = []
+    for modulo, limite_ms in (orcamentos or ORCAMENTO_IMPORTACAO_MS).items():
+        medicao = medir_importacao(modulo, repeticoes)
+        medicao['orcamento_ms'] = limite_ms
+        medicao['ok'] = medicao['acrescimo_ms'] <= limite_ms and not medicao['tardias_carregadas']
+        resultados.append(medicao)
+    return resultados
+
+
+def _medir_cenario(n_threads: int, requisicoes: int, capacidade: int, adaptativo: bool) -> dict:
+    import requests
+    from controle_concorrencia import CLASSE_POLLING, ControladorConcorrencia, montar_controle
+    from portal_simulado import PortalSimulado
+
+    controlador = ControladorConcorrencia() if adaptativo else None
+    local = threading.local()
+    latencias, erros = [], []
+    lock = threading.Lock()
+
+    with PortalSimulado(capacidade=capacidade, limite_rejeicao=2 * capacidade) as portal:
+        def verificar(i):
+            if not hasattr(local, 'sessao'):
+                local.sessao = requests.Session()
+                if controlador is not None:
+                    montar_controle(local.sessao, controlador)
+            inicio = time.perf_counter()
+            try:
+                ok = local.sessao.get(f"{portal.url}/relatorios/{i}", timeout=10).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                (latencias if ok else erros).append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            list(pool.map(verificar, range(requisicoes)))
+        duracao = time.perf_counter() - inicio
+
+    return {
+        'threads': n_threads,
+        'adaptativo': adaptativo,
+        'duracao_s': round(duracao, 2),
+        'vazao_req_s': round(len(latencias) / duracao, 1),
+        'taxa_erro': round(len(erros) / requisicoes, 3),
+        'p95_ms': round(float(np.percentile(latencias, 95)) * 1000, 1) if latencias else None,
+        'pico_servidor': portal.pico,
+        'limite_final': controlador.limites[CLASSE_POLLING].snapshot()['limite'] if controlador else None
+    }
+
+
+def benchmark_concorrencia(threads: int = 24, requisicoes: int = 600, capacidade: int = 6) -> list:
+    """Limite fixo tímido (1), fixo agressivo (threads) e AIMD contra o PortalSimulado"""
+    return [
+        _medir_cenario(1, requisicoes // 4, capacidade, adaptativo=False),
+        _medir_cenario(threads, requisicoes, capacidade, adaptativo=False),
+        _medir_cenario(threads, requisicoes, capacidade, adaptativo=True)
+    ]
+
+
+ETAPAS_SINTETICAS = ('Solicitado', 'Na fila', 'Processando', 'Gerando arquivo', 'Concluído')
+
+
+def _status_sintetico(i: int) -> dict:
+    """status_info como o devolvido pela página de status (textos novos a cada trabalho, como no parse)"""
+    return {
+        'id': str(100000 + i),
+        'status': 'PRONTO',
+        'etapas': [etapa.encode().decode() for etapa in ETAPAS_SINTETICAS],
+        'detalhes': {
+            'solicitado_em': f'0{1 + i % 9}/03/2025 10:{i % 60:02d}',
+            'processado_em': f'0{1 + i % 9}/03/2025 10:{(i + 3) % 60:02d}',
+            'situacao': 'Concluído'.encode().decode(),
+            'formato': 'XLS'.encode().decode(),
+            'registros': str(i % 500)
+        },
+        'filtros': {
+            'Localidade': 'Niterói'.encode().decode(),
+            'Curso': f'Curso {i % 300:03d}',
+            'Desdobramento': f'Curso {i % 300:03d} - Licenciatura ({10000 + i % 300})',
+            'Turno': 'Todos'.encode().decode(),
+            'Forma de ingresso': 'SISU 1ª Edição'.encode().decode(),
+            'Ano/Semestre de ingresso': f'{2013 + i % 13}/{1 + i % 2}'
+        },
+        'download_url': f'https://app.uff.br/graduacao/administracaoacademica/relatorios/{100000 + i}/download',
+        'titulo': f'Relatório #{100000 + i}',
+        'erro': None
+    }
+
+
+def _memoria_por_item(fabrica, n: int) -> float:
+    """Bytes alocados (tracemalloc) que continuam vivos por item criado"""
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    itens = [fabrica(i) for i in range(n)]
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del itens
+    return (depois - antes) / n
+
+
+def benchmark_memoria(trabalhos: int = 5000, tamanho_html: int = 60000) -> dict:
+    """Memória por trabalho: dicionários anteriores x registros de registros.py
+
+    `resultado` é o que fica em resultados_geracao (st.session_state) por
+    curso × período; `submissao` é o retorno de submeter_formulario, que
+    antes guardava o HTML da resposta (`tamanho_html` caracteres). A
+    submissão só vive enquanto o trabalho está em andamento: pesa por
+    trabalho em voo, e o total só se aplica se ela for retida.
+    """
+    def resultado_legado(i):
+        return {
+            'success': True,
+            'relatorio_id': str(100000 + i),
+            'caminho_arquivo': f'relatorios/Curso_{i % 300:03d}_{10000 + i % 300}_{2013 + i % 13}{1 + i % 2}.xlsx',
+            'status_info': _status_sintetico(i),
+            'curso': f'Curso {i % 300:03d}',
+            'periodo': f'{2013 + i % 13}{1 + i % 2}'
+        }
+
+    def resultado_registro(i):
+        return ResultadoRelatorio(
+            True, f'Curso {i % 300:03d}', f'{2013 + i % 13}{1 + i % 2}',
+            relatorio_id=str(100000 + i),
+            caminho_arquivo=f'relatorios/Curso_{i % 300:03d}_{10000 + i % 300}_{2013 + i % 13}{1 + i % 2}.xlsx',
+            status_info=StatusRelatorio(**_status_sintetico(i)).resumo()
+        )
+
+    def pagina(i):
+        return f'<!-- relatório {i} -->'.ljust(tamanho_html, ' ')
+
+    def submissao_legado(i):
+        url = f'https://app.uff.br/graduacao/administracaoacademica/relatorios/{100000 + i}'
+        return {'success': True, 'relatorio_id': str(100000 + i), 'url_relatorio': url, 'html': pagina(i)}
+
+    def submissao_registro(i):
+        url = f'https://app.uff.br/graduacao/administracaoacademica/relatorios/{100000 + i}'
+        pagina(i)  # a resposta existe durante a submissão, mas não é guardada
+        return SubmissaoFormulario(True, str(100000 + i), url)
+
+    medicoes = {}
+    for nome, legado, registro in (('resultado', resultado_legado, resultado_registro),
+                                   ('submissao', submissao_legado, submissao_registro)):
+        bytes_legado = _memoria_por_item(legado, trabalhos)
+        bytes_registro = _memoria_por_item(registro, trabalhos)
+        medicoes[nome] = {
+            'legado_bytes': round(bytes_legado),
+            'registro_bytes': round(bytes_registro),
+            'reducao': round(bytes_legado / bytes_registro, 1) if bytes_registro else None,
+            'legado_total_mb': round(bytes_legado * trabalhos / (1024 * 1024), 2),
+            'registro_total_mb': round(bytes_registro * trabalhos / (1024 * 1024), 2)
+        }
+    return {'trabalhos': trabalhos, 'tamanho_html': tamanho_html, 'medicoes': medicoes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do processamento de relatórios")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    parser_escrita = subparsers.add_parser('escrita', help="Escrita da planilha consolidada")
+    parser_escrita.add_argument('--linhas', type=int, default=10000)
+
+    parser_suite = subparsers.add_parser('suite', help="Etapas do processamento sobre relatórios sintéticos")
+    parser_suite.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS_PADRAO)
+    parser_suite.add_argument('--relatorios', type=int, default=6, help="Relatórios por consolidação")
+    parser_suite.add_argument('--repeticoes', type=int, default=1)
+    parser_suite.add_argument('--pasta-dados', default=None, help="Pasta para reaproveitar os relatórios sintéticos")
+    parser_suite.add_argument('--saida', default=None, help="Arquivo JSON com os resultados")
+    
+    parser_importacao = subparsers.add_parser('importacao', help="Tempo de importação x orçamento (-X importtime)")
+    parser_importacao.add_argument('--repeticoes', type=int, default=3)
+
+    parser_concorrencia = subparsers.add_parser('concorrencia', help="Limites fixos x AIMD contra um portal simulado")
+    parser_concorrencia.add_argument('--threads', type=int, default=24)
+    parser_concorrencia.add_argument('--requisicoes', type=int, default=600)
+    parser_concorrencia.add_argument('--capacidade', type=int, default=6,
+                                     help="Requisições simultâneas que o portal simulado atende sem degradar")
+
+    parser_memoria = subparsers.add_parser('memoria', help="Memória por trabalho: dicionários x registros")
+    parser_memoria.add_argument('--trabalhos', type=int, default=5000)
+    parser_memoria.add_argument('--tamanho-html', type=int, default=60000,
+                                help="Caracteres da página devolvida pela submissão do formulário")
+
+    args = parser.parse_args()
+    if args.comando == 'memoria':
+        resultado = benchmark_memoria(args.trabalhos, args.tamanho_html)
+        for nome, medicao in resultado['medicoes'].items():
+            print(f"{nome:<10} legado {medicao['legado_bytes']:>7} B/trabalho ({medicao['legado_total_mb']}MB)  "
+                  f"registro {medicao['registro_bytes']:>6} B/trabalho ({medicao['registro_total_mb']}MB)  "
+                  f"{medicao['reducao']}x")
+    elif args.comando == 'concorrencia':
+        for medicao in benchmark_concorrencia(args.threads, args.requisicoes, args.capacidade):
+            nome = 'AIMD' if medicao['adaptativo'] else f"fixo {medicao['threads']}"
+            limite = f", limite final {medicao['limite_final']}" if medicao['limite_final'] else ''
+            print(f"{nome:<9} {medicao['vazao_req_s']:>7.1f} req/s  erros {medicao['taxa_erro']:.1%}  "
+                  f"p95 {medicao['p95_ms']}ms  pico no servidor {medicao['pico_servidor']}{limite}")
+    elif args.comando == 'suite':
+        resultado = benchmark_processamento(args.tamanhos, args.relatorios, args.repeticoes, args.pasta_dados)
+        for medicao in resultado['medicoes']:
+            tempos = ', '.join(f"{etapa} {tempo}s" for etapa, tempo in medicao['tempos_s'].items())
+            print(f"{medicao['linhas']} linhas: {tempos}")
+        saida = args.saida or f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        salvar_json(resultado, saida)
+        print(f"Resultados salvos em: {saida}")
+    elif args.comando == 'importacao':
+        resultados = verificar_orcamento_importacao(repeticoes=args.repeticoes)
+        for medicao in resultados:
+            situacao = 'ok' if medicao['ok'] else 'ESTOURO'
+            tardias = f" (carrega {', '.join(medicao['tardias_carregadas'])})" if medicao['tardias_carregadas'] else ''
+            print(f"{medicao['modulo']:<22} {medicao['acrescimo_ms']:>7.1f}ms / {medicao['orcamento_ms']}ms "
+                  f"(+ requests {medicao['base_ms']:.1f}ms)  {situacao}{tardias}")
+        sys.exit(0 if all(medicao['ok'] for medicao in resultados) else 1)
+    elif args.comando == 'escrita':
+        resultado = benchmark_escrita(args.linhas)
+        print(f"DETALHES com {resultado['linhas']} linhas: "
+              f"legado {resultado['legado_s']}s, vetorizado {resultado['vetorizado_s']}s "
+              f"({resultado['aceleracao']}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+cache_interface.py - Cache da interface Streamlit (formulário, consolidação, prévias e downloads)
+
+Os reruns do Streamlit reexecutam o script inteiro; estas funções evitam
+repetir acessos ao portal, leituras de planilhas e aberturas de arquivos
+quando nada mudou. As chaves combinam o usuário e a assinatura/hash dos
+arquivos envolvidos, de modo que um arquivo regravado invalida o cache.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import streamlit as st
+
+from config import (
+    CACHE_MAX_ARQUIVOS, CACHE_MAX_BYTES_ARQUIVO, CACHE_MAX_HASHES, CACHE_MAX_PROCESSAMENTOS, CACHE_TTL_FORMULARIO
+)
+from gestor_disco import caminho_disponivel
+
+logger = logging.getLogger(__name__)
+
+
+class CacheLRU:
+    """Dicionário limitado a `maximo` entradas; descarta a usada há mais tempo"""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            if chave not in self._itens:
+                return padrao
+            self._itens.move_to_end(chave)
+            return self._itens[chave]
+
+    def __setitem__(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+
+# Vive enquanto o processo do servidor viver: precisa de limite
+_hashes = CacheLRU(CACHE_MAX_HASHES)
+
+
+def assinatura_arquivo(caminho: str) -> Optional[Tuple]:
+    """(caminho, tamanho, mtime) - barata, obtida com um único stat"""
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    return (os.path.abspath(caminho), info.st_size, info.st_mtime_ns)
+
+
+def hash_arquivo(caminho: str) -> Optional[str]:
+    """SHA-256 do conteúdo, recalculado apenas quando a assinatura muda"""
+    caminho = caminho_disponivel(caminho)
+    if caminho is None:
+        return None
+    assinatura = assinatura_arquivo(caminho)
+    if assinatura is None:
+        return None
+    digest = _hashes.get(assinatura)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    digest = sha.hexdigest()
+    _hashes[assinatura] = digest
+    return digest
+
+
+def hash_resultados(resultados_geracao: Dict) -> str:
+    """Hash combinado dos relatórios baixados com sucesso (curso, período e conteúdo)"""
+    sha = hashlib.sha256()
+    for curso in sorted(resultados_geracao):
+        for resultado in resultados_geracao[curso]:
+            if resultado.get('success') and resultado.get('caminho_arquivo'):
+                sha.update(f"{curso}|{resultado.get('periodo')}|".encode('utf-8'))
+                sha.update((hash_arquivo(resultado['caminho_arquivo']) or '').encode('utf-8'))
+    return sha.hexdigest()
+
+
+@st.cache_data(ttl=CACHE_TTL_FORMULARIO, show_spinner=False)
+def _form_params_usuario(usuario: str, _extrator, _session) -> Dict:
+    form_params = _extrator(_session)
+    if form_params is None:
+        # Exceção impede que a falha fique em cache
+        raise ValueError("Parâmetros do formulário indisponíveis")
+    # O token CSRF pertence à sessão que fez a requisição; não é compartilhado
+    return {chave: valor for chave, valor in form_params.items() if chave != 'csrf_token'}
+
+
+def obter_form_params(usuario: str, extrator, session) -> Optional[Dict]:
+    """Opções do formulário de listagem, extraídas uma vez por usuário a cada CACHE_TTL_FORMULARIO"""
+    try:
+        return _form_params_usuario(usuario, extrator, session)
+    except ValueError:
+        return None
+
+
+@st.cache_resource
+def _processamentos() -> CacheLRU:
+    # Compartilhado entre as sessões; cada entrada guarda o resultado inteiro do processamento
+    return CacheLRU(CACHE_MAX_PROCESSAMENTOS)
+
+
+def processamento_em_cache(usuario: str, chave: str) -> Optional[Dict]:
+    """Resultado de processar_lote já calculado para os mesmos relatórios (arquivos ainda existentes)"""
+    resultado = _processamentos().get((usuario, chave))
+    if resultado and caminho_disponivel(resultado['caminho_planilha']):
+        return resultado
+    return None
+
+
+def guardar_processamento(usuario: str, chave: str, resultado: Dict):
+    _processamentos()[(usuario, chave)] = resultado
+
+
+@st.cache_data(max_entries=CACHE_MAX_ARQUIVOS, show_spinner=False)
+def _previa_planilha(caminho: str, assinatura: Tuple, aba: str):
+    import pandas as pd
+    
+    with pd.ExcelFile(caminho) as xls:
+        return xls.sheet_names, pd.read_excel(xls, sheet_name=aba)
+
+
+def previa_planilha(caminho: str, aba: str = 'RESUMO GERAL'):
+    """Nomes das abas e DataFrame de `aba`, lidos uma vez por versão do arquivo"""
+    return _previa_planilha(caminho, assinatura_arquivo(caminho), aba)
+
+
+@st.cache_data(max_entries=CACHE_MAX_ARQUIVOS, show_spinner=False)
+def _bytes_arquivo(caminho: str, assinatura: Tuple) -> bytes:
+    with open(caminho, 'rb') as f:
+        return f.read()
+
+
+def arquivo_grande(caminho: str) -> bool:
+    """Acima de CACHE_MAX_BYTES_ARQUIVO: o conteúdo só é lido quando o download é pedido"""
+    assinatura = assinatura_arquivo(caminho)
+    return assinatura is not None and assinatura[1] > CACHE_MAX_BYTES_ARQUIVO
+
+
+def bytes_arquivo(caminho: str) -> bytes:
+    """Conteúdo do arquivo para st.download_button, lido uma vez por versão do arquivo
+
+    Arquivos grandes (ex.: a exportação de alunos) são lidos sem cache, para
+    não ficarem na memória do servidor.
+    """
+    if arquivo_grande(caminho):
+        with open(caminho, 'rb') as f:
+            return f.read()
+    return _bytes_arquivo(caminho, assinatura_arquivo(caminho))
@@ -0,0 +1,305 @@
+"""
+cassete_http.py - Gravação e reprodução das requisições HTTP de uma execução
+
+Reproduzir uma execução lenta ou com erro exigia o portal real e as
+credenciais. No modo de gravação, cada par requisição/resposta das sessões
+(login do UFFAuthenticator e sessões por thread do PoolSessoes) é gravado
+em um arquivo JSON-lines, uma interação por linha, com as credenciais
+removidas: cabeçalhos Cookie/Set-Cookie/Authorization/X-CSRF-Token, campos
+sensíveis de formulário e de query string (CAMPOS_SENSIVEIS_CASSETE),
+tokens em <input>/<meta> e os literais informados (usuário e senha).
+Relatórios XLSX são gravados como estão e contêm dados de alunos: o
+cassete não deve sair do ambiente em que os relatórios já ficam.
+
+No modo de reprodução, as mesmas requisições são respondidas a partir do
+cassete, na ordem gravada para cada método + URL (+ Range e corpo), sem
+rede, esperando a latência original multiplicada por `escala_tempo`
+(0 = sem espera). Erros de conexão gravados são levantados de novo.
+"""
+import base64
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from io import BytesIO
+from typing import Dict, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from config import CABECALHOS_SENSIVEIS_CASSETE, CAMPOS_SENSIVEIS_CASSETE, ESCALA_TEMPO_CASSETE
+
+logger = logging.getLogger(__name__)
+
+OCULTO = '***'
+_TIPOS_TEXTO = ('text/', 'json', 'xml', 'javascript')
+_CAMPO_SENSIVEL = re.compile('|'.join(re.escape(c) for c in CAMPOS_SENSIVEIS_CASSETE), re.IGNORECASE)
+_PARAMETRO_SENSIVEL = re.compile(
+    r'(\b(?:%s)=)[^&"\'\s<>]+' % '|'.join(re.escape(c) for c in CAMPOS_SENSIVEIS_CASSETE), re.IGNORECASE
+)
+_TAG_CAMPO = re.compile(r'<(?:input|meta)\b[^>]*>', re.IGNORECASE)
+_ATRIBUTO_NOME = re.compile(r'\bname\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+_ATRIBUTO_VALOR = re.compile(r'(\b(?:value|content)\s*=\s*)(["\'])[^"\']*\2', re.IGNORECASE)
+
+
+class Redator:
+    """Remove credenciais de URLs, cabeçalhos e corpos antes de gravar"""
+
+    def __init__(self, segredos: Iterable[str] = ()):
+        self.segredos = [s for s in segredos if s]
+
+    def texto(self, texto: str) -> str:
+        for segredo in self.segredos:
+            texto = texto.replace(segredo, OCULTO)
+        texto = _PARAMETRO_SENSIVEL.sub(lambda m: m.group(1) + OCULTO, texto)
+        return _TAG_CAMPO.sub(self._tag, texto)
+
+    @staticmethod
+    def _tag(correspondencia) -> str:
+        tag = correspondencia.group(0)
+        nome = _ATRIBUTO_NOME.search(tag)
+        if nome and _CAMPO_SENSIVEL.search(nome.group(1)):
+            return _ATRIBUTO_VALOR.sub(lambda m: f"{m.group(1)}{m.group(2)}{OCULTO}{m.group(2)}", tag)
+        return tag
+
+    def url(self, url: str) -> str:
+        partes = urlsplit(url)
+        query = urlencode([(chave, OCULTO if _CAMPO_SENSIVEL.search(chave) else self.texto(valor))
+                           for chave, valor in parse_qsl(partes.query, keep_blank_values=True)])
+        return urlunsplit(partes._replace(query=query))
+
+    def cabecalhos(self, cabecalhos) -> Dict[str, str]:
+        sensiveis = {c.lower() for c in CABECALHOS_SENSIVEIS_CASSETE}
+        return {nome: OCULTO if nome.lower() in sensiveis else self.texto(str(valor))
+                for nome, valor in cabecalhos.items()}
+
+    def corpo_requisicao(self, corpo, tipo: str) -> Optional[str]:
+        """Formulários com os campos sensíveis ocultos; outros corpos viram um resumo sha256"""
+        if not corpo:
+            return None
+        if isinstance(corpo, bytes):
+            try:
+                corpo = corpo.decode('utf-8')
+            except UnicodeDecodeError:
+                return 'sha256:' + hashlib.sha256(corpo).hexdigest()
+        if not isinstance(corpo, str):
+            return None  # corpo em stream (arquivo/gerador): não é gravado
+        if 'x-www-form-urlencoded' in (tipo or ''):
+            return urlencode(sorted(
+                (chave, OCULTO if _CAMPO_SENSIVEL.search(chave) else self.texto(valor))
+                for chave, valor in parse_qsl(corpo, keep_blank_values=True)
+            ))
+        return 'sha256:' + hashlib.sha256(self.texto(corpo).encode('utf-8')).hexdigest()
+
+
+def _chave(metodo: str, url: str, faixa: Optional[str], corpo: Optional[str]) -> str:
+    return f"{metodo} {url} {faixa or ''} {corpo or ''}"
+
+
+def _chave_requisicao(request, redator: Redator) -> str:
+    return _chave(
+        request.method,
+        redator.url(request.url),
+        request.headers.get('Range'),
+        redator.corpo_requisicao(request.body, request.headers.get('Content-Type'))
+    )
+
+
+class GravadorCassete:
+    """Grava as interações em JSON-lines, uma linha por requisição (sobrescreve o arquivo)"""
+
+    def __init__(self, caminho: str, segredos: Iterable[str] = ()):
+        self.caminho = caminho
+        self.redator = Redator(segredos)
+        self._lock = threading.Lock()
+        self._arquivo = open(caminho, 'w', encoding='utf-8')
+        self._inicio = time.monotonic()
+        self._sequencia = 0
+
+    def registrar(self, request, response=None, erro: Optional[BaseException] = None, latencia: float = 0.0):
+        interacao = {
+            'chave': _chave_requisicao(request, self.redator),
+            'metodo': request.method,
+            'url': self.redator.url(request.url),
+            'cabecalhos_requisicao': self.redator.cabecalhos(request.headers),
+            'latencia': round(latencia, 4)
+        }
+        if erro is not None:
+            interacao['erro'] = type(erro).__name__
+            interacao['mensagem'] = self.redator.texto(str(erro))
+        else:
+            tipo = response.headers.get('Content-Type', '')
+            interacao.update(
+                status=response.status_code,
+                motivo=response.reason,
+                cabecalhos=self.redator.cabecalhos(response.headers),
+                url_final=self.redator.url(response.url)
+            )
+            if any(t in tipo for t in _TIPOS_TEXTO):
+                interacao['texto'] = self.redator.texto(response.content.decode(response.encoding or 'utf-8',
+                                                                                errors='replace'))
+            else:
+                interacao['base64'] = base64.b64encode(response.content).decode('ascii')
+
+        with self._lock:
+            interacao['sequencia'] = self._sequencia
+            interacao['instante'] = round(time.monotonic() - self._inicio, 4)
+            self._sequencia += 1
+            # Uma linha por vez e flush: uma execução interrompida deixa o cassete utilizável
+            self._arquivo.write(json.dumps(interacao, ensure_ascii=False) + '\n')
+            self._arquivo.flush()
+
+    def fechar(self):
+        with self._lock:
+            self._arquivo.close()
+
+
+class ReprodutorCassete:
+    """Responde às requisições com as interações gravadas"""
+
+    def __init__(self, caminho: str, escala_tempo: float = ESCALA_TEMPO_CASSETE):
+        self.caminho = caminho
+        self.escala_tempo = escala_tempo
+        self.redator = Redator()
+        self.nao_gravadas = 0
+        self._lock = threading.Lock()
+        self._interacoes: Dict[str, deque] = {}
+        self._completas: Dict[str, Dict] = {}  # URL -> GET 200 sem Range (para servir faixas)
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                if not linha.strip():
+                    continue
+                interacao = json.loads(linha)
+                self._interacoes.setdefault(interacao['chave'], deque()).append(interacao)
+                if interacao['metodo'] == 'GET' and interacao.get('status') == 200 \
+                        and 'Range' not in interacao['cabecalhos_requisicao']:
+                    self._completas.setdefault(interacao['url'], interacao)
+        logger.info(f"Cassete {caminho}: {sum(len(f) for f in self._interacoes.values())} interações")
+
+    def _proxima(self, request) -> Optional[Dict]:
+        """Próxima interação gravada da chave; a última se repete (ex.: mais verificações de status)"""
+        chave = _chave_requisicao(request, self.redator)
+        with self._lock:
+            fila = self._interacoes.get(chave)
+            if fila:
+                return fila.popleft() if len(fila) > 1 else fila[0]
+            faixa = request.headers.get('Range')
+            completa = self._completas.get(self.redator.url(request.url))
+            if faixa and completa:
+                return self._recortar(completa, faixa)
+            self.nao_gravadas += 1
+        return None
+
+    @staticmethod
+    def _recortar(interacao: Dict, faixa: str) -> Optional[Dict]:
+        """Resposta 206 a partir do corpo completo gravado (Range pedido com outros segmentos)"""
+        correspondencia = re.match(r'bytes=(\d+)-(\d*)$', faixa)
+        if not correspondencia:
+            return None
+        corpo = base64.b64decode(interacao['base64']) if 'base64' in interacao \
+            else interacao['texto'].encode('utf-8')
+        inicio = int(correspondencia.group(1))
+        fim = min(int(correspondencia.group(2) or len(corpo) - 1), len(corpo) - 1)
+        cabecalhos = dict(interacao['cabecalhos'], **{
+            'Content-Range': f"bytes {inicio}-{fim}/{len(corpo)}",
+            'Content-Length': str(fim - inicio + 1)
+        })
+        cabecalhos.pop('Content-Encoding', None)
+        return dict(interacao, status=206, motivo='Partial Content', cabecalhos=cabecalhos,
+                    base64=base64.b64encode(corpo[inicio:fim + 1]).decode('ascii'), texto=None)
+
+    def responder(self, request):
+        interacao = self._proxima(request)
+        if interacao is None:
+            raise requests.ConnectionError(f"Requisição não gravada no cassete: {request.method} {request.url}",
+                                           request=request)
+        if self.escala_tempo:
+            time.sleep(interacao['latencia'] * self.escala_tempo)
+        if 'erro' in interacao:
+            classe = getattr(requests.exceptions, interacao['erro'], requests.ConnectionError)
+            raise classe(interacao['mensagem'], request=request)
+
+        if interacao.get('base64') is not None:
+            corpo = base64.b64decode(interacao['base64'])
+        else:
+            corpo = (interacao.get('texto') or '').encode('utf-8')
+        cabecalhos = CaseInsensitiveDict(interacao['cabecalhos'])
+        cabecalhos.pop('Content-Encoding', None)  # o corpo gravado já está decodificado
+        cabecalhos['Content-Length'] = str(len(corpo))
+
+        response = requests.Response()
+        response.status_code = interacao['status']
+        response.reason = interacao.get('motivo')
+        response.headers = cabecalhos
+        response.encoding = get_encoding_from_headers(cabecalhos) or 'utf-8'
+        response.raw = BytesIO(corpo)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=interacao['latencia'])
+        return response
+
+
+class AdaptadorGravacao(BaseAdapter):
+    """Envia pelo adaptador original da sessão e grava cada interação"""
+
+    def __init__(self, interno: BaseAdapter, gravador: GravadorCassete):
+        super().__init__()
+        self.interno = interno
+        self.gravador = gravador
+
+    def send(self, request, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            response = self.interno.send(request, **kwargs)
+            response.content  # lê o corpo (inclusive em stream) para gravá-lo
+        except Exception as e:
+            self.gravador.registrar(request, erro=e, latencia=time.perf_counter() - inicio)
+            raise
+        self.gravador.registrar(request, response, latencia=time.perf_counter() - inicio)
+        return response
+
+    def close(self):
+        self.interno.close()
+
+
+class AdaptadorReproducao(BaseAdapter):
+    """Responde pelo cassete, sem rede"""
+
+    def __init__(self, reprodutor: ReprodutorCassete):
+        super().__init__()
+        self.reprodutor = reprodutor
+
+    def send(self, request, **kwargs):
+        return self.reprodutor.responder(request)
+
+    def close(self):
+        pass
+
+
+# Cassete do processo (None: requisições vão para a rede normalmente)
+_cassete = None
+
+
+def ativar_cassete(cassete):
+    """Ativa um GravadorCassete ou ReprodutorCassete para as sessões criadas a partir de agora"""
+    global _cassete
+    _cassete = cassete
+
+
+def montar_cassete(session: requests.Session) -> requests.Session:
+    """Monta o adaptador do cassete ativo na sessão (por cima dos já montados, na gravação)"""
+    if isinstance(_cassete, GravadorCassete):
+        for prefixo in ('https://', 'http://'):
+            session.mount(prefixo, AdaptadorGravacao(session.get_adapter(prefixo), _cassete))
+    elif isinstance(_cassete, ReprodutorCassete):
+        adaptador = AdaptadorReproducao(_cassete)
+        for prefixo in ('https://', 'http://'):
+            session.mount(prefixo, adaptador)
+    return session
@@ -45,6 +45,18 @@ CURSOS = {
     }
 }
 
+# Descoberta de todos os cursos (executar_lote.py --descobrir-cursos)
+BUSCAR_CURSOS_URL = f"{RELATORIOS_URL}/buscar_cursos"  # AJAX do formulário: cursos de uma localidade
+BUSCAR_DESDOBRAMENTOS_URL = f"{RELATORIOS_URL}/buscar_desdobramentos"  # AJAX: desdobramentos de um curso
+ARQUIVO_CATALOGO_CURSOS = 'relatorios/catalogo_cursos.json'
+VALIDADE_CATALOGO_HORAS = 7 * 24  # cursos e desdobramentos mudam raramente
+CONCORRENCIA_DESCOBERTA = 4  # consultas AJAX simultâneas durante a descoberta
+TENTATIVAS_DESCOBERTA = 3  # tentativas de cada consulta AJAX antes de registrar a falha
+ESPERA_DESCOBERTA = 1.0  # segundos antes da 2ª tentativa (dobra a cada nova tentativa)
+
+# Agendador de lotes grandes: relatórios em andamento no portal (inicial, máximo)
+CONCORRENCIA_AGENDADOR = (4, 16)
+
 # Formas de ingresso
 FORMAS_INGRESSO = {
     '1': 'SISU 1ª Edição',
@@ -67,6 +79,97 @@ TIMEOUT_REQUESTS = 30
 TIMEOUT_PROCESSAMENTO = 3600  # 1 hora
 INTERVALO_VERIFICACAO = 30  # segundos
 
+# Detecção antecipada de falhas durante o monitoramento
+MAX_ERROS_CONSECUTIVOS_STATUS = 5  # verificações de status com erro seguidas antes de desistir
+TENTATIVAS_RESSUBMISSAO = 1  # novas submissões de um relatório que falhou no servidor
+TENTATIVAS_REAUTENTICACAO = 2  # renovações de login por relatório (contadas à parte das falhas)
+CLASSES_ETAPA_FALHA = ('error', 'failed', 'danger')  # classes CSS de etapa com falha
+TERMOS_FALHA_RELATORIO = ('erro', 'falha', 'falhou', 'cancelado')  # situação do pedido
+
+# Limite adaptativo (AIMD) de requisições simultâneas por classe: (inicial, mínimo, máximo)
+LIMITES_AIMD = {
+    'submissao': (1, 1, 4),
+    'polling': (4, 1, 32),
+    'download': (2, 1, 8),
+    'outros': (4, 1, 16)
+}
+FATOR_REDUCAO_AIMD = 0.5  # multiplicador do limite após erro ou resposta lenta
+FATOR_LATENCIA_AIMD = 3.0  # resposta "lenta": acima deste múltiplo da latência de base
+
+# Download dos relatórios
+TENTATIVAS_DOWNLOAD = 3  # retomadas (Range) após uma conexão interrompida
+SEGMENTOS_DOWNLOAD = 4  # conexões paralelas quando o servidor aceita Range
+THREADS_SEGMENTOS = 8  # threads do pool de segmentos, compartilhado por todos os downloads
+LIMIAR_DOWNLOAD_PARALELO = 8 * 1024 * 1024  # bytes a partir dos quais o download é segmentado
+TAMANHO_BLOCO_DOWNLOAD = 64 * 1024
+
+# Cassete HTTP (gravação/reprodução de execuções, ver cassete_http.py)
+# Campos de formulário e de query string cujo valor nunca é gravado
+CAMPOS_SENSIVEIS_CASSETE = ('username', 'password', 'senha', 'usuario', 'cpf', 'token', 'csrf',
+                            'authenticity_token', 'session_code', 'code')
+CABECALHOS_SENSIVEIS_CASSETE = ('Cookie', 'Set-Cookie', 'Authorization', 'X-CSRF-Token')
+ESCALA_TEMPO_CASSETE = 0.0  # na reprodução: 0 = sem espera, 1 = latências originais
+
 # Caminhos de arquivos
 PASTA_RELATORIOS = 'relatorios'
+BANCO_ANALITICO = f'{PASTA_RELATORIOS}/relatorios.sqlite3'
 LOG_FILE = 'relatorios_uff.log'
+
+# Arquivo JSON-lines com os spans de tempo de cada etapa (None desativa)
+ARQUIVO_RASTREAMENTO = None
+
+# Porta local do endpoint de métricas (/metrics e /metrics.json; None desativa)
+PORTA_METRICAS = 9464
+# A interface Streamlit só abre o endpoint se habilitado (o CLI usa --porta-metricas)
+METRICAS_NA_INTERFACE = False
+
+# Requisições HTTP mantidas no buffer circular de instrumentação
+TAMANHO_BUFFER_HTTP = 5000
+
+# Execução de lotes em segundo plano
+MAX_TAREFAS_SIMULTANEAS = 4  # lotes de usuários diferentes em paralelo
+RETENCAO_TAREFAS = 6 * 3600  # segundos que uma tarefa finalizada fica disponível
+INTERVALO_ATUALIZACAO_UI = 2  # segundos entre consultas de progresso na interface
+
+# Cache da interface Streamlit
+CACHE_TTL_FORMULARIO = 12 * 3600  # segundos até reextrair as opções do formulário
+CACHE_MAX_ARQUIVOS = 32  # prévias e conteúdos de download mantidos em memória
+CACHE_MAX_BYTES_ARQUIVO = 20 * 1024 * 1024  # downloads maiores não ficam em cache nem são lidos a cada rerun
+CACHE_MAX_PROCESSAMENTOS = 16  # resultados de processar_lote mantidos (LRU, todos os usuários)
+CACHE_MAX_HASHES = 4096  # hashes de conteúdo de arquivos mantidos (LRU)
+
+# Planejador de consultas agrupadas
+LIMITE_LINHAS_CONSULTA = 20000  # acima disso a consulta é dividida em consultas mais estreitas
+COBERTURA_MINIMA_PARTICAO = 0.95  # fração das linhas da consulta ampla que as partes devem conter
+LINHAS_ESTIMADAS_POR_RELATORIO = 150  # estimativa de um curso × período sem histórico local
+PRIMEIRO_PERIODO_PORTAL = '20001'  # coorte mais antiga que uma consulta sem período pode trazer
+
+# Política de atualização: prazo de validade dos relatórios por idade da coorte
+ARQUIVO_CACHE_RELATORIOS = f'{PASTA_RELATORIOS}/cache_relatorios.json'
+ORCAMENTO_FRESCOR = [  # (idade máxima da coorte em semestres, validade em horas)
+    (2, 12),
+    (6, 24),
+    (10, 7 * 24),
+    (14, 30 * 24)
+]
+VALIDADE_COORTES_ANTIGAS_HORAS = 180 * 24  # coortes com mais de 14 semestres (praticamente encerradas)
+
+# Orçamento de disco da pasta de relatórios
+ARQUIVO_INDICE_DISCO = f'{PASTA_RELATORIOS}/indice_disco.json'
+SUFIXO_MANIFESTO = '_resultados.json'  # manifesto do CLI: <base>.xlsx e <base>_alunos.* são saídas, não relatórios
+ORCAMENTO_DISCO_MB = 2048  # acima disso os relatórios substituídos/menos usados são removidos
+ESPACO_LIVRE_MINIMO_MB = 500  # também remove relatórios se o disco ficar abaixo disso
+PROTECAO_ACESSO_RECENTE = 6 * 3600  # segundos em que um relatório usado não é removido
+COMPRIMIR_RELATORIOS_APOS_DIAS = 30  # relatórios sem uso comprimidos com zstd (None desativa)
+
+# Orçamento de importação (ms, python -X importtime) dos módulos do caminho de login/CLI,
+# descontado o import de requests (o que o módulo acrescenta por conta própria)
+ORCAMENTO_IMPORTACAO_MS = {
+    'auth': 75,
+    'formulario_handler': 75,
+    'relatorio_automator': 75,
+    'gerador_relatorios': 125,
+    'executor_tarefas': 50
+}
+# Bibliotecas que esses módulos só devem carregar no primeiro uso
+IMPORTACOES_TARDIAS = ('pandas', 'numpy', 'bs4', 'openpyxl', 'xlsxwriter')
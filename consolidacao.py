@@ -0,0 +1,329 @@
+"""
+consolidacao.py - Motor de consolidação em formato longo dos relatórios
+
+Todas as contagens ficam em uma única tabela (curso, periodo, dimensao,
+categoria, quantidade); as abas da planilha e os percentuais são derivados
+dela com operações vetorizadas de groupby/pivot_table.
+"""
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+COLUNAS_CONTAGEM = ['curso', 'periodo', 'dimensao', 'categoria', 'quantidade']
+
+# Dimensões da tabela longa
+DIMENSAO_TOTAL = 'total'
+DIMENSAO_SITUACAO = 'situacao'
+DIMENSAO_CANCELAMENTO = 'cancelamento'
+DIMENSAO_MODALIDADE = 'modalidade'
+
+CATEGORIA_TOTAL = 'Total Registros'
+
+# Mapeamento de situações (trecho da coluna SITUAÇÃO -> categoria)
+SITUACOES_NORMALIZADAS = {
+    'Inscrito': 'Inscritos/Pendentes/Concluintes',
+    'Concluinte': 'Inscritos/Pendentes/Concluintes',
+    'Pendente': 'Inscritos/Pendentes/Concluintes',
+    'Trancado': 'Trancados',
+    'Formando': 'Formados',
+    'Formado': 'Formados',
+    'Permanência de Vínculo': 'Formados'
+}
+CATEGORIAS_SITUACAO = ['Inscritos/Pendentes/Concluintes', 'Trancados', 'Formados']
+CATEGORIAS_ATIVAS = ['Inscritos/Pendentes/Concluintes', 'Trancados']
+CATEGORIA_FORMADOS = 'Formados'
+
+# Padrões de motivos de cancelamento (o primeiro que casar vence)
+PADROES_CANCELAMENTO = {
+    'Solicitação Oficial': ['solicitação oficial', 'pedido'],
+    'Abandono': ['abandono', 'desistência'],
+    'Insuficiência de Aproveitamento': ['insuficiência de aproveitamento', 'reprovação'],
+    'Ingressante - Insuf. Aproveit.': ['ingressante', 'calouro'],
+    'Mudança de Curso': ['mudança de curso', 'transferência']
+}
+CATEGORIA_OUTROS = 'Outros'
+CATEGORIAS_CANCELAMENTO = list(PADROES_CANCELAMENTO) + [CATEGORIA_OUTROS]
+
+# Modalidades de ingresso pelo prefixo do código
+PREFIXOS_MODALIDADE = {
+    'Ampla Concorrência': 'A',
+    'Ações Afirmativas': 'L'
+}
+
+
+def formatar_periodo(periodos: pd.Series) -> pd.Series:
+    """Converte períodos '20251' para o formato de exibição '2025/1'"""
+    periodos = periodos.astype(str)
+    return periodos.str[:4] + '/' + periodos.str[4:]
+
+
+def classificar_motivos(motivos: pd.Index) -> np.ndarray:
+    """Classifica textos de motivo de cancelamento nas categorias conhecidas"""
+    minusculos = pd.Series(motivos, dtype=object).astype(str).str.lower()
+    condicoes = []
+    for padroes in PADROES_CANCELAMENTO.values():
+        mascara = np.zeros(len(minusculos), dtype=bool)
+        for padrao in padroes:
+            mascara |= minusculos.str.contains(padrao, regex=False).to_numpy(dtype=bool)
+        condicoes.append(mascara)
+    return np.select(condicoes, list(PADROES_CANCELAMENTO), default=CATEGORIA_OUTROS)
+
+
+def normalizar_situacoes(situacoes: pd.Series) -> pd.Series:
+    """Categoria normalizada de cada situação (primeiro padrão que casar, '' se nenhum)"""
+    distintas = pd.Index(situacoes.dropna().astype(str).unique())
+    if len(distintas) == 0:
+        return pd.Series('', index=situacoes.index, dtype=object)
+    condicoes = [distintas.str.contains(padrao, case=False, regex=False) for padrao in SITUACOES_NORMALIZADAS]
+    categorias = np.select(condicoes, list(SITUACOES_NORMALIZADAS.values()), default='')
+    return situacoes.astype(object).map(dict(zip(distintas, categorias))).fillna('')
+
+
+def contar_relatorio(df: pd.DataFrame, curso: str, periodo: str) -> pd.DataFrame:
+    """Reduz um relatório baixado às contagens em formato longo"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=COLUNAS_CONTAGEM)
+
+    linhas = [(DIMENSAO_TOTAL, CATEGORIA_TOTAL, len(df))]
+
+    # Situações: casar os padrões uma vez por valor distinto, ponderando pela contagem
+    if 'SITUAÇÃO' in df.columns:
+        contagem = df['SITUAÇÃO'].fillna('Desconhecido').astype(str).value_counts()
+        por_categoria = dict.fromkeys(CATEGORIAS_SITUACAO, 0)
+        for padrao, categoria in SITUACOES_NORMALIZADAS.items():
+            mascara = contagem.index.str.contains(padrao, case=False, regex=False)
+            por_categoria[categoria] += int(contagem[mascara].sum())
+        linhas.extend(
+            (DIMENSAO_SITUACAO, categoria, quantidade)
+            for categoria, quantidade in por_categoria.items() if quantidade > 0
+        )
+
+    # Cancelamentos: todas as categorias, inclusive as zeradas
+    if 'MOTIVO DO CANCELAMENTO' in df.columns:
+        motivos = df['MOTIVO DO CANCELAMENTO'].fillna('')
+        contagem = motivos[motivos != ''].astype(str).value_counts()
+        por_categoria = (
+            contagem.groupby(classificar_motivos(contagem.index)).sum()
+            .reindex(CATEGORIAS_CANCELAMENTO, fill_value=0)
+        )
+        linhas.extend(
+            (DIMENSAO_CANCELAMENTO, categoria, int(quantidade))
+            for categoria, quantidade in por_categoria.items()
+        )
+
+    if 'MODALIDADE' in df.columns:
+        modalidades = df['MODALIDADE'].fillna('').astype(str)
+        for categoria, prefixo in PREFIXOS_MODALIDADE.items():
+            linhas.append((DIMENSAO_MODALIDADE, categoria, int(modalidades.str.startswith(prefixo).sum())))
+
+    contagens = pd.DataFrame(linhas, columns=['dimensao', 'categoria', 'quantidade'])
+    contagens.insert(0, 'periodo', str(periodo))
+    contagens.insert(0, 'curso', curso)
+    return contagens
+
+
+class TabelaEvasao:
+    """Tabela longa de contagens de todos os relatórios e as abas derivadas dela"""
+
+    def __init__(self, contagens: Optional[pd.DataFrame] = None):
+        self._partes: List[pd.DataFrame] = []
+        self._tabela = None
+        self._cursos: List[str] = []
+        if contagens is not None:
+            self.adicionar_contagens(contagens)
+
+    def registrar_curso(self, curso: str):
+        """Registra um curso para que apareça no resumo mesmo sem relatórios válidos"""
+        if curso not in self._cursos:
+            self._cursos.append(curso)
+
+    def adicionar_relatorio(self, df: pd.DataFrame, curso: str, periodo: str):
+        """Conta um relatório e acrescenta o resultado à tabela"""
+        self.registrar_curso(curso)
+        self.adicionar_contagens(contar_relatorio(df, curso, periodo))
+
+    def adicionar_contagens(self, contagens: pd.DataFrame):
+        """Acrescenta contagens já em formato longo"""
+        if contagens is None or contagens.empty:
+            return
+        for curso in contagens['curso'].unique():
+            self.registrar_curso(curso)
+        self._partes.append(contagens[COLUNAS_CONTAGEM])
+        self._tabela = None
+
+    @property
+    def tabela(self) -> pd.DataFrame:
+        """Tabela longa completa (concatenada sob demanda)"""
+        if self._tabela is None:
+            if self._partes:
+                tabela = pd.concat(self._partes, ignore_index=True)
+                tabela['quantidade'] = tabela['quantidade'].astype('int64')
+                self._partes = [tabela]
+            else:
+                tabela = pd.DataFrame(columns=COLUNAS_CONTAGEM)
+            self._tabela = tabela
+        return self._tabela
+
+    @property
+    def cursos(self) -> List[str]:
+        return list(self._cursos)
+
+    def _pivot(self, dimensao: str) -> pd.DataFrame:
+        """Contagens de uma dimensão com uma coluna por categoria, indexadas por (curso, periodo)"""
+        tabela = self.tabela
+        parte = tabela[tabela['dimensao'] == dimensao]
+        if parte.empty:
+            return pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=['curso', 'periodo']))
+        return parte.pivot_table(
+            index=['curso', 'periodo'], columns='categoria', values='quantidade',
+            aggfunc='sum', fill_value=0
+        )
+
+    def _ordenar(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Ordena um frame indexado por (curso, periodo) pela ordem de registro dos cursos"""
+        if df.empty:
+            return df
+        ordem = {curso: i for i, curso in enumerate(self._cursos)}
+        posicoes = df.index.get_level_values('curso').map(ordem).to_numpy()
+        periodos = df.index.get_level_values('periodo').to_numpy()
+        return df.iloc[np.lexsort((periodos, posicoes))]
+
+    def indicadores(self) -> pd.DataFrame:
+        """Indicadores por curso/período (total, ativos, formados, cancelamentos, modalidades)"""
+        totais = self._pivot(DIMENSAO_TOTAL)
+        indice = totais.index
+        situacoes = self._pivot(DIMENSAO_SITUACAO).reindex(index=indice, fill_value=0)
+        cancelamentos = self._pivot(DIMENSAO_CANCELAMENTO).reindex(index=indice, fill_value=0)
+        modalidades = self._pivot(DIMENSAO_MODALIDADE).reindex(index=indice, fill_value=0)
+
+        def colunas(df, nomes):
+            presentes = [nome for nome in nomes if nome in df.columns]
+            return df[presentes].sum(axis=1) if presentes else pd.Series(0, index=indice)
+
+        indicadores = pd.DataFrame({
+            'total': colunas(totais, [CATEGORIA_TOTAL]),
+            'ativos': colunas(situacoes, CATEGORIAS_ATIVAS),
+            'formados': colunas(situacoes, [CATEGORIA_FORMADOS]),
+            'cancelamentos': colunas(cancelamentos, CATEGORIAS_CANCELAMENTO),
+            'ampla': colunas(modalidades, ['Ampla Concorrência']),
+            'acoes': colunas(modalidades, ['Ações Afirmativas'])
+        }, index=indice).astype('int64')
+        return self._ordenar(indicadores)
+
+    @staticmethod
+    def _percentual(parte: pd.Series, total: pd.Series) -> pd.Series:
+        """Percentual (0-100) com duas casas, zero onde o total é zero"""
+        total = total.astype(float)
+        return (parte / total.where(total > 0) * 100).fillna(0).round(2)
+
+    def resumo_geral(self) -> Dict[str, int]:
+        """Totais gerais usados nas métricas da interface"""
+        indicadores = self.indicadores()
+        return {
+            'total_cursos': len(self._cursos),
+            'total_periodos': int(indicadores.index.get_level_values('periodo').nunique()),
+            'total_matriculas': int(indicadores['total'].sum()),
+            'total_cancelamentos': int(indicadores['cancelamentos'].sum()),
+            'total_formados': int(indicadores['formados'].sum()),
+            'total_ativos': int(indicadores['ativos'].sum())
+        }
+
+    def aba_resumo(self) -> pd.DataFrame:
+        """Aba RESUMO GERAL: totais e percentuais por curso"""
+        por_curso = (
+            self.indicadores().groupby(level='curso').sum()
+            .reindex(self._cursos, fill_value=0)
+        )
+        total = por_curso['total']
+        return pd.DataFrame({
+            'Curso': por_curso.index,
+            'Total Matrículas': total.to_numpy(),
+            'Total Cancelamentos': por_curso['cancelamentos'].to_numpy(),
+            'Total Formados': por_curso['formados'].to_numpy(),
+            'Total Ativos': por_curso['ativos'].to_numpy(),
+            '% Cancelamentos': self._percentual(por_curso['cancelamentos'], total).to_numpy(),
+            '% Formados': self._percentual(por_curso['formados'], total).to_numpy(),
+            '% Ativos': self._percentual(por_curso['ativos'], total).to_numpy()
+        })
+
+    def aba_detalhes(self) -> pd.DataFrame:
+        """Aba DETALHES: uma linha por curso/período com todas as categorias"""
+        indicadores = self.indicadores()
+        if indicadores.empty:
+            return pd.DataFrame()
+        indice = indicadores.index
+        total = indicadores['total']
+
+        detalhes = pd.DataFrame({
+            'Total Registros': total,
+            'Matrículas Ativas': indicadores['ativos'],
+            'Ampla Concorrência': indicadores['ampla'],
+            'Ações Afirmativas': indicadores['acoes']
+        }, index=indice)
+
+        situacoes = self._pivot(DIMENSAO_SITUACAO).reindex(index=indice, fill_value=0)
+        for categoria in CATEGORIAS_SITUACAO:
+            if categoria in situacoes.columns:
+                detalhes[f'{categoria} (qtd)'] = situacoes[categoria]
+                detalhes[f'{categoria} (%)'] = self._percentual(situacoes[categoria], total)
+
+        cancelamentos = self._pivot(DIMENSAO_CANCELAMENTO).reindex(index=indice, fill_value=0)
+        for categoria in CATEGORIAS_CANCELAMENTO:
+            if categoria in cancelamentos.columns:
+                detalhes[f'Cancel: {categoria}'] = cancelamentos[categoria]
+
+        detalhes = detalhes.reset_index()
+        detalhes.insert(0, 'Curso', detalhes.pop('curso'))
+        detalhes.insert(1, 'Período', formatar_periodo(detalhes.pop('periodo')))
+        return detalhes
+
+    def aba_cancelamentos(self) -> pd.DataFrame:
+        """Aba CANCELAMENTOS: uma linha por curso/período/motivo"""
+        tabela = self.tabela
+        cancel = tabela[tabela['dimensao'] == DIMENSAO_CANCELAMENTO]
+        if cancel.empty:
+            return pd.DataFrame()
+        cancel = cancel.groupby(['curso', 'periodo', 'categoria'], sort=False)['quantidade'].sum()
+        cancel = cancel.reset_index()
+        cancel['categoria'] = pd.Categorical(cancel['categoria'], categories=CATEGORIAS_CANCELAMENTO)
+        cancel['_ordem'] = cancel['curso'].map({c: i for i, c in enumerate(self._cursos)})
+        cancel = cancel.sort_values(['_ordem', 'periodo', 'categoria'], kind='stable')
+        total = cancel.groupby(['curso', 'periodo'])['quantidade'].transform('sum')
+
+        return pd.DataFrame({
+            'Curso': cancel['curso'].to_numpy(),
+            'Período': formatar_periodo(cancel['periodo']).to_numpy(),
+            'Motivo Cancelamento': cancel['categoria'].astype(str).to_numpy(),
+            'Quantidade': cancel['quantidade'].to_numpy(),
+            'Percentual': self._percentual(cancel['quantidade'], total).to_numpy()
+        })
+
+    def aba_modalidades(self) -> pd.DataFrame:
+        """Aba MODALIDADES: ampla concorrência x ações afirmativas por curso/período"""
+        indicadores = self.indicadores()
+        indicadores = indicadores[indicadores['total'] > 0]
+        if indicadores.empty:
+            return pd.DataFrame()
+        total = indicadores['total']
+        return pd.DataFrame({
+            'Curso': indicadores.index.get_level_values('curso'),
+            'Período': formatar_periodo(indicadores.index.get_level_values('periodo').to_series()).to_numpy(),
+            'Total': total.to_numpy(),
+            'Ampla Concorrência': indicadores['ampla'].to_numpy(),
+            '% Ampla': self._percentual(indicadores['ampla'], total).to_numpy(),
+            'Ações Afirmativas': indicadores['acoes'].to_numpy(),
+            '% Ações': self._percentual(indicadores['acoes'], total).to_numpy()
+        })
+
+    def abas(self) -> Dict[str, pd.DataFrame]:
+        """Todas as abas da planilha consolidada, na ordem de escrita"""
+        return {
+            'RESUMO GERAL': self.aba_resumo(),
+            'DETALHES': self.aba_detalhes(),
+            'CANCELAMENTOS': self.aba_cancelamentos(),
+            'MODALIDADES': self.aba_modalidades()
+        }
@@ -0,0 +1,256 @@
+"""
+controle_concorrencia.py - Limite adaptativo (AIMD) de requisições simultâneas ao portal
+
+Não se sabe quantas submissões, verificações de status ou downloads
+simultâneos o app.uff.br suporta. Cada classe de requisição tem um limite
+de requisições em andamento ajustado como no controle de congestionamento
+do TCP: a cada resposta rápida e sem erro o limite cresce 1/limite (cerca
+de +1 por rodada); um erro (5xx, 429, timeout, conexão) ou uma latência
+acima de FATOR_LATENCIA_AIMD × a latência de base o multiplica por
+FATOR_REDUCAO_AIMD, no máximo uma vez por intervalo de latência.
+
+O AdaptadorAIMD é montado nas sessões (PoolSessoes) e aplica o limite no
+nível HTTP, seja qual for o número de threads de trabalho. A vaga só é
+devolvida quando o corpo da resposta termina de chegar (ou a resposta é
+fechada): um download em stream ocupa a vaga durante a transferência. A
+latência informada é a da chegada dos cabeçalhos (tempo até o primeiro
+byte), que mede a carga do portal; o tempo de transferência depende do
+tamanho do arquivo e não conta como resposta lenta.
+"""
+import logging
+import re
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import FATOR_LATENCIA_AIMD, FATOR_REDUCAO_AIMD, LIMITES_AIMD
+from metricas import LIMITE_CONCORRENCIA
+
+logger = logging.getLogger(__name__)
+
+CLASSE_SUBMISSAO = 'submissao'
+CLASSE_POLLING = 'polling'
+CLASSE_DOWNLOAD = 'download'
+CLASSE_OUTROS = 'outros'
+
+_ROTA_STATUS = re.compile(r'/relatorios/\d+/?$')
+STATUS_SOBRECARGA = (429, 502, 503, 504)
+
+
+def classificar_requisicao(metodo: str, url: str) -> str:
+    """Classe de controle de uma requisição ao portal"""
+    caminho = url.split('?', 1)[0]
+    if metodo.upper() == 'POST':
+        return CLASSE_SUBMISSAO
+    if _ROTA_STATUS.search(caminho):
+        return CLASSE_POLLING
+    if 'download' in caminho.lower() or caminho.lower().endswith(('.xlsx', '.xls')):
+        return CLASSE_DOWNLOAD
+    return CLASSE_OUTROS
+
+
+class LimiteAIMD:
+    """Limite de requisições em andamento de uma classe"""
+
+    def __init__(self, classe: str, inicial: float, minimo: float, maximo: float,
+                 fator_reducao: float = FATOR_REDUCAO_AIMD, fator_latencia: float = FATOR_LATENCIA_AIMD,
+                 janela_base: int = 50):
+        self.classe = classe
+        self.limite = float(inicial)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.fator_reducao = fator_reducao
+        self.fator_latencia = fator_latencia
+        self.em_voo = 0
+        self.sucessos = 0
+        self.erros = 0
+        self.reducoes = 0
+        self._latencias = deque(maxlen=janela_base)
+        self._ultima_reducao = 0.0
+        self._condicao = threading.Condition()
+        LIMITE_CONCORRENCIA.set(self.limite, classe=classe)
+
+    def latencia_base(self) -> Optional[float]:
+        """Menor latência recente: o tempo de resposta do portal sem fila"""
+        return min(self._latencias) if self._latencias else None
+
+    def adquirir(self):
+        with self._condicao:
+            while self.em_voo >= int(self.limite):
+                self._condicao.wait()
+            self.em_voo += 1
+
+    def liberar(self, latencia: float, erro: bool):
+        """Devolve a vaga e ajusta o limite pelo resultado da requisição"""
+        with self._condicao:
+            self.em_voo -= 1
+            base = self.latencia_base()
+            lenta = base is not None and latencia > base * self.fator_latencia
+            if not erro:
+                self._latencias.append(latencia)
+
+            agora = time.monotonic()
+            if erro or lenta:
+                self.erros += erro
+                # Uma redução por "rodada": respostas já em voo refletem o limite antigo
+                if agora - self._ultima_reducao > (base or latencia):
+                    self.limite = max(self.minimo, self.limite * self.fator_reducao)
+                    self._ultima_reducao = agora
+                    self.reducoes += 1
+            else:
+                self.sucessos += 1
+                self.limite = min(self.maximo, self.limite + 1 / self.limite)
+            LIMITE_CONCORRENCIA.set(round(self.limite, 2), classe=self.classe)
+            self._condicao.notify_all()
+
+    def devolver(self):
+        """Devolve a vaga sem ajustar o limite (requisição não enviada)"""
+        with self._condicao:
+            self.em_voo -= 1
+            self._condicao.notify_all()
+
+    def snapshot(self) -> Dict:
+        with self._condicao:
+            return {
+                'classe': self.classe,
+                'limite': round(self.limite, 2),
+                'em_voo': self.em_voo,
+                'sucessos': self.sucessos,
+                'erros': self.erros,
+                'reducoes': self.reducoes,
+                'latencia_base_s': round(self.latencia_base() or 0, 4)
+            }
+
+
+class ControladorConcorrencia:
+    """Um LimiteAIMD por classe de requisição (LIMITES_AIMD: inicial, mínimo, máximo)"""
+
+    def __init__(self, limites: Optional[Dict[str, Tuple[float, float, float]]] = None, **opcoes):
+        limites = limites or LIMITES_AIMD
+        self.limites = {
+            classe: LimiteAIMD(classe, inicial, minimo, maximo, **opcoes)
+            for classe, (inicial, minimo, maximo) in limites.items()
+        }
+
+    def limite(self, metodo: str, url: str) -> LimiteAIMD:
+        classe = classificar_requisicao(metodo, url)
+        return self.limites.get(classe) or self.limites[CLASSE_OUTROS]
+
+    def snapshot(self):
+        return [limite.snapshot() for limite in self.limites.values()]
+
+
+class _Vaga:
+    """Vaga ocupada por uma requisição; liberada uma única vez"""
+
+    def __init__(self, limite: LimiteAIMD):
+        self.limite = limite
+        self.inicio = time.perf_counter()
+        self.latencia = None  # até os cabeçalhos; None: até a liberação
+        self.erro = False
+        self._liberada = False
+        self._lock = threading.Lock()
+
+    def _ocupada(self) -> bool:
+        with self._lock:
+            livre = self._liberada
+            self._liberada = True
+        return not livre
+
+    def cabecalhos_recebidos(self):
+        self.latencia = time.perf_counter() - self.inicio
+
+    def liberar(self, erro: bool = False):
+        if self._ocupada():
+            latencia = self.latencia if self.latencia is not None else time.perf_counter() - self.inicio
+            self.limite.liberar(latencia, self.erro or erro)
+
+    def devolver(self):
+        """Sem ajuste do limite: corpo abandonado antes do fim não mede latência"""
+        if self._ocupada():
+            self.limite.devolver()
+
+
+class _CorpoComVaga:
+    """Envolve response.raw e libera a vaga quando o corpo acaba, falha ou é fechado"""
+
+    def __init__(self, raw, vaga: _Vaga):
+        self._raw = raw
+        self._vaga = vaga
+        # Resposta descartada sem ler o corpo: a vaga volta quando o objeto for coletado
+        weakref.finalize(self, vaga.devolver)
+
+    def stream(self, *args, **kwargs):
+        try:
+            yield from self._raw.stream(*args, **kwargs)
+        except Exception:
+            self._vaga.liberar(erro=True)
+            raise
+        finally:
+            self._vaga.liberar()
+
+    def read(self, *args, **kwargs):
+        try:
+            dados = self._raw.read(*args, **kwargs)
+        except Exception:
+            self._vaga.liberar(erro=True)
+            raise
+        amt = args[0] if args else kwargs.get('amt')
+        if not dados or amt is None:
+            self._vaga.liberar()
+        return dados
+
+    def close(self):
+        try:
+            self._raw.close()
+        finally:
+            self._vaga.devolver()
+
+    def release_conn(self):
+        try:
+            release_conn = getattr(self._raw, 'release_conn', None)
+            if release_conn is not None:
+                release_conn()
+        finally:
+            self._vaga.devolver()
+
+    def __getattr__(self, nome):
+        return getattr(self._raw, nome)
+
+
+class AdaptadorAIMD(HTTPAdapter):
+    """HTTPAdapter que espera uma vaga da classe antes de enviar e informa latência e erros"""
+
+    def __init__(self, controlador: ControladorConcorrencia, **kwargs):
+        self.controlador = controlador
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        limite = self.controlador.limite(request.method, request.url)
+        limite.adquirir()
+        vaga = _Vaga(limite)
+        try:
+            response = super().send(request, **kwargs)
+        except BaseException:
+            vaga.liberar(erro=True)
+            raise
+        vaga.cabecalhos_recebidos()
+        vaga.erro = response.status_code in STATUS_SOBRECARGA
+        if response.raw is None:
+            vaga.liberar()
+        else:
+            # Com stream=True, send() volta com os cabeçalhos: a vaga segue até o corpo terminar
+            response.raw = _CorpoComVaga(response.raw, vaga)
+        return response
+
+
+def montar_controle(session: requests.Session, controlador: ControladorConcorrencia):
+    """Monta o AdaptadorAIMD para http e https na sessão"""
+    adaptador = AdaptadorAIMD(controlador, pool_maxsize=max(int(l.maximo) for l in controlador.limites.values()))
+    session.mount('https://', adaptador)
+    session.mount('http://', adaptador)
@@ -0,0 +1,248 @@
+"""
+descoberta_cursos.py - Catálogo de todas as localidades, cursos e desdobramentos do portal
+
+O gerador só conhecia os três cursos de Química de Niterói. A descoberta
+lê as localidades do formulário de listagem de alunos e, para cada uma,
+consulta os mesmos endpoints AJAX que o formulário usa ao trocar de
+localidade (cursos) e de curso (desdobramentos). O resultado é uma lista
+de cursos no formato de GeradorRelatorios.obter_cursos_predefinidos, com
+a localidade, pronta para a matriz curso × período.
+
+Cada consulta AJAX é repetida até TENTATIVAS_DESCOBERTA vezes; as que
+ainda falham ficam em DescobertaCursos.falhas, e um catálogo com falhas
+não é salvo. O catálogo completo é guardado em ARQUIVO_CATALOGO_CURSOS e
+reaproveitado por VALIDADE_CATALOGO_HORAS. A descoberta é usada pelo CLI
+(executar_lote --descobrir-cursos); a interface Streamlit continua com os
+cursos de Química.
+"""
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from config import (
+    ARQUIVO_CATALOGO_CURSOS, BUSCAR_CURSOS_URL, BUSCAR_DESDOBRAMENTOS_URL, CONCORRENCIA_DESCOBERTA,
+    ESPERA_DESCOBERTA, LISTAGEM_ALUNOS_URL, TENTATIVAS_DESCOBERTA, TIMEOUT_REQUESTS, VALIDADE_CATALOGO_HORAS
+)
+from rastreamento import rastrear
+from utils import criar_soup
+
+logger = logging.getLogger(__name__)
+
+HEADERS_AJAX = {
+    'X-Requested-With': 'XMLHttpRequest',
+    'Accept': 'application/json, text/javascript, */*; q=0.01',
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8'
+}
+_CODIGO_NO_NOME = re.compile(r'\s*\((\d+)\)\s*$')
+
+
+def _opcao(item) -> Optional[Dict]:
+    """{'value', 'text'} de um item de resposta AJAX (dict, par ou <option>)"""
+    if isinstance(item, dict):
+        valor = next((item[c] for c in ('value', 'id', 'codigo') if item.get(c) not in (None, '')), None)
+        texto = next((item[c] for c in ('text', 'nome', 'descricao') if item.get(c)), None)
+    elif isinstance(item, (list, tuple)) and len(item) == 2:
+        valor, texto = item
+    else:
+        return None
+    if valor in (None, ''):
+        return None
+    return {'value': str(valor), 'text': str(texto or valor).strip()}
+
+
+def opcoes_resposta(response, chave: str) -> List[Dict]:
+    """Opções de uma resposta AJAX em JSON ({chave: [...]} ou lista) ou em HTML (<option>)"""
+    try:
+        dados = response.json()
+    except ValueError:
+        soup = criar_soup(response.text)
+        return [{'value': o['value'], 'text': o.get_text(strip=True)}
+                for o in soup.find_all('option') if o.get('value')]
+    if isinstance(dados, dict):
+        dados = dados.get(chave) or dados.get('opcoes') or []
+    return [opcao for opcao in map(_opcao, dados) if opcao]
+
+
+def _opcoes_select(soup, nome: str) -> List[Dict]:
+    select = soup.find('select', {'id': nome}) or soup.find('select', {'name': nome})
+    if not select:
+        return []
+    return [{'value': o['value'], 'text': o.get_text(strip=True)} for o in select.find_all('option') if o.get('value')]
+
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas sem acentos, para comparar termos digitados com nomes de localidades"""
+    return ''.join(c for c in unicodedata.normalize('NFKD', texto.lower()) if not unicodedata.combining(c))
+
+
+def _tipo(texto: str) -> str:
+    for tipo in ('Licenciatura', 'Bacharelado', 'Tecnológico'):
+        if tipo.lower() in texto.lower():
+            return tipo
+    return ''
+
+
+class DescobertaCursos:
+    """Descobre os cursos pelos endpoints do formulário de listagem de alunos"""
+
+    def __init__(self, session, concorrencia: int = CONCORRENCIA_DESCOBERTA):
+        self.session = session
+        self.concorrencia = concorrencia
+        self._token = ''
+        self.falhas: List[Dict] = []  # consultas sem resposta válida: {'localidade', 'curso'?, 'erro'}
+
+    def _post(self, url: str, dados: Dict, chave: str) -> Optional[List[Dict]]:
+        """Opções retornadas pelo endpoint ([] se ele responder sem opções); None se todas as tentativas falharem"""
+        for tentativa in range(TENTATIVAS_DESCOBERTA):
+            if tentativa:
+                time.sleep(ESPERA_DESCOBERTA * 2 ** (tentativa - 1))
+            try:
+                response = self.session.post(url, data=dict(dados, authenticity_token=self._token),
+                                             headers=HEADERS_AJAX, timeout=TIMEOUT_REQUESTS)
+                response.raise_for_status()
+                return opcoes_resposta(response, chave)
+            except Exception as e:
+                erro = str(e)
+                logger.warning(f"Erro ao consultar {url} com {dados} "
+                               f"(tentativa {tentativa + 1}/{TENTATIVAS_DESCOBERTA}): {erro}")
+        self.falhas.append(dict(dados, erro=erro))
+        logger.error(f"Sem resposta de {url} com {dados}")
+        return None
+
+    def localidades(self, soup) -> List[Dict]:
+        return _opcoes_select(soup, 'idlocalidade')
+
+    def cursos(self, localidade: str) -> Optional[List[Dict]]:
+        return self._post(BUSCAR_CURSOS_URL, {'idlocalidade': localidade}, 'cursos')
+
+    def desdobramentos(self, localidade: str, curso: str) -> Optional[List[Dict]]:
+        return self._post(BUSCAR_DESDOBRAMENTOS_URL, {'idlocalidade': localidade, 'idcurso': curso},
+                          'desdobramentos')
+
+    @rastrear('descoberta.descobrir')
+    def descobrir(self, termos_localidades: Iterable[str] = ()) -> List[Dict]:
+        """Cursos (um por desdobramento) de todas as localidades, ou das que contêm algum dos termos
+
+        Localidades e cursos cujas consultas falharam ficam de fora e em `falhas`.
+        """
+        self.falhas = []
+        response = self.session.get(LISTAGEM_ALUNOS_URL, timeout=TIMEOUT_REQUESTS)
+        response.raise_for_status()
+        soup = criar_soup(response.text)
+        token = soup.find('input', {'name': 'authenticity_token'}) or soup.find('meta', {'name': 'csrf-token'})
+        self._token = (token.get('value') or token.get('content') or '') if token else ''
+
+        localidades = self.localidades(soup)
+        termos = [_normalizar(termo) for termo in termos_localidades]
+        if termos:
+            localidades = [loc for loc in localidades if any(termo in _normalizar(loc['text']) for termo in termos)]
+        if not localidades:
+            logger.error("Nenhuma localidade encontrada no formulário de listagem")
+            return []
+
+        cursos_pagina = _opcoes_select(soup, 'idcurso')
+        pares = []
+        for localidade in localidades:
+            cursos = self.cursos(localidade['value'])
+            if not cursos and len(localidades) == 1 and cursos_pagina:
+                logger.warning(f"Sem resposta de {BUSCAR_CURSOS_URL}; usando os cursos da página")
+                if cursos is None:
+                    self.falhas.pop()  # os cursos da página substituem a consulta
+                cursos = cursos_pagina
+            if cursos is None:
+                continue
+            logger.info(f"Localidade {localidade['text']}: {len(cursos)} cursos")
+            pares.extend((localidade, curso) for curso in cursos)
+
+        with ThreadPoolExecutor(max_workers=self.concorrencia, thread_name_prefix='descoberta') as pool:
+            desdobramentos = list(pool.map(lambda par: self.desdobramentos(par[0]['value'], par[1]['value']), pares))
+
+        catalogo = []
+        for (localidade, curso), opcoes in zip(pares, desdobramentos):
+            if opcoes is None:
+                continue  # consulta falhou: o curso fica de fora (e em `falhas`)
+            # Curso sem desdobramentos: o próprio curso é o desdobramento
+            for desdobramento in opcoes or [curso]:
+                catalogo.append({
+                    'nome': _CODIGO_NO_NOME.sub('', desdobramento['text']) or desdobramento['text'],
+                    'codigo_curso': curso['value'],
+                    'codigo_desdobramento': desdobramento['value'],
+                    'tipo': _tipo(desdobramento['text']),
+                    'localidade': localidade['value'],
+                    'nome_localidade': localidade['text']
+                })
+        return nomes_unicos(catalogo)
+
+
+def nomes_unicos(catalogo: List[Dict]) -> List[Dict]:
+    """Acrescenta a localidade (e, se preciso, o código) aos nomes repetidos
+
+    O nome do curso é a chave dos resultados e das abas da planilha.
+    """
+    contagem = {}
+    for curso in catalogo:
+        contagem[curso['nome']] = contagem.get(curso['nome'], 0) + 1
+    for curso in catalogo:
+        if contagem[curso['nome']] > 1:
+            curso['nome'] = f"{curso['nome']} - {curso['nome_localidade']}"
+
+    vistos = set()
+    for curso in catalogo:
+        if curso['nome'] in vistos:
+            curso['nome'] = f"{curso['nome']} ({curso['codigo_desdobramento']})"
+        vistos.add(curso['nome'])
+    return catalogo
+
+
+def carregar_catalogo(caminho: str = ARQUIVO_CATALOGO_CURSOS,
+                      validade_horas: float = VALIDADE_CATALOGO_HORAS) -> Optional[List[Dict]]:
+    """Catálogo salvo, se existir e estiver dentro da validade"""
+    if not os.path.exists(caminho):
+        return None
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+    except Exception as e:
+        logger.error(f"Erro ao carregar catálogo de cursos: {str(e)}")
+        return None
+    if time.time() - dados.get('gerado_em', 0) > validade_horas * 3600:
+        return None
+    return dados['cursos']
+
+
+def salvar_catalogo(cursos: List[Dict], caminho: str = ARQUIVO_CATALOGO_CURSOS):
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump({'gerado_em': time.time(), 'cursos': cursos}, f, ensure_ascii=False, indent=2)
+
+
+def obter_catalogo(session, termos_localidades: Iterable[str] = (), atualizar: bool = False,
+                   caminho: str = ARQUIVO_CATALOGO_CURSOS) -> List[Dict]:
+    """Catálogo em cache ou descoberto agora; `termos_localidades` filtra as localidades
+
+    Sem catálogo em cache, só as localidades filtradas são descobertas. Um
+    resultado parcial (filtrado ou com consultas que falharam) não é salvo
+    no lugar do catálogo completo.
+    """
+    termos_localidades = list(termos_localidades)
+    cursos = None if atualizar else carregar_catalogo(caminho)
+    if cursos is None:
+        descoberta = DescobertaCursos(session)
+        cursos = descoberta.descobrir(termos_localidades)
+        if descoberta.falhas:
+            logger.warning(f"Catálogo incompleto, não salvo: {len(descoberta.falhas)} consulta(s) sem resposta "
+                           f"({descoberta.falhas[:3]})")
+        elif cursos and not termos_localidades:
+            salvar_catalogo(cursos, caminho)
+    elif termos_localidades:
+        termos = [_normalizar(termo) for termo in termos_localidades]
+        cursos = [curso for curso in cursos if any(termo in _normalizar(curso['nome_localidade']) for termo in termos)]
+    logger.info(f"Catálogo: {len(cursos)} cursos em {len({c['localidade'] for c in cursos})} localidades")
+    return cursos
@@ -0,0 +1,194 @@
+"""
+download_retomavel.py - Download de relatórios com retomada e segmentos paralelos
+
+Uma conexão que cai no meio de um XLSX grande não recomeça do zero: a
+nova tentativa pede `Range: bytes=<já gravados>-` e continua no mesmo
+arquivo. Se o servidor anuncia `Accept-Ranges: bytes` e o arquivo é
+grande, ele é baixado em segmentos paralelos gravados em um arquivo
+pré-alocado. O download só é aceito se o tamanho gravado bater com o
+`Content-Length`, e o arquivo final só aparece (os.replace) quando completo.
+
+Os segmentos rodam em um pool de threads único e duradouro: com uma
+SessaoCompartilhada, cada thread mantém a sua sessão (e conexões) de um
+download para o outro, em vez de clonar uma sessão nova por segmento.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from config import (
+    LIMIAR_DOWNLOAD_PARALELO, SEGMENTOS_DOWNLOAD, TAMANHO_BLOCO_DOWNLOAD, TENTATIVAS_DOWNLOAD, THREADS_SEGMENTOS,
+    TIMEOUT_REQUESTS
+)
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+_pool_segmentos: Optional[ThreadPoolExecutor] = None
+_pool_segmentos_lock = threading.Lock()
+
+
+def pool_segmentos() -> ThreadPoolExecutor:
+    """Pool de threads dos segmentos, criado no primeiro download segmentado"""
+    global _pool_segmentos
+    with _pool_segmentos_lock:
+        if _pool_segmentos is None:
+            _pool_segmentos = ThreadPoolExecutor(max_workers=THREADS_SEGMENTOS, thread_name_prefix='segmento')
+        return _pool_segmentos
+
+
+def _inicio_content_range(response) -> Optional[int]:
+    """Primeiro byte de uma resposta 206 (None se o cabeçalho for inválido)"""
+    correspondencia = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+    return int(correspondencia.group(1)) if correspondencia else None
+
+
+def _tamanho_declarado(response) -> Optional[int]:
+    """Content-Length do corpo original; None se ausente ou se o corpo vier comprimido"""
+    if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return None
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+class DownloadRetomavel:
+    """Baixa uma URL para um arquivo usando a sessão autenticada"""
+
+    def __init__(self, session, tentativas: int = TENTATIVAS_DOWNLOAD, segmentos: int = SEGMENTOS_DOWNLOAD,
+                 limiar_paralelo: int = LIMIAR_DOWNLOAD_PARALELO, timeout: float = TIMEOUT_REQUESTS,
+                 progresso: Optional[Callable[[int, int], None]] = None):
+        self.session = session
+        self.tentativas = tentativas
+        self.segmentos = segmentos
+        self.limiar_paralelo = limiar_paralelo
+        self.timeout = timeout
+        self.progresso = progresso
+        self._baixados = 0
+        self._lock = threading.Lock()
+
+    def baixar(self, url: str, caminho: str) -> int:
+        """Grava `url` em `caminho` e retorna o número de bytes; levanta IOError se não conseguir"""
+        temporario = f"{caminho}.parte"
+        self._baixados = 0
+        response = self.session.get(url, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        tamanho = _tamanho_declarado(response)
+        aceita_range = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+
+        try:
+            if aceita_range and tamanho and tamanho >= self.limiar_paralelo and self.segmentos > 1:
+                response.close()
+                self._baixar_segmentado(url, temporario, tamanho)
+            else:
+                self._baixar_sequencial(url, temporario, response, tamanho, aceita_range)
+
+            gravados = os.path.getsize(temporario)
+            if tamanho is not None and gravados != tamanho:
+                raise IOError(f"Download incompleto: {gravados} de {tamanho} bytes")
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        os.replace(temporario, caminho)
+        return gravados
+
+    def _contabilizar(self, n: int, tamanho: Optional[int]):
+        with self._lock:
+            antes = self._baixados
+            self._baixados += n
+            atual = self._baixados
+        # Progresso a cada 1MB
+        if self.progresso and atual // (1024 * 1024) != antes // (1024 * 1024):
+            self.progresso(atual, tamanho or 0)
+
+    def _gravar(self, response, arquivo, tamanho: Optional[int], limite: Optional[int] = None) -> int:
+        """Copia o corpo da resposta para o arquivo (até `limite` bytes); retorna os bytes gravados"""
+        gravados = 0
+        for bloco in response.iter_content(chunk_size=TAMANHO_BLOCO_DOWNLOAD):
+            if not bloco:
+                continue
+            if limite is not None:
+                bloco = bloco[:limite - gravados]
+            arquivo.write(bloco)
+            gravados += len(bloco)
+            self._contabilizar(len(bloco), tamanho)
+            if limite is not None and gravados >= limite:
+                break
+        return gravados
+
+    def _esperar(self, tentativa: int):
+        time.sleep(min(2 ** tentativa, 30))
+
+    def _baixar_sequencial(self, url, temporario, response, tamanho, aceita_range):
+        """Uma conexão; se cair, retoma do último byte gravado (ou recomeça, sem suporte a Range)"""
+        with open(temporario, 'wb') as arquivo:
+            for tentativa in range(self.tentativas + 1):
+                try:
+                    if response is None:
+                        inicio = arquivo.tell()
+                        headers = {'Range': f'bytes={inicio}-'} if aceita_range and inicio else {}
+                        response = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+                        response.raise_for_status()
+                        if response.status_code != 206 or _inicio_content_range(response) != inicio:
+                            # Servidor devolveu o arquivo inteiro: recomeçar
+                            arquivo.seek(0)
+                            arquivo.truncate()
+                    self._gravar(response, arquivo, tamanho)
+                    if tamanho is None or arquivo.tell() >= tamanho:
+                        return
+                    raise IOError(f"Conexão encerrada com {arquivo.tell()} de {tamanho} bytes")
+                except Exception as e:
+                    if tentativa >= self.tentativas:
+                        raise
+                    logger.warning(f"Download interrompido ({str(e)}); retomando do byte {arquivo.tell()}")
+                    response = None
+                    self._esperar(tentativa)
+
+    def _baixar_segmentado(self, url, temporario, tamanho):
+        """Segmentos com Range em paralelo, cada um gravado na sua posição do arquivo pré-alocado"""
+        with open(temporario, 'wb') as arquivo:
+            arquivo.truncate(tamanho)
+
+        passo = -(-tamanho // self.segmentos)
+        faixas = [(inicio, min(inicio + passo, tamanho) - 1) for inicio in range(0, tamanho, passo)]
+        logger.info(f"Download em {len(faixas)} segmentos paralelos ({tamanho / (1024 * 1024):.1f}MB)")
+        futuros = [pool_segmentos().submit(self._baixar_faixa, url, temporario, inicio, fim, tamanho)
+                   for inicio, fim in faixas]
+        try:
+            for futuro in futuros:
+                futuro.result()
+        finally:
+            # Em caso de falha, não deixar segmentos pendentes gravando no temporário que será removido
+            for futuro in futuros:
+                futuro.cancel()
+            wait(futuros)
+
+    def _baixar_faixa(self, url, temporario, inicio, fim, tamanho):
+        posicao = inicio
+        with open(temporario, 'r+b') as arquivo:
+            for tentativa in range(self.tentativas + 1):
+                try:
+                    response = self.session.get(url, stream=True, timeout=self.timeout,
+                                                headers={'Range': f'bytes={posicao}-{fim}'})
+                    response.raise_for_status()
+                    if response.status_code != 206 or _inicio_content_range(response) != posicao:
+                        raise IOError(f"Resposta sem o intervalo pedido (status {response.status_code})")
+                    arquivo.seek(posicao)
+                    self._gravar(response, arquivo, tamanho, limite=fim - posicao + 1)
+                    posicao = arquivo.tell()
+                    if posicao > fim:
+                        return
+                    raise IOError(f"Segmento {inicio}-{fim} interrompido no byte {posicao}")
+                except Exception as e:
+                    if tentativa >= self.tentativas:
+                        raise
+                    posicao = max(posicao, arquivo.tell())
+                    logger.warning(f"Segmento {inicio}-{fim}: {str(e)}; retomando do byte {posicao}")
+                    self._esperar(tentativa)
@@ -0,0 +1,89 @@
+"""
+escritor_planilha.py - Escrita vetorizada da planilha consolidada (xlsxwriter)
+
+Cada aba é escrita coluna a coluna com write_column: os percentuais são
+convertidos de uma vez (valor/100), o formato numérico é aplicado por coluna
+e as larguras são calculadas a partir do DataFrame, sem varrer células.
+"""
+import logging
+from typing import Dict, List, Optional
+
+import pandas as pd
+import xlsxwriter
+
+logger = logging.getLogger(__name__)
+
+FORMATO_CABECALHO = {'bold': True, 'bg_color': '#366092', 'font_color': 'white'}
+FORMATO_PERCENTUAL = {'num_format': '0.00%'}
+
+LARGURA_MINIMA = 6
+LARGURA_MAXIMA = 60
+# Texto exibido por '0.00%' tem no máximo 7 caracteres ("100.00%")
+LARGURA_PERCENTUAL = 8
+
+
+def eh_coluna_percentual(nome_coluna: str) -> bool:
+    """Indica se a coluna guarda percentuais na escala 0-100"""
+    nome = str(nome_coluna)
+    return nome.startswith('%') or '(%)' in nome or nome == 'Percentual'
+
+
+def _largura_coluna(serie: pd.Series, cabecalho: str, percentual: bool) -> int:
+    """Largura (em caracteres) suficiente para o cabeçalho e o maior valor da coluna"""
+    largura = len(str(cabecalho))
+    if len(serie):
+        if percentual:
+            largura = max(largura, LARGURA_PERCENTUAL)
+        else:
+            largura = max(largura, int(serie.astype(str).str.len().max()))
+    return min(max(largura + 2, LARGURA_MINIMA), LARGURA_MAXIMA)
+
+
+def _valores_coluna(serie: pd.Series, percentual: bool) -> List:
+    """Valores prontos para write_column (tipos nativos, sem NaN)"""
+    if percentual:
+        serie = pd.to_numeric(serie, errors='coerce').fillna(0) / 100
+    elif pd.api.types.is_numeric_dtype(serie):
+        serie = serie.fillna(0)
+    else:
+        serie = serie.astype(object).where(serie.notna(), '')
+    return serie.tolist()
+
+
+def escrever_aba(workbook, nome_aba: str, df: pd.DataFrame, formatos: Dict):
+    """Escreve um DataFrame em uma nova aba, coluna a coluna"""
+    worksheet = workbook.add_worksheet(nome_aba)
+    worksheet.write_row(0, 0, [str(coluna) for coluna in df.columns], formatos['cabecalho'])
+
+    for col_idx, coluna in enumerate(df.columns):
+        serie = df[coluna]
+        percentual = eh_coluna_percentual(coluna)
+        formato = formatos['percentual'] if percentual else None
+
+        worksheet.set_column(col_idx, col_idx, _largura_coluna(serie, coluna, percentual), formato)
+        if len(serie):
+            worksheet.write_column(1, col_idx, _valores_coluna(serie, percentual), formato)
+
+    return worksheet
+
+
+def escrever_planilha(abas: Dict[str, pd.DataFrame], caminho_saida: str,
+                      opcoes_workbook: Optional[Dict] = None) -> bool:
+    """Escreve todas as abas em um arquivo XLSX; abas sem colunas são omitidas"""
+    workbook = xlsxwriter.Workbook(caminho_saida, opcoes_workbook or {})
+    escritas = 0
+    try:
+        formatos = {
+            'cabecalho': workbook.add_format(FORMATO_CABECALHO),
+            'percentual': workbook.add_format(FORMATO_PERCENTUAL)
+        }
+        for nome_aba, df in abas.items():
+            if df is None or len(df.columns) == 0:
+                continue
+            escrever_aba(workbook, nome_aba, df, formatos)
+            escritas += 1
+    finally:
+        workbook.close()
+
+    logger.info(f"Planilha escrita: {caminho_saida} ({escritas} abas)")
+    return True
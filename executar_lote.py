@@ -0,0 +1,336 @@
+"""
+executar_lote.py - Execução do pipeline completo pela linha de comando (sem navegador)
+
+Autentica no portal, gera e baixa os relatórios de cada curso × período,
+consolida os dados e grava a planilha de evasão. Pode ser agendado (cron)
+e usado para medir o pipeline.
+
+Uso:
+    UFF_SENHA=... python executar_lote.py --usuario 12345678900 \\
+        --periodo-inicial 20131 --periodo-final 20252 --saida relatorios/evasao.xlsx
+
+    python executar_lote.py --usuario ... --cursos licenciatura industrial \\
+        --concorrencia 3 --backoff 1.5 --intervalo-maximo 120 --cache armazem
+
+    # Todos os cursos de todas as localidades, em uma janela noturna (até 6h)
+    python executar_lote.py --usuario ... --descobrir-cursos --periodo-inicial 20131 \\
+        --periodo-final 20252 --agendador --ate 06:00 --concorrencia-adaptativa
+
+    # Grava as requisições (sem credenciais) e repete a execução offline
+    python executar_lote.py --usuario ... ... --gravar-cassete execucao.jsonl
+    python executar_lote.py --usuario x ... --reproduzir-cassete execucao.jsonl \\
+        --intervalo-entre 0 --intervalo-polling 0
+"""
+import argparse
+import getpass
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from config import (
+    BANCO_ANALITICO, CONCORRENCIA_AGENDADOR, ESCALA_TEMPO_CASSETE, INTERVALO_VERIFICACAO, LIMITE_LINHAS_CONSULTA, LOG_FILE,
+    ORCAMENTO_DISCO_MB, PASTA_RELATORIOS, PORTA_METRICAS, SUFIXO_MANIFESTO
+)
+from registros import para_json
+
+logger = logging.getLogger(__name__)
+
+CODIGO_SAIDA_FALHA = 1
+CODIGO_SAIDA_PARCIAL = 2
+
+
+def selecionar_cursos(cursos_predefinidos, termos):
+    """Cursos cujo nome contém algum dos termos (todos, se não houver termos)"""
+    if not termos:
+        return cursos_predefinidos
+    termos = [termo.lower() for termo in termos]
+    return [curso for curso in cursos_predefinidos
+            if any(termo in curso['nome'].lower() for termo in termos)]
+
+
+def carregar_manifesto(caminho, gestor=None, cursos=None, periodos=None):
+    """Resultados de uma execução anterior, mantendo só os downloads que ainda existem
+
+    Só os cursos (nomes) e períodos pedidos, se informados; relatórios
+    comprimidos pelo GestorDisco são restaurados.
+    """
+    from gestor_disco import caminho_disponivel
+
+    with open(caminho, 'r', encoding='utf-8') as f:
+        resultados = json.load(f)
+    return {
+        (curso, resultado['periodo']): dict(resultado, origem=resultado.get('origem') or 'manifesto')
+        for curso, resultados_curso in resultados.items() if cursos is None or curso in cursos
+        for resultado in resultados_curso
+        if resultado.get('success') and (periodos is None or resultado['periodo'] in periodos)
+        and caminho_disponivel(resultado.get('caminho_arquivo'), gestor)
+    }
+
+
+def prazo_janela(horario, agora=None):
+    """Instante (epoch) do próximo HH:MM: hoje, ou amanhã se já passou"""
+    agora = agora or datetime.now()
+    hora, minuto = (int(parte) for parte in horario.split(':'))
+    fim = agora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+    if fim <= agora:
+        fim += timedelta(days=1)
+    return fim.timestamp()
+
+
+def salvar_manifesto(resultados_geracao, caminho):
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(resultados_geracao, f, ensure_ascii=False, indent=2, default=para_json)
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        description="Gera, baixa e consolida os relatórios de evasão sem a interface Streamlit"
+    )
+    parser.add_argument('--usuario', default=os.environ.get('UFF_USUARIO'),
+                        help="CPF/usuário do portal (ou UFF_USUARIO)")
+    parser.add_argument('--cursos', nargs='*', default=None,
+                        help="Termos do nome dos cursos (ex.: licenciatura bacharelado industrial); padrão: todos")
+    parser.add_argument('--periodo-inicial', required=True, help="Período inicial AAAAS (ex.: 20131)")
+    parser.add_argument('--periodo-final', required=True, help="Período final AAAAS (ex.: 20252)")
+    parser.add_argument('--saida', default=None, help="Planilha consolidada (.xlsx)")
+    parser.add_argument('--descobrir-cursos', action='store_true',
+                        help="Todos os cursos e desdobramentos do portal, em vez dos cursos de Química")
+    parser.add_argument('--localidades', nargs='*', default=None,
+                        help="Com --descobrir-cursos: termos do nome das localidades (padrão: todas)")
+    parser.add_argument('--atualizar-catalogo', action='store_true',
+                        help="Refaz a descoberta mesmo com o catálogo de cursos dentro da validade")
+
+    grupo_execucao = parser.add_argument_group("execução")
+    grupo_execucao.add_argument('--concorrencia', type=int, default=1,
+                                help="Relatórios gerados/monitorados ao mesmo tempo")
+    grupo_execucao.add_argument('--intervalo-entre', type=float, default=5,
+                                help="Pausa (s) de cada worker entre relatórios")
+    grupo_execucao.add_argument('--concorrencia-adaptativa', action='store_true',
+                                help="Limita as requisições simultâneas por classe com AIMD "
+                                     "(use com --concorrencia alta)")
+    grupo_execucao.add_argument('--agendador', action='store_true',
+                                help="Relatórios em andamento ajustados por AIMD, de --concorrencia "
+                                     "até --concorrencia-maxima")
+    grupo_execucao.add_argument('--concorrencia-maxima', type=int, default=CONCORRENCIA_AGENDADOR[1],
+                                help="Com --agendador: máximo de relatórios em andamento")
+    grupo_execucao.add_argument('--ate', metavar='HH:MM', default=None,
+                                help="Com --agendador: fim da janela; o que não terminaria a tempo fica para --retomar")
+    grupo_cassete = grupo_execucao.add_mutually_exclusive_group()
+    grupo_cassete.add_argument('--gravar-cassete', metavar='ARQUIVO', default=None,
+                               help="Grava as requisições HTTP (sem credenciais) em JSON-lines")
+    grupo_cassete.add_argument('--reproduzir-cassete', metavar='ARQUIVO', default=None,
+                               help="Responde às requisições a partir de um cassete gravado, sem rede "
+                                    "(implica --atualizacao tudo)")
+    grupo_execucao.add_argument('--escala-tempo', type=float, default=ESCALA_TEMPO_CASSETE,
+                                help="Na reprodução, fração das latências originais a esperar (0 = sem espera)")
+    grupo_execucao.add_argument('--planejamento', choices=['agrupado', 'estreito'], default='agrupado',
+                                help="'agrupado' pede poucas consultas amplas e as separa localmente")
+    grupo_execucao.add_argument('--limite-linhas', type=int, default=LIMITE_LINHAS_CONSULTA,
+                                help="Linhas máximas de uma consulta agrupada")
+
+    grupo_polling = parser.add_argument_group("polling do status")
+    grupo_polling.add_argument('--intervalo-polling', type=float, default=INTERVALO_VERIFICACAO,
+                               help="Intervalo inicial (s) entre verificações de status")
+    grupo_polling.add_argument('--backoff', type=float, default=1.0,
+                               help="Fator multiplicativo do intervalo a cada verificação (1 = fixo)")
+    grupo_polling.add_argument('--intervalo-maximo', type=float, default=None,
+                               help="Limite (s) do intervalo com backoff")
+    grupo_polling.add_argument('--timeout', type=int, default=1800,
+                               help="Tempo máximo (s) de processamento de cada relatório")
+
+    grupo_cache = parser.add_argument_group("cache")
+    grupo_cache.add_argument('--retomar', default=None,
+                             help="Manifesto JSON de uma execução anterior; relatórios já baixados não são gerados de novo")
+    grupo_cache.add_argument('--atualizacao', choices=['frescor', 'tudo'], default='frescor',
+                             help="'frescor' reaproveita relatórios dentro do prazo de validade da coorte; "
+                                  "'tudo' gera todos de novo")
+    grupo_cache.add_argument('--orcamento-disco', type=float, default=ORCAMENTO_DISCO_MB,
+                             help="MB máximos de relatórios baixados na pasta de relatórios")
+    grupo_cache.add_argument('--cache', choices=['nenhum', 'armazem'], default='nenhum',
+                             help="'armazem' consolida pelo banco SQLite, sem reler relatórios inalterados")
+    grupo_cache.add_argument('--banco', default=BANCO_ANALITICO, help="Banco SQLite usado com --cache armazem")
+
+    grupo_saida = parser.add_argument_group("saída")
+    grupo_saida.add_argument('--formato-alunos', choices=['xlsx', 'csv', 'nenhum'], default='xlsx',
+                             help="Exportação das linhas de alunos de todos os relatórios")
+    grupo_saida.add_argument('--rastreamento', default=None, help="Arquivo JSON-lines de spans")
+    grupo_saida.add_argument('--porta-metricas', type=int, default=None,
+                             help=f"Expõe /metrics durante a execução (ex.: {PORTA_METRICAS})")
+    grupo_saida.add_argument('-v', '--verbose', action='store_true')
+    return parser
+
+
+def executar(args) -> int:
+    # Importações do pipeline só depois do parse dos argumentos (--help instantâneo)
+    from analise_incremental import AnaliseIncremental
+    from auth import UFFAuthenticator
+    from gestor_disco import GestorDisco
+    from gerador_relatorios import GeradorRelatorios, ProcessadorDadosRelatorios
+    from instrumentacao_http import monitor_http
+    from politica_atualizacao import gerar_com_politica
+    from pool_sessoes import PoolSessoes, SessaoCompartilhada
+    from metricas import iniciar_servidor_metricas
+    from rastreamento import configurar_rastreamento
+
+    if args.rastreamento:
+        configurar_rastreamento(args.rastreamento)
+    if args.porta_metricas:
+        iniciar_servidor_metricas(args.porta_metricas)
+
+    if not args.usuario:
+        logger.error("Informe --usuario ou UFF_USUARIO")
+        return CODIGO_SAIDA_FALHA
+    gravador = None
+    if args.reproduzir_cassete:
+        from cassete_http import ReprodutorCassete, ativar_cassete
+        ativar_cassete(ReprodutorCassete(args.reproduzir_cassete, args.escala_tempo))
+        senha = 'cassete'  # o formulário de login gravado não contém a senha
+    else:
+        senha = os.environ.get('UFF_SENHA') or getpass.getpass("Senha do portal: ")
+    if args.gravar_cassete:
+        from cassete_http import GravadorCassete, ativar_cassete
+        gravador = GravadorCassete(args.gravar_cassete, segredos=(args.usuario, senha))
+        ativar_cassete(gravador)
+
+    pool = None
+    try:
+        os.makedirs(PASTA_RELATORIOS, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        caminho_planilha = args.saida or os.path.join(PASTA_RELATORIOS, f"estatisticas_evasao_{timestamp}.xlsx")
+        base_saida = os.path.splitext(caminho_planilha)[0]
+        inicio = time.perf_counter()
+
+        # 1. Login
+        authenticator = UFFAuthenticator(args.usuario, senha)
+        if not authenticator.login():
+            logger.error("Falha no login")
+            return CODIGO_SAIDA_FALHA
+
+        # 2. Geração e download (cada worker com a sua sessão, clonada do mesmo login)
+        controlador = None
+        if args.concorrencia_adaptativa:
+            from controle_concorrencia import ControladorConcorrencia
+            controlador = ControladorConcorrencia()
+        pool = PoolSessoes(authenticator, controlador)
+        gerador = GeradorRelatorios(
+            SessaoCompartilhada(pool),
+            intervalo_verificacao=args.intervalo_polling,
+            fator_backoff=args.backoff,
+            intervalo_maximo=args.intervalo_maximo,
+            timeout_processamento=args.timeout
+        )
+        if args.descobrir_cursos:
+            from descoberta_cursos import obter_catalogo
+            catalogo = obter_catalogo(gerador.session, args.localidades or (), atualizar=args.atualizar_catalogo)
+        else:
+            catalogo = gerador.obter_cursos_predefinidos()
+        cursos = selecionar_cursos(catalogo, args.cursos)
+        if not cursos:
+            logger.error(f"Nenhum curso corresponde a {args.cursos}")
+            return CODIGO_SAIDA_FALHA
+        periodos = gerador.processar_periodos_intervalo(args.periodo_inicial, args.periodo_final)
+
+        gestor = GestorDisco(orcamento_mb=args.orcamento_disco)
+        reaproveitados = carregar_manifesto(
+            args.retomar, gestor, {curso['nome'] for curso in cursos}, set(periodos)
+        ) if args.retomar else {}
+
+        # Sem o armazém, cada relatório é consolidado assim que baixado
+        analise = AnaliseIncremental([curso['nome'] for curso in cursos]) if args.cache != 'armazem' else None
+        opcoes_geracao = {'intervalo': args.intervalo_entre, 'concorrencia': args.concorrencia}
+        if analise is not None:
+            opcoes_geracao['consumidor'] = analise.enviar
+        agendador = None
+        if args.agendador:
+            from agendador_lote import AgendadorLote
+            agendador = AgendadorLote(
+                args.concorrencia if args.concorrencia > 1 else CONCORRENCIA_AGENDADOR[0],
+                args.concorrencia_maxima,
+                prazo_janela(args.ate) if args.ate else None
+            )
+            opcoes_geracao['agendador'] = agendador
+        if args.planejamento == 'agrupado':
+            opcoes_geracao['limite_linhas'] = args.limite_linhas
+            if args.cache == 'armazem' and os.path.exists(args.banco):
+                from armazem_relatorios import ArmazemRelatorios
+                with ArmazemRelatorios(args.banco) as armazem:
+                    opcoes_geracao['estimativas'] = armazem.linhas_por_relatorio()
+        resultados_geracao = gerar_com_politica(
+            gerador, cursos, periodos,
+            planejado=args.planejamento == 'agrupado',
+            forcar=args.atualizacao == 'tudo' or bool(args.reproduzir_cassete),
+            reaproveitados=reaproveitados,
+            gestor=gestor,
+            **opcoes_geracao
+        )
+    finally:
+        if pool is not None:
+            pool.fechar()
+        # Mesmo se a execução falhar no meio, o cassete gravado até ali fica fechado e utilizável
+        if gravador is not None:
+            gravador.fechar()
+
+    caminho_manifesto = f"{base_saida}{SUFIXO_MANIFESTO}"
+    salvar_manifesto(resultados_geracao, caminho_manifesto)
+    falhas = [(curso, r.get('periodo'), r.get('error')) for curso, lista in resultados_geracao.items()
+              for r in lista if not r.get('success')]
+    tempo_geracao = time.perf_counter() - inicio
+
+    # 3. Consolidação e planilha
+    processador = ProcessadorDadosRelatorios()
+    if args.cache == 'armazem':
+        from armazem_relatorios import ArmazemRelatorios
+        with ArmazemRelatorios(args.banco) as armazem:
+            dados = processador.consolidar_do_armazem(resultados_geracao, armazem)
+    else:
+        dados = analise.dados_consolidados(resultados_geracao) or \
+            processador.consolidar_dados_todos_relatorios(resultados_geracao)
+    if not processador.gerar_planilha_consolidada(dados, caminho_planilha):
+        return CODIGO_SAIDA_FALHA
+
+    if args.formato_alunos != 'nenhum':
+        processador.exportar_dados_alunos(
+            resultados_geracao, f"{base_saida}_alunos.{args.formato_alunos}", args.formato_alunos
+        )
+
+    # Resumo
+    total = sum(len(lista) for lista in resultados_geracao.values())
+    n_reaproveitados = sum(1 for lista in resultados_geracao.values() for r in lista if r.get('origem'))
+    print(f"Relatórios: {total - len(falhas)}/{total} ok ({n_reaproveitados} reaproveitados)")
+    for curso, periodo, erro in falhas:
+        print(f"  falha: {curso} {periodo}: {erro}")
+    adiados = agendador.adiados if agendador is not None else []
+    if adiados:
+        print(f"Adiados para a próxima janela: {len(adiados)} trabalhos (use --retomar com o manifesto)")
+    print(f"Geração: {tempo_geracao:.1f}s | Total: {time.perf_counter() - inicio:.1f}s")
+    print(f"Planilha: {caminho_planilha}")
+    print(f"Manifesto: {caminho_manifesto}")
+    if args.verbose:
+        print(monitor_http.relatorio_texto())
+        if controlador is not None:
+            for limite in controlador.snapshot():
+                print(f"AIMD {limite['classe']}: limite {limite['limite']} "
+                      f"({limite['sucessos']} ok, {limite['erros']} erros, {limite['reducoes']} reduções)")
+        if agendador is not None:
+            estado = agendador.snapshot()
+            print(f"Agendador: limite final {estado['limite']}, {estado['concluidos']} trabalhos, "
+                  f"{estado['falhas']} com falha, duração mediana {estado['duracao_mediana_s']}s")
+
+    return CODIGO_SAIDA_PARCIAL if falhas or adiados else 0
+
+
+def main():
+    args = criar_parser().parse_args()
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+        handlers=[logging.StreamHandler(), logging.FileHandler(LOG_FILE, encoding='utf-8')]
+    )
+    sys.exit(executar(args))
+
+
+if __name__ == "__main__":
+    main()
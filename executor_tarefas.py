@@ -0,0 +1,161 @@
+"""
+executor_tarefas.py - Execução de lotes em segundo plano, fora da thread do Streamlit
+
+A geração e o processamento dos relatórios rodam em threads de um pool
+compartilhado pelo processo. A interface apenas consulta o progresso da
+tarefa a cada rerun, de modo que o lote continua mesmo se a página for
+recarregada, e vários usuários podem executar lotes ao mesmo tempo.
+"""
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from config import MAX_TAREFAS_SIMULTANEAS, RETENCAO_TAREFAS
+
+logger = logging.getLogger(__name__)
+
+PENDENTE = 'PENDENTE'
+EXECUTANDO = 'EXECUTANDO'
+CONCLUIDA = 'CONCLUIDA'
+ERRO = 'ERRO'
+CANCELADA = 'CANCELADA'
+ESTADOS_ATIVOS = (PENDENTE, EXECUTANDO)
+
+
+class Tarefa:
+    """Estado compartilhado entre a thread de trabalho e a interface"""
+
+    def __init__(self, tarefa_id: str, usuario: str, tipo: str, parametros: Optional[Dict] = None):
+        self.tarefa_id = tarefa_id
+        self.usuario = usuario
+        self.tipo = tipo
+        self.parametros = parametros or {}
+        self.estado = PENDENTE
+        self.total = 0
+        self.concluidos = 0
+        self.mensagem = ''
+        self.parcial = None
+        self.resultado = None
+        self.erro = None
+        self.criada_em = time.time()
+        self.finalizada_em = None
+        self._cancelar = threading.Event()
+        self._lock = threading.Lock()
+
+    def atualizar(self, concluidos: Optional[int] = None, total: Optional[int] = None,
+                  mensagem: Optional[str] = None, parcial: Any = None):
+        """Chamado pela thread de trabalho para publicar o progresso"""
+        with self._lock:
+            if concluidos is not None:
+                self.concluidos = concluidos
+            if total is not None:
+                self.total = total
+            if mensagem is not None:
+                self.mensagem = mensagem
+            if parcial is not None:
+                self.parcial = parcial
+
+    @property
+    def cancelamento_solicitado(self) -> bool:
+        return self._cancelar.is_set()
+
+    @property
+    def ativa(self) -> bool:
+        return self.estado in ESTADOS_ATIVOS
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    def progresso(self) -> float:
+        with self._lock:
+            return min(1.0, self.concluidos / self.total) if self.total else 0.0
+
+    def snapshot(self) -> Dict:
+        """Cópia consistente do estado para exibição"""
+        with self._lock:
+            return {
+                'tarefa_id': self.tarefa_id,
+                'usuario': self.usuario,
+                'tipo': self.tipo,
+                'estado': self.estado,
+                'total': self.total,
+                'concluidos': self.concluidos,
+                'mensagem': self.mensagem,
+                'erro': self.erro,
+                'decorrido_s': round((self.finalizada_em or time.time()) - self.criada_em, 1)
+            }
+
+
+class ExecutorTarefas:
+    """Pool de threads com registro das tarefas por id e por usuário"""
+
+    def __init__(self, max_workers: int = MAX_TAREFAS_SIMULTANEAS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tarefa')
+        self._tarefas = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submeter(self, usuario: str, tipo: str, funcao: Callable, *args,
+                 parametros: Optional[Dict] = None, **kwargs) -> Tarefa:
+        """Agenda funcao(tarefa, *args, **kwargs); o retorno vira tarefa.resultado"""
+        self._remover_antigas()
+        tarefa = Tarefa(f"{tipo}-{next(self._ids)}", usuario, tipo, parametros)
+        with self._lock:
+            self._tarefas[tarefa.tarefa_id] = tarefa
+        self._pool.submit(self._executar, tarefa, funcao, args, kwargs)
+        logger.info(f"Tarefa {tarefa.tarefa_id} agendada para {usuario}")
+        return tarefa
+
+    def _executar(self, tarefa: Tarefa, funcao: Callable, args, kwargs):
+        tarefa.estado = EXECUTANDO
+        try:
+            tarefa.resultado = funcao(tarefa, *args, **kwargs)
+            tarefa.estado = CANCELADA if tarefa.cancelamento_solicitado else CONCLUIDA
+        except Exception as e:
+            logger.error(f"Erro na tarefa {tarefa.tarefa_id}: {str(e)}")
+            tarefa.erro = str(e)
+            tarefa.estado = ERRO
+        finally:
+            tarefa.finalizada_em = time.time()
+            logger.info(f"Tarefa {tarefa.tarefa_id} finalizada: {tarefa.estado}")
+
+    def obter(self, tarefa_id: Optional[str]) -> Optional[Tarefa]:
+        if not tarefa_id:
+            return None
+        with self._lock:
+            return self._tarefas.get(tarefa_id)
+
+    def tarefas_do_usuario(self, usuario: str, tipo: Optional[str] = None) -> List[Tarefa]:
+        """Tarefas do usuário, da mais recente para a mais antiga"""
+        with self._lock:
+            tarefas = [t for t in self._tarefas.values()
+                       if t.usuario == usuario and (tipo is None or t.tipo == tipo)]
+        return sorted(tarefas, key=lambda t: t.criada_em, reverse=True)
+
+    def tarefa_ativa(self, usuario: str, tipo: Optional[str] = None) -> Optional[Tarefa]:
+        for tarefa in self.tarefas_do_usuario(usuario, tipo):
+            if tarefa.ativa:
+                return tarefa
+        return None
+
+    def cancelar(self, tarefa_id: str) -> bool:
+        tarefa = self.obter(tarefa_id)
+        if tarefa is None or not tarefa.ativa:
+            return False
+        tarefa.cancelar()
+        return True
+
+    def _remover_antigas(self):
+        """Descarta tarefas finalizadas há mais de RETENCAO_TAREFAS segundos"""
+        limite = time.time() - RETENCAO_TAREFAS
+        with self._lock:
+            for tarefa_id in [i for i, t in self._tarefas.items()
+                              if t.finalizada_em and t.finalizada_em < limite]:
+                del self._tarefas[tarefa_id]
+
+
+# Executor compartilhado pelo processo (sobrevive aos reruns do Streamlit)
+executor_tarefas = ExecutorTarefas()
@@ -0,0 +1,157 @@
+"""
+exportador_alunos.py - Exportação em streaming das linhas de alunos de todos os relatórios
+
+Os relatórios são lidos um de cada vez com o openpyxl em modo read_only e as
+linhas são gravadas à medida que chegam (xlsxwriter em constant_memory ou
+CSV), de modo que o pico de memória não cresce com o número de coortes.
+"""
+import csv
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import openpyxl
+import xlsxwriter
+
+from escritor_planilha import FORMATO_CABECALHO
+
+logger = logging.getLogger(__name__)
+
+FORMATOS_EXPORTACAO = ('xlsx', 'csv')
+COLUNAS_ORIGEM = ['Curso', 'Período']
+NOME_ABA_ALUNOS = 'ALUNOS'
+# Limite de linhas por aba do Excel (incluindo o cabeçalho)
+MAX_LINHAS_ABA = 1048576
+
+
+def iterar_relatorios(resultados_geracao: Dict) -> Iterator[Tuple[str, str, str]]:
+    """Percorre (curso, período, caminho) dos relatórios baixados com sucesso (restaurando os comprimidos)"""
+    from gestor_disco import caminho_disponivel
+
+    for curso_nome, resultados_curso in resultados_geracao.items():
+        for resultado in resultados_curso:
+            caminho = resultado.get('success') and caminho_disponivel(resultado.get('caminho_arquivo'))
+            if caminho:
+                yield curso_nome, resultado.get('periodo', ''), caminho
+
+
+def _abrir_relatorio(caminho: str):
+    return openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+
+
+def ler_cabecalho(caminho: str) -> List[str]:
+    """Lê apenas a primeira linha de um relatório"""
+    workbook = _abrir_relatorio(caminho)
+    try:
+        for linha in workbook.active.iter_rows(max_row=1, values_only=True):
+            return [str(valor) if valor is not None else '' for valor in linha]
+        return []
+    finally:
+        workbook.close()
+
+
+def iterar_linhas(caminho: str, cabecalho_saida: List[str]) -> Iterator[List]:
+    """Percorre as linhas de dados de um relatório, reordenadas para o cabeçalho de saída"""
+    workbook = _abrir_relatorio(caminho)
+    try:
+        linhas = workbook.active.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        posicoes = {str(nome): i for i, nome in enumerate(cabecalho) if nome is not None}
+        indices = [posicoes.get(coluna) for coluna in cabecalho_saida]
+
+        for linha in linhas:
+            if not any(valor is not None for valor in linha):
+                continue
+            yield [linha[i] if i is not None and i < len(linha) else None for i in indices]
+    finally:
+        workbook.close()
+
+
+class ExportadorAlunos:
+    """Grava as linhas de alunos de vários relatórios em um único arquivo, em streaming"""
+
+    def __init__(self, caminho_saida: str, formato: Optional[str] = None):
+        self.caminho_saida = caminho_saida
+        self.formato = formato or os.path.splitext(caminho_saida)[1].lstrip('.').lower()
+        if self.formato not in FORMATOS_EXPORTACAO:
+            raise ValueError(f"Formato de exportação não suportado: {self.formato}")
+        self.total_linhas = 0
+
+    def _montar_cabecalho(self, relatorios: List[Tuple[str, str, str]]) -> List[str]:
+        """União ordenada das colunas de todos os relatórios (lê só a primeira linha de cada)"""
+        colunas = []
+        vistas = set()
+        for _, _, caminho in relatorios:
+            for coluna in ler_cabecalho(caminho):
+                if coluna and coluna not in vistas:
+                    vistas.add(coluna)
+                    colunas.append(coluna)
+        return colunas
+
+    def exportar(self, relatorios: List[Tuple[str, str, str]]) -> int:
+        """Exporta os relatórios (curso, período, caminho) e retorna o total de linhas"""
+        colunas = self._montar_cabecalho(relatorios)
+        pasta = os.path.dirname(self.caminho_saida)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        if self.formato == 'csv':
+            self._exportar_csv(relatorios, colunas)
+        else:
+            self._exportar_xlsx(relatorios, colunas)
+
+        logger.info(f"Exportação de alunos concluída: {self.caminho_saida} "
+                    f"({self.total_linhas} linhas de {len(relatorios)} relatórios)")
+        return self.total_linhas
+
+    def _linhas(self, relatorios, colunas):
+        for curso, periodo, caminho in relatorios:
+            periodo_display = f"{periodo[:4]}/{periodo[4:]}" if len(periodo) == 5 else periodo
+            logger.info(f"Exportando alunos: {os.path.basename(caminho)}")
+            for linha in iterar_linhas(caminho, colunas):
+                yield [curso, periodo_display] + linha
+
+    def _exportar_csv(self, relatorios, colunas):
+        with open(self.caminho_saida, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(COLUNAS_ORIGEM + colunas)
+            for linha in self._linhas(relatorios, colunas):
+                writer.writerow(['' if valor is None else valor for valor in linha])
+                self.total_linhas += 1
+
+    def _exportar_xlsx(self, relatorios, colunas):
+        workbook = xlsxwriter.Workbook(self.caminho_saida, {
+            'constant_memory': True,
+            'default_date_format': 'dd/mm/yyyy'
+        })
+        try:
+            formato_cabecalho = workbook.add_format(FORMATO_CABECALHO)
+            cabecalho = COLUNAS_ORIGEM + colunas
+            worksheet = None
+            linha_atual = MAX_LINHAS_ABA
+
+            for linha in self._linhas(relatorios, colunas):
+                # Abrir nova aba quando a atual atingir o limite do Excel
+                if linha_atual >= MAX_LINHAS_ABA:
+                    numero_aba = len(workbook.worksheets()) + 1
+                    nome_aba = NOME_ABA_ALUNOS if numero_aba == 1 else f"{NOME_ABA_ALUNOS} ({numero_aba})"
+                    worksheet = workbook.add_worksheet(nome_aba)
+                    worksheet.write_row(0, 0, cabecalho, formato_cabecalho)
+                    linha_atual = 1
+                worksheet.write_row(linha_atual, 0, linha)
+                linha_atual += 1
+                self.total_linhas += 1
+
+            if worksheet is None:
+                workbook.add_worksheet(NOME_ABA_ALUNOS).write_row(0, 0, cabecalho, formato_cabecalho)
+        finally:
+            workbook.close()
+
+
+def exportar_alunos(resultados_geracao: Dict, caminho_saida: str,
+                    formato: Optional[str] = None) -> int:
+    """Exporta as linhas de alunos de todos os relatórios baixados com sucesso"""
+    relatorios = list(iterar_relatorios(resultados_geracao))
+    return ExportadorAlunos(caminho_saida, formato).exportar(relatorios)
@@ -2,12 +2,14 @@
 formulario_handler.py - Manipulação de formulários do sistema
 """
 import requests
-from bs4 import BeautifulSoup
 import re
 import logging
 from urllib.parse import urljoin
 from config import *
 from utils import *
+from metricas import FALHAS
+from rastreamento import definir_atributos, rastrear
+from registros import SubmissaoFormulario
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +20,7 @@ class FormularioHandler:
         self.session = session
         self.base_url = APLICACAO_URL
     
+    @rastrear('formulario.acessar_pagina_listagem')
     def acessar_pagina_listagem(self):
         """Acessa a página de listagem de alunos"""
         try:
@@ -25,7 +28,7 @@ class FormularioHandler:
             response.raise_for_status()
             
             # Verificar se estamos na página correta
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = criar_soup(response.text)
             if 'Listagem de Alunos' not in soup.text:
                 raise Exception("Não está na página de listagem de alunos")
             
@@ -117,8 +120,9 @@ class FormularioHandler:
         
         return dados_formulario
     
+    @rastrear('formulario.submeter')
     def submeter_formulario(self, dados_formulario, action_url):
-        """Submete o formulário e retorna a resposta"""
+        """Submete o formulário e retorna uma SubmissaoFormulario (o HTML da resposta não é guardado)"""
         try:
             # Construir URL completa
             if not action_url.startswith('http'):
@@ -137,7 +141,7 @@ class FormularioHandler:
             response.raise_for_status()
             
             # Verificar se a submissão foi bem-sucedida
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = criar_soup(response.text)
             
             # Verificar mensagens de sucesso
             alert_success = soup.find('div', class_='alert-success')
@@ -148,55 +152,40 @@ class FormularioHandler:
                 relatorio_id = self._extrair_id_relatorio(response.url)
                 if relatorio_id:
                     logger.info(f"ID do relatório detectado: {relatorio_id}")
-                    return {
-                        'success': True,
-                        'relatorio_id': relatorio_id,
-                        'url_relatorio': response.url,
-                        'html': response.text
-                    }
+                    return SubmissaoFormulario(True, relatorio_id, response.url)
             
             # Verificar erros
             alert_error = soup.find('div', class_='alert-error') or soup.find('div', class_='alert-danger')
             if alert_error:
                 error_msg = alert_error.get_text(strip=True)[:200]
                 logger.error(f"Erro no formulário: {error_msg}")
-                return {
-                    'success': False,
-                    'error': error_msg,
-                    'html': response.text
-                }
+                return SubmissaoFormulario(False, error=error_msg)
             
             # Verificar se foi redirecionado para página de relatório
             if '/relatorios/' in response.url and response.url != action_url:
                 relatorio_id = self._extrair_id_relatorio(response.url)
-                return {
-                    'success': True,
-                    'relatorio_id': relatorio_id,
-                    'url_relatorio': response.url,
-                    'html': response.text
-                }
+                return SubmissaoFormulario(True, relatorio_id, response.url)
             
             logger.warning("Não foi possível determinar o resultado da submissão")
-            return {
-                'success': False,
-                'error': 'Resultado indeterminado',
-                'html': response.text
-            }
+            return SubmissaoFormulario(False, error='Resultado indeterminado')
             
         except Exception as e:
             logger.error(f"Erro ao submeter formulário: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            FALHAS.inc(etapa='submissao')
+            return SubmissaoFormulario(False, error=str(e))
     
     def _extrair_id_relatorio(self, url):
         """Extrai o ID do relatório da URL"""
         match = re.search(r'/relatorios/(\d+)', url)
         return match.group(1) if match else None
     
+    @rastrear('formulario.gerar_relatorio')
     def gerar_relatorio(self, filtros):
         """Fluxo completo para gerar um relatório"""
+        definir_atributos(
+            curso=filtros.get('iddesdobramento') or filtros.get('idcurso'),
+            periodo=filtros.get('anosem_ingresso')
+        )
         try:
             # 1. Acessar página de listagem
             logger.info("Acessando página de listagem de alunos...")
@@ -213,12 +202,10 @@ class FormularioHandler:
             # 4. Submeter formulário
             logger.info("Submetendo formulário...")
             resultado = self.submeter_formulario(dados_formulario, parametros['action'])
+            definir_atributos(relatorio_id=resultado.get('relatorio_id'), sucesso=resultado.get('success'))
             
             return resultado
             
         except Exception as e:
             logger.error(f"Erro no fluxo de geração: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            return SubmissaoFormulario(False, error=str(e))
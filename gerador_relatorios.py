@@ -3,17 +3,20 @@
 gerador_relatorios.py - Módulo para geração automatizada de relatórios
 """
 import logging
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-import pandas as pd
 import requests
-from bs4 import BeautifulSoup
 import re
 
 from config import *
 from formulario_handler import FormularioHandler
+from metricas import FALHAS, FILA_RELATORIOS, PARSE_DURACAO
+from rastreamento import definir_atributos, rastrear, span
+from registros import FiltrosRelatorio, ResultadoRelatorio
 from relatorio_automator import RelatorioUFFAutomator
 from utils import *
 
@@ -22,11 +25,21 @@ logger = logging.getLogger(__name__)
 class GeradorRelatorios:
     """Classe para gerar relatórios em lote para múltiplos cursos e períodos"""
     
-    def __init__(self, session):
+    def __init__(self, session, intervalo_verificacao=INTERVALO_VERIFICACAO, fator_backoff=1.0,
+                 intervalo_maximo=None, timeout_processamento=1800):
         self.session = session
         self.form_handler = FormularioHandler(session)
         self.rel_automator = RelatorioUFFAutomator(session)
         self.resultados = {}
+        
+        # Estratégia de polling do status de cada relatório
+        self.intervalo_verificacao = intervalo_verificacao
+        self.fator_backoff = fator_backoff
+        self.intervalo_maximo = intervalo_maximo
+        self.timeout_processamento = timeout_processamento
+        
+        # Depois de uma sessão expirada, os relatórios restantes falham sem ir ao portal
+        self.sessao_expirada = False
     
     def obter_desdobramentos_curso(self, curso_id, localidade_id='1'):
         """Obtém os desdobramentos disponíveis para um curso"""
@@ -35,7 +48,7 @@ class GeradorRelatorios:
             response = self.session.get(url, timeout=TIMEOUT_REQUESTS)
             
             # Primeiro, obter cursos disponíveis para a localidade
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = criar_soup(response.text)
             
             # Construir dados para buscar desdobramentos via AJAX
             dados_curso = {
@@ -67,7 +80,7 @@ class GeradorRelatorios:
                         return dados.get('desdobramentos', [])
                 except:
                     # Se não for JSON, tentar parsear HTML
-                    soup_desdob = BeautifulSoup(response.text, 'html.parser')
+                    soup_desdob = criar_soup(response.text)
                     options = soup_desdob.find_all('option')
                     desdobramentos = []
                     for option in options:
@@ -97,102 +110,271 @@ class GeradorRelatorios:
         return ''
     
     def criar_filtros_para_curso(self, curso_config, periodo, forma_ingresso):
-        """Cria dicionário de filtros para um curso específico"""
-        filtros = {
-            'idlocalidade': '1',  # Niterói
-            'idcurso': curso_config['codigo_curso'],
-            'iddesdobramento': curso_config['codigo_desdobramento'],
-            'idturno': '',  # Todos os turnos
-            'idstatusaluno': '',  # Todos os status
-            'idsituacaoaluno': '',  # Todas as situações
-            'idformaingresso': forma_ingresso,
-            'idacaoafirmativa': '',  # Todas as modalidades
-            'anosem_ingresso': periodo,
-            'anosem_desvinculacao': '',  # Não filtrar por desvinculação
-            'format': 'xls'  # Formato XLSX
-        }
-        return filtros
+        """Cria os filtros (FiltrosRelatorio) para um curso específico
+        
+        Localidade do curso (cursos descobertos) ou '1' (Niterói); turno,
+        status, situação, ação afirmativa e desvinculação em branco (todos);
+        formato XLSX.
+        """
+        return FiltrosRelatorio(
+            idlocalidade=curso_config.get('localidade', '1'),
+            idcurso=curso_config['codigo_curso'],
+            iddesdobramento=curso_config['codigo_desdobramento'],
+            idformaingresso=forma_ingresso,
+            anosem_ingresso=periodo
+        )
+    
+    def _executar_consulta(self, filtros):
+        """Submete os filtros, aguarda o processamento e baixa o arquivo
+        
+        Retorna (relatorio_id, caminho_arquivo, status_info, erro). Um
+        relatório que falha no servidor é submetido de novo até
+        TENTATIVAS_RESSUBMISSAO vezes; uma sessão expirada é renovada (se a
+        sessão for um pool, até TENTATIVAS_REAUTENTICACAO vezes, sem gastar
+        as ressubmissões) ou encerra na hora.
+        """
+        relatorio_id, status_info = None, None
+        ressubmissoes, reautenticacoes = 0, 0
+        while True:
+            if self.sessao_expirada:
+                return relatorio_id, None, status_info, "Sessão expirada; faça login novamente"
+            
+            resultado = self.form_handler.gerar_relatorio(filtros)
+            relatorio_id = resultado.get('relatorio_id')
+            if not (resultado.get('success') and relatorio_id):
+                return relatorio_id, None, None, resultado.get('error', 'Erro desconhecido')
+            
+            # Monitorar processamento
+            status_info = self.rel_automator.aguardar_conclusao(
+                relatorio_id=relatorio_id,
+                callback_progresso=self._callback_progresso,
+                intervalo=self.intervalo_verificacao,
+                timeout=self.timeout_processamento,
+                fator_backoff=self.fator_backoff,
+                intervalo_maximo=self.intervalo_maximo
+            )
+            
+            if status_info is None:
+                return relatorio_id, None, None, f"Timeout após {self.timeout_processamento}s"
+            if status_info.get('status') == 'PRONTO':
+                # Baixar relatório
+                caminho_arquivo = self.rel_automator.baixar_relatorio(status_info)
+                if caminho_arquivo:
+                    return relatorio_id, caminho_arquivo, status_info, None
+                return relatorio_id, None, status_info, "Falha no download do relatório"
+            if status_info.get('status') == 'SESSAO_EXPIRADA':
+                if reautenticacoes >= TENTATIVAS_REAUTENTICACAO or not self._reautenticar():
+                    self.sessao_expirada = True
+                reautenticacoes += 1
+                continue
+            
+            if ressubmissoes >= TENTATIVAS_RESSUBMISSAO:
+                break
+            ressubmissoes += 1
+            logger.warning(f"Relatório #{relatorio_id} falhou ({status_info.get('erro')}); submetendo novamente")
+        
+        return relatorio_id, None, status_info, status_info.get('erro', 'Erro desconhecido')
+    
+    def _reautenticar(self):
+        """Renova o login quando a sessão é uma SessaoCompartilhada (pool_sessoes)"""
+        reautenticar = getattr(self.session, 'reautenticar', None)
+        return reautenticar is not None and reautenticar()
     
+    @rastrear('gerador.gerar_relatorio_individual', argumentos=('periodo', 'forma_ingresso'))
     def gerar_relatorio_individual(self, curso_config, periodo, forma_ingresso):
         """Gera um relatório individual para curso/período específico"""
+        definir_atributos(curso=curso_config['nome'])
         logger.info(f"Gerando relatório: {curso_config['nome']} - Período {periodo}")
         
         try:
             # Criar filtros
             filtros = self.criar_filtros_para_curso(curso_config, periodo, forma_ingresso)
+            relatorio_id, caminho_arquivo, status_info, erro = self._executar_consulta(filtros)
             
-            # Gerar relatório usando FormularioHandler
-            resultado = self.form_handler.gerar_relatorio(filtros)
-            
-            if resultado.get('success') and resultado.get('relatorio_id'):
-                relatorio_id = resultado['relatorio_id']
-                
-                # Monitorar processamento
-                status_info = self.rel_automator.aguardar_conclusao(
+            if caminho_arquivo:
+                # Só o resumo do status fica no resultado (etapas, detalhes e filtros são descartados)
+                return ResultadoRelatorio(
+                    True, curso_config['nome'], periodo,
                     relatorio_id=relatorio_id,
-                    callback_progresso=self._callback_progresso,
-                    timeout=1800  # 30 minutos
+                    caminho_arquivo=caminho_arquivo,
+                    status_info=status_info.resumo()
                 )
-                
-                if status_info and status_info.get('status') == 'PRONTO':
-                    # Baixar relatório
-                    caminho_arquivo = self.rel_automator.baixar_relatorio(status_info)
-                    
-                    if caminho_arquivo:
-                        return {
-                            'success': True,
-                            'relatorio_id': relatorio_id,
-                            'caminho_arquivo': caminho_arquivo,
-                            'status_info': status_info,
-                            'curso': curso_config['nome'],
-                            'periodo': periodo
-                        }
             
-            return {
-                'success': False,
-                'error': resultado.get('error', 'Erro desconhecido'),
-                'curso': curso_config['nome'],
-                'periodo': periodo
-            }
+            return ResultadoRelatorio(False, curso_config['nome'], periodo, error=erro)
             
         except Exception as e:
             logger.error(f"Erro ao gerar relatório: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'curso': curso_config['nome'],
-                'periodo': periodo
-            }
+            return ResultadoRelatorio(False, curso_config['nome'], periodo, error=str(e))
+    
+    @rastrear('gerador.gerar_consulta_agrupada')
+    def gerar_consulta_agrupada(self, consulta, limite_linhas=LIMITE_LINHAS_CONSULTA):
+        """Gera uma consulta do planejador e devolve um resultado por curso × período
+        
+        Consultas amplas são baixadas uma vez e separadas localmente; se a
+        consulta falhar, não puder ser separada ou atingir o limite de linhas,
+        os pares são gerados com relatórios estreitos.
+        """
+        from planejador_consultas import CONSULTA_ESTREITA, filtros_consulta, particionar_relatorio
+        
+        definir_atributos(tipo=consulta['tipo'], codigo_curso=consulta['codigo_curso'])
+        pares = [(curso, periodo) for curso in consulta['cursos'] for periodo in consulta['periodos']]
+        
+        if consulta['tipo'] != CONSULTA_ESTREITA:
+            try:
+                relatorio_id, caminho_arquivo, status_info, erro = self._executar_consulta(filtros_consulta(consulta))
+                if caminho_arquivo:
+                    import pandas as pd
+                    
+                    df = pd.read_excel(caminho_arquivo)
+                    if len(df) >= limite_linhas:
+                        raise ValueError(f"{len(df)} linhas atingem o limite de {limite_linhas}")
+                    partes = particionar_relatorio(df, consulta)
+                    return [
+                        self._salvar_parte(partes[(curso['nome'], periodo)], curso, periodo, relatorio_id, caminho_arquivo)
+                        for curso, periodo in pares
+                    ]
+            except Exception as e:
+                erro = str(e)
+            logger.warning(f"Consulta {consulta['tipo']} do curso {consulta['codigo_curso']} "
+                           f"substituída por {len(pares)} relatórios estreitos: {erro}")
+            FALHAS.inc(etapa='consulta_agrupada')
+        
+        return [self.gerar_relatorio_individual(curso, periodo, self._determinar_forma_ingresso(periodo))
+                for curso, periodo in pares]
+    
+    def _salvar_parte(self, df, curso_config, periodo, relatorio_id, caminho_origem):
+        """Grava as linhas de um curso × período de uma consulta ampla como relatório próprio"""
+        nome = sanitizar_nome_arquivo(f"{curso_config['nome']}_{periodo}_{relatorio_id}.xlsx")
+        caminho_arquivo = os.path.join(os.path.dirname(caminho_origem), nome)
+        df.to_excel(caminho_arquivo, index=False, engine='xlsxwriter')
+        return ResultadoRelatorio(
+            True, curso_config['nome'], periodo,
+            relatorio_id=relatorio_id,
+            caminho_arquivo=caminho_arquivo,
+            consulta_origem=caminho_origem
+        )
     
     def _callback_progresso(self, progresso, mensagem, concluido):
         """Callback para atualização de progresso"""
         logger.info(f"Progresso: {progresso:.1%} - {mensagem}")
     
-    def gerar_relatorios_em_lote(self, cursos, periodos):
-        """Gera relatórios para todos os cursos e períodos especificados"""
-        logger.info(f"Iniciando geração em lote: {len(cursos)} cursos × {len(periodos)} períodos")
-        
-        resultados = {}
+    def _executar_trabalhos(self, cursos, trabalhos, total, tarefa, intervalo, concorrencia, consumidor=None,
+                            agendador=None):
+        """Executa (mensagem, função que retorna resultados) sequencialmente ou em paralelo
+
+        `consumidor`, se informado, recebe cada resultado logo após o download
+        (ex.: AnaliseIncremental.enviar), enquanto os demais seguem na fila.
+        Com um `agendador` (agendador_lote.AgendadorLote), o número de
+        trabalhos simultâneos é dele, e não de `concorrencia`.
+        """
+        resultados = {curso['nome']: [] for curso in cursos}
+        concluidos = 0
+        lock = threading.Lock()
+        FILA_RELATORIOS.set(total)
+        if tarefa is not None:
+            tarefa.atualizar(concluidos=0, total=total, parcial=resultados)
         
-        for curso in cursos:
-            resultados_curso = []
+        def executar(mensagem, funcao):
+            nonlocal concluidos
+            if tarefa is not None:
+                if tarefa.cancelamento_solicitado:
+                    return []
+                tarefa.atualizar(mensagem=mensagem)
             
-            for periodo in periodos:
-                # Determinar forma de ingresso baseada no semestre
-                forma_ingresso = self._determinar_forma_ingresso(periodo)
-                
-                # Gerar relatório
-                resultado = self.gerar_relatorio_individual(curso, periodo, forma_ingresso)
-                resultados_curso.append(resultado)
-                
-                # Aguardar entre requisições para não sobrecarregar o servidor
-                time.sleep(5)
+            novos = funcao()
+            
+            with lock:
+                for resultado in novos:
+                    resultados[resultado['curso']].append(resultado)
+                concluidos += len(novos)
+                FILA_RELATORIOS.set(total - concluidos)
+                if tarefa is not None:
+                    tarefa.atualizar(concluidos=concluidos)
+            for resultado in novos:
+                if not resultado.get('success'):
+                    FALHAS.inc(etapa='relatorio')
+                elif consumidor is not None:
+                    consumidor(resultado)
             
-            resultados[curso['nome']] = resultados_curso
+            # Aguardar entre requisições para não sobrecarregar o servidor
+            time.sleep(intervalo)
+            return novos
+        
+        if agendador is not None:
+            agendador.executar(trabalhos, executar)
+        elif concorrencia <= 1:
+            for mensagem, funcao in trabalhos:
+                executar(mensagem, funcao)
+        else:
+            with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix='relatorio') as pool:
+                list(pool.map(lambda trabalho: executar(*trabalho), trabalhos))
+        for resultados_curso in resultados.values():
+            resultados_curso.sort(key=lambda resultado: resultado.get('periodo', ''))
+        
+        if tarefa is not None and tarefa.cancelamento_solicitado:
+            logger.info("Geração em lote cancelada")
         
         self.resultados = resultados
         return resultados
     
+    def gerar_relatorios_em_lote(self, cursos, periodos, tarefa=None, intervalo=5, concorrencia=1,
+                                 ignorar=(), consumidor=None, agendador=None):
+        """Gera relatórios para todos os cursos e períodos especificados
+        
+        Com uma tarefa (executor_tarefas.Tarefa), publica o progresso e os
+        resultados parciais e interrompe o lote se o cancelamento for solicitado.
+        Com concorrencia > 1, até `concorrencia` relatórios são submetidos e
+        monitorados ao mesmo tempo, cada thread com a sua sessão (com uma
+        SessaoCompartilhada, todas do mesmo login). Pares
+        (nome do curso, período) em `ignorar` não são gerados. `consumidor`
+        recebe cada resultado assim que o relatório é baixado. `agendador`
+        (AgendadorLote) substitui `concorrencia` por um limite adaptativo.
+        """
+        logger.info(f"Iniciando geração em lote: {len(cursos)} cursos × {len(periodos)} períodos")
+        
+        trabalhos = [
+            (f"Curso: {curso['nome']} - Período: {periodo[:4]}/{periodo[4:]}",
+             lambda curso=curso, periodo=periodo: [
+                 self.gerar_relatorio_individual(curso, periodo, self._determinar_forma_ingresso(periodo))
+             ])
+            for curso in cursos for periodo in periodos
+            if (curso['nome'], periodo) not in ignorar
+        ]
+        return self._executar_trabalhos(cursos, trabalhos, len(trabalhos), tarefa, intervalo, concorrencia,
+                                        consumidor, agendador)
+    
+    def gerar_relatorios_planejados(self, cursos, periodos, tarefa=None, intervalo=5, concorrencia=1,
+                                    ignorar=(), limite_linhas=LIMITE_LINHAS_CONSULTA, estimativas=None,
+                                    consumidor=None, agendador=None):
+        """Como gerar_relatorios_em_lote, mas com as consultas agrupadas pelo planejador"""
+        from planejador_consultas import CONSULTA_ESTREITA, planejar_consultas
+        
+        faltantes = [(curso, periodo) for curso in cursos for periodo in periodos
+                     if (curso['nome'], periodo) not in ignorar]
+        cursos_faltantes = [curso for curso in cursos if any(c is curso for c, _ in faltantes)]
+        periodos_faltantes = sorted({periodo for _, periodo in faltantes})
+        
+        trabalhos = []
+        for consulta in planejar_consultas(cursos_faltantes, periodos_faltantes, limite_linhas, estimativas):
+            if consulta['tipo'] == CONSULTA_ESTREITA and \
+                    (consulta['cursos'][0]['nome'], consulta['periodos'][0]) in ignorar:
+                continue
+            
+            def gerar(consulta=consulta):
+                return [resultado for resultado in self.gerar_consulta_agrupada(consulta, limite_linhas)
+                        if (resultado['curso'], resultado['periodo']) not in ignorar]
+            
+            periodos_consulta = consulta['periodos']
+            trabalhos.append((
+                f"Consulta {consulta['tipo']}: curso {consulta['codigo_curso']} - "
+                f"{periodos_consulta[0]}..{periodos_consulta[-1]}",
+                gerar
+            ))
+        
+        logger.info(f"{len(trabalhos)} consultas planejadas para {len(faltantes)} relatórios")
+        return self._executar_trabalhos(cursos, trabalhos, len(faltantes), tarefa, intervalo, concorrencia,
+                                        consumidor, agendador)
+    
     def _determinar_forma_ingresso(self, periodo):
         """Determina a forma de ingresso baseada no semestre do período"""
         # Extrair semestre do período (ex: "20251" → semestre 1)
@@ -254,373 +436,210 @@ class GeradorRelatorios:
 
 
 class ProcessadorDadosRelatorios:
-    """Classe para processar e analisar dados dos relatórios baixados"""
+    """Classe para processar e analisar dados dos relatórios baixados
+    
+    pandas e os módulos de consolidação/escrita são importados nos métodos,
+    para que o login e a geração não paguem esse custo de importação.
+    """
     
     def __init__(self, pasta_relatorios=PASTA_RELATORIOS):
         self.pasta_relatorios = pasta_relatorios
     
+    @rastrear('processador.ler_relatorio_excel', argumentos=('caminho_arquivo',))
     def ler_relatorio_excel(self, caminho_arquivo):
         """Lê um arquivo Excel e retorna DataFrame"""
         try:
+            import pandas as pd
+            from gestor_disco import caminho_disponivel
+            
+            caminho_arquivo = caminho_disponivel(caminho_arquivo) or caminho_arquivo
+            inicio = time.time()
             df = pd.read_excel(caminho_arquivo)
+            PARSE_DURACAO.observar(time.time() - inicio)
+            definir_atributos(bytes=os.path.getsize(caminho_arquivo), linhas=len(df))
             logger.info(f"Arquivo lido: {len(df)} linhas, {len(df.columns)} colunas")
             return df
         except Exception as e:
             logger.error(f"Erro ao ler arquivo Excel: {str(e)}")
+            FALHAS.inc(etapa='leitura')
             return None
     
+    @rastrear('processador.extrair_dados_relatorio', argumentos=('curso', 'periodo'))
     def extrair_dados_relatorio(self, df, curso, periodo):
         """Extrai e processa dados do relatório"""
         if df is None or df.empty:
             return None
         
+        from consolidacao import (
+            CATEGORIAS_ATIVAS, DIMENSAO_CANCELAMENTO, DIMENSAO_MODALIDADE, DIMENSAO_SITUACAO,
+            contar_relatorio
+        )
+        
+        contagens = contar_relatorio(df, curso, periodo)
+        por_dimensao = {
+            dimensao: dict(zip(grupo['categoria'], grupo['quantidade']))
+            for dimensao, grupo in contagens.groupby('dimensao', sort=False)
+        }
+        total = len(df)
+        
+        def com_percentual(categorias, base):
+            return {
+                categoria: {
+                    'quantidade': int(valor),
+                    'percentual': round(valor / base * 100, 2) if base > 0 else 0
+                }
+                for categoria, valor in categorias.items()
+            }
+        
+        situacoes = por_dimensao.get(DIMENSAO_SITUACAO, {})
         dados = {
             'curso': curso,
             'periodo': periodo,
-            'total_registros': len(df),
-            'categorias': {}
+            'total_registros': total,
+            'categorias': com_percentual(situacoes, total),
+            'matriculas_ativas': int(sum(situacoes.get(cat, 0) for cat in CATEGORIAS_ATIVAS))
         }
         
-        # Mapeamento de situações
-        situacoes_normalizadas = {
-            'Inscrito': 'Inscritos/Pendentes/Concluintes',
-            'Concluinte': 'Inscritos/Pendentes/Concluintes',
-            'Pendente': 'Inscritos/Pendentes/Concluintes',
-            'Trancado': 'Trancados',
-            'Formando': 'Formados',
-            'Formado': 'Formados',
-            'Permanência de Vínculo': 'Formados'
-        }
+        if DIMENSAO_CANCELAMENTO in por_dimensao:
+            motivos = por_dimensao[DIMENSAO_CANCELAMENTO]
+            dados['total_cancelamentos'] = int(sum(motivos.values()))
+            dados['motivos_cancelamento'] = com_percentual(motivos, dados['total_cancelamentos'])
         
-        # Classificar por situação
-        if 'SITUAÇÃO' in df.columns:
-            situacoes = df['SITUAÇÃO'].fillna('Desconhecido')
-            
-            for situacao_original, situacao_normalizada in situacoes_normalizadas.items():
-                contagem = situacoes[situacoes.str.contains(situacao_original, case=False, na=False)].shape[0]
-                if contagem > 0:
-                    if situacao_normalizada not in dados['categorias']:
-                        dados['categorias'][situacao_normalizada] = 0
-                    dados['categorias'][situacao_normalizada] += contagem
-        
-        # Contar cancelamentos
-        if 'MOTIVO DO CANCELAMENTO' in df.columns:
-            motivos = df['MOTIVO DO CANCELAMENTO'].fillna('')
-            cancelamentos = motivos[motivos != '']
-            dados['total_cancelamentos'] = len(cancelamentos)
-            
-            # Classificar motivos de cancelamento
-            motivos_classificados = self._classificar_motivos_cancelamento(cancelamentos)
-            dados['motivos_cancelamento'] = motivos_classificados
-        
-        # Separar por modalidade de ingresso
-        if 'MODALIDADE' in df.columns:
-            modalidades = df['MODALIDADE'].fillna('')
-            
-            # Ampla concorrência (códigos começando com A)
-            ampla_concorrencia = modalidades[modalidades.str.startswith('A', na=False)]
-            dados['ampla_concorrencia'] = len(ampla_concorrencia)
-            
-            # Ações afirmativas (códigos começando com L)
-            acoes_afirmativas = modalidades[modalidades.str.startswith('L', na=False)]
-            dados['acoes_afirmativas'] = len(acoes_afirmativas)
-        
-        # Calcular matrículas ativas
-        mat_ativas = 0
-        for cat in ['Inscritos/Pendentes/Concluintes', 'Trancados']:
-            if cat in dados['categorias']:
-                mat_ativas += dados['categorias'][cat]
-        
-        dados['matriculas_ativas'] = mat_ativas
-        
-        # Calcular percentuais
-        if dados['total_registros'] > 0:
-            for categoria, valor in dados['categorias'].items():
-                percentual = (valor / dados['total_registros']) * 100
-                dados['categorias'][categoria] = {
-                    'quantidade': valor,
-                    'percentual': round(percentual, 2)
-                }
+        if DIMENSAO_MODALIDADE in por_dimensao:
+            modalidades = por_dimensao[DIMENSAO_MODALIDADE]
+            dados['ampla_concorrencia'] = int(modalidades.get('Ampla Concorrência', 0))
+            dados['acoes_afirmativas'] = int(modalidades.get('Ações Afirmativas', 0))
         
         return dados
     
-    def _classificar_motivos_cancelamento(self, motivos_series):
-        """Classifica motivos de cancelamento em categorias"""
-        categorias = {
-            'Solicitação Oficial': 0,
-            'Abandono': 0,
-            'Insuficiência de Aproveitamento': 0,
-            'Ingressante - Insuf. Aproveit.': 0,
-            'Mudança de Curso': 0,
-            'Outros': 0
-        }
-        
-        # Mapeamento de padrões para categorias
-        padroes = {
-            'Solicitação Oficial': ['solicitação oficial', 'pedido'],
-            'Abandono': ['abandono', 'desistência'],
-            'Insuficiência de Aproveitamento': ['insuficiência de aproveitamento', 'reprovação'],
-            'Ingressante - Insuf. Aproveit.': ['ingressante', 'calouro'],
-            'Mudança de Curso': ['mudança de curso', 'transferência']
-        }
+    @rastrear('processador.consolidar_dados_todos_relatorios')
+    def consolidar_dados_todos_relatorios(self, resultados_geracao, indice_alunos=None):
+        """Consolida dados de todos os relatórios gerados em uma tabela longa
         
-        for motivo in motivos_series:
-            motivo_str = str(motivo).lower()
-            classificado = False
-            
-            for categoria, padroes_cat in padroes.items():
-                for padrao in padroes_cat:
-                    if padrao in motivo_str:
-                        categorias[categoria] += 1
-                        classificado = True
-                        break
-                if classificado:
-                    break
-            
-            if not classificado:
-                categorias['Outros'] += 1
-        
-        # Calcular percentuais
-        total = sum(categorias.values())
-        if total > 0:
-            categorias_com_percentuais = {}
-            for cat, valor in categorias.items():
-                percentual = (valor / total) * 100
-                categorias_com_percentuais[cat] = {
-                    'quantidade': valor,
-                    'percentual': round(percentual, 2)
-                }
-            return categorias_com_percentuais
+        Se `indice_alunos` for informado, os alunos de cada relatório lido
+        também são indexados por matrícula, sem uma segunda leitura.
+        """
+        from consolidacao import TabelaEvasao
         
-        return categorias
-    
-    def consolidar_dados_todos_relatorios(self, resultados_geracao):
-        """Consolida dados de todos os relatórios gerados"""
-        dados_consolidados = {
-            'cursos': {},
-            'periodos': {},
-            'resumo_geral': {
-                'total_cursos': 0,
-                'total_periodos': 0,
-                'total_matriculas': 0,
-                'total_cancelamentos': 0,
-                'total_formados': 0,
-                'total_ativos': 0
-            }
-        }
+        tabela = TabelaEvasao()
         
         for curso_nome, resultados_curso in resultados_geracao.items():
-            dados_curso = {
-                'periodos': {},
-                'totais': {
-                    'matriculas': 0,
-                    'cancelamentos': 0,
-                    'formados': 0,
-                    'ativos': 0
-                }
-            }
+            tabela.registrar_curso(curso_nome)
             
             for resultado in resultados_curso:
                 if resultado.get('success') and 'caminho_arquivo' in resultado:
-                    periodo = resultado.get('periodo')
-                    
-                    # Ler e processar relatório
+                    # Ler e contar relatório
                     df = self.ler_relatorio_excel(resultado['caminho_arquivo'])
                     if df is not None:
-                        dados_periodo = self.extrair_dados_relatorio(df, curso_nome, periodo)
-                        
-                        if dados_periodo:
-                            dados_curso['periodos'][periodo] = dados_periodo
-                            
-                            # Acumular totais
-                            dados_curso['totais']['matriculas'] += dados_periodo.get('total_registros', 0)
-                            dados_curso['totais']['cancelamentos'] += dados_periodo.get('total_cancelamentos', 0)
-                            
-                            if 'Formados' in dados_periodo.get('categorias', {}):
-                                dados_curso['totais']['formados'] += dados_periodo['categorias']['Formados'].get('quantidade', 0)
-                            
-                            dados_curso['totais']['ativos'] += dados_periodo.get('matriculas_ativas', 0)
-            
-            dados_consolidados['cursos'][curso_nome] = dados_curso
+                        with span('processador.contar_relatorio', curso=curso_nome, periodo=resultado.get('periodo')):
+                            tabela.adicionar_relatorio(df, curso_nome, resultado.get('periodo'))
+                        if indice_alunos is not None:
+                            indice_alunos.adicionar_relatorio(
+                                df, curso_nome, resultado.get('periodo'), resultado['caminho_arquivo']
+                            )
         
-        # Calcular totais gerais
-        for curso_nome, dados_curso in dados_consolidados['cursos'].items():
-            dados_consolidados['resumo_geral']['total_cursos'] += 1
-            dados_consolidados['resumo_geral']['total_matriculas'] += dados_curso['totais']['matriculas']
-            dados_consolidados['resumo_geral']['total_cancelamentos'] += dados_curso['totais']['cancelamentos']
-            dados_consolidados['resumo_geral']['total_formados'] += dados_curso['totais']['formados']
-            dados_consolidados['resumo_geral']['total_ativos'] += dados_curso['totais']['ativos']
+        return {
+            'tabela': tabela,
+            'resumo_geral': tabela.resumo_geral()
+        }
+    
+    def ingerir_relatorios(self, resultados_geracao, armazem):
+        """Ingere no armazém analítico os relatórios ainda não ingeridos (ou alterados)"""
+        ingeridos = 0
+        for curso_nome, resultados_curso in resultados_geracao.items():
+            for resultado in resultados_curso:
+                if resultado.get('success') and 'caminho_arquivo' in resultado:
+                    try:
+                        if armazem.ingerir_relatorio(resultado['caminho_arquivo'], curso_nome, resultado.get('periodo')):
+                            ingeridos += 1
+                    except Exception as e:
+                        logger.error(f"Erro ao ingerir relatório {resultado['caminho_arquivo']}: {str(e)}")
         
-        # Contar períodos únicos
-        periodos_unicos = set()
-        for curso_nome, dados_curso in dados_consolidados['cursos'].items():
-            for periodo in dados_curso['periodos'].keys():
-                periodos_unicos.add(periodo)
+        logger.info(f"{ingeridos} relatório(s) ingerido(s) no armazém")
+        return ingeridos
+    
+    @rastrear('processador.consolidar_do_armazem')
+    def consolidar_do_armazem(self, resultados_geracao, armazem):
+        """Consolida os relatórios com SQL sobre o armazém, lendo apenas os XLSX novos"""
+        self.ingerir_relatorios(resultados_geracao, armazem)
         
-        dados_consolidados['resumo_geral']['total_periodos'] = len(periodos_unicos)
+        caminhos = [
+            resultado['caminho_arquivo']
+            for resultados_curso in resultados_geracao.values()
+            for resultado in resultados_curso
+            if resultado.get('success') and 'caminho_arquivo' in resultado
+        ]
+        tabela = armazem.tabela_evasao(cursos=list(resultados_geracao), caminhos=caminhos)
         
-        return dados_consolidados
+        return {
+            'tabela': tabela,
+            'resumo_geral': tabela.resumo_geral()
+        }
     
+    @rastrear('processador.gerar_planilha_consolidada', argumentos=('caminho_saida',))
     def gerar_planilha_consolidada(self, dados_consolidados, caminho_saida):
         """Gera planilha Excel com dados consolidados"""
         try:
-            # Criar writer para múltiplas abas
-            with pd.ExcelWriter(caminho_saida, engine='xlsxwriter') as writer:
-                workbook = writer.book
-                
-                # 1. ABA: RESUMO GERAL
-                dados_resumo = []
-                for curso_nome, dados_curso in dados_consolidados['cursos'].items():
-                    dados_resumo.append({
-                        'Curso': curso_nome,
-                        'Total Matrículas': dados_curso['totais']['matriculas'],
-                        'Total Cancelamentos': dados_curso['totais']['cancelamentos'],
-                        'Total Formados': dados_curso['totais']['formados'],
-                        'Total Ativos': dados_curso['totais']['ativos'],
-                        '% Cancelamentos': round((dados_curso['totais']['cancelamentos'] / dados_curso['totais']['matriculas'] * 100), 2) if dados_curso['totais']['matriculas'] > 0 else 0,
-                        '% Formados': round((dados_curso['totais']['formados'] / dados_curso['totais']['matriculas'] * 100), 2) if dados_curso['totais']['matriculas'] > 0 else 0,
-                        '% Ativos': round((dados_curso['totais']['ativos'] / dados_curso['totais']['matriculas'] * 100), 2) if dados_curso['totais']['matriculas'] > 0 else 0
-                    })
-                
-                df_resumo = pd.DataFrame(dados_resumo)
-                df_resumo.to_excel(writer, sheet_name='RESUMO GERAL', index=False)
-                
-                # Formatar a aba RESUMO GERAL
-                worksheet = writer.sheets['RESUMO GERAL']
-                format_percent = workbook.add_format({'num_format': '0.00%'})
-                format_header = workbook.add_format({'bold': True, 'bg_color': '#366092', 'font_color': 'white'})
-                
-                for col_num, value in enumerate(df_resumo.columns.values):
-                    worksheet.write(0, col_num, value, format_header)
-                
-                # Aplicar formatação percentual
-                percent_cols = ['% Cancelamentos', '% Formados', '% Ativos']
-                for col_name in percent_cols:
-                    if col_name in df_resumo.columns:
-                        col_idx = df_resumo.columns.get_loc(col_name)
-                        for row in range(1, len(df_resumo) + 1):
-                            worksheet.write(row, col_idx, df_resumo.iloc[row-1][col_name]/100, format_percent)
-                
-                worksheet.autofit()
-                
-                # 2. ABA: DETALHES POR CURSO E PERÍODO
-                dados_detalhes = []
-                for curso_nome, dados_curso in dados_consolidados['cursos'].items():
-                    for periodo, dados_periodo in dados_curso['periodos'].items():
-                        # Formatando período para exibição
-                        periodo_display = f"{periodo[:4]}/{periodo[4:]}"
-                        
-                        linha = {
-                            'Curso': curso_nome,
-                            'Período': periodo_display,
-                            'Total Registros': dados_periodo.get('total_registros', 0),
-                            'Matrículas Ativas': dados_periodo.get('matriculas_ativas', 0),
-                            'Ampla Concorrência': dados_periodo.get('ampla_concorrencia', 0),
-                            'Ações Afirmativas': dados_periodo.get('acoes_afirmativas', 0)
-                        }
-                        
-                        # Adicionar categorias
-                        categorias = dados_periodo.get('categorias', {})
-                        for categoria, dados_cat in categorias.items():
-                            linha[f'{categoria} (qtd)'] = dados_cat.get('quantidade', 0)
-                            linha[f'{categoria} (%)'] = dados_cat.get('percentual', 0)
-                        
-                        # Adicionar cancelamentos
-                        motivos = dados_periodo.get('motivos_cancelamento', {})
-                        for motivo, dados_motivo in motivos.items():
-                            linha[f'Cancel: {motivo}'] = dados_motivo.get('quantidade', 0)
-                        
-                        dados_detalhes.append(linha)
-                
-                if dados_detalhes:
-                    df_detalhes = pd.DataFrame(dados_detalhes)
-                    df_detalhes.to_excel(writer, sheet_name='DETALHES', index=False)
-                    
-                    # Formatar a aba DETALHES
-                    worksheet_detalhes = writer.sheets['DETALHES']
-                    for col_num, value in enumerate(df_detalhes.columns.values):
-                        worksheet_detalhes.write(0, col_num, value, format_header)
-                    
-                    # Aplicar formatação percentual para colunas com %
-                    for col_num, col_name in enumerate(df_detalhes.columns):
-                        if '(%)' in col_name:
-                            for row in range(1, len(df_detalhes) + 1):
-                                worksheet_detalhes.write(row, col_num, df_detalhes.iloc[row-1][col_name]/100, format_percent)
-                    
-                    worksheet_detalhes.autofit()
-                
-                # 3. ABA: CANCELAMENTOS
-                dados_cancel = []
-                for curso_nome, dados_curso in dados_consolidados['cursos'].items():
-                    for periodo, dados_periodo in dados_curso['periodos'].items():
-                        periodo_display = f"{periodo[:4]}/{periodo[4:]}"
-                        motivos = dados_periodo.get('motivos_cancelamento', {})
-                        
-                        for motivo, dados_motivo in motivos.items():
-                            dados_cancel.append({
-                                'Curso': curso_nome,
-                                'Período': periodo_display,
-                                'Motivo Cancelamento': motivo,
-                                'Quantidade': dados_motivo.get('quantidade', 0),
-                                'Percentual': dados_motivo.get('percentual', 0)
-                            })
-                
-                if dados_cancel:
-                    df_cancel = pd.DataFrame(dados_cancel)
-                    df_cancel.to_excel(writer, sheet_name='CANCELAMENTOS', index=False)
-                    
-                    # Formatar a aba CANCELAMENTOS
-                    worksheet_cancel = writer.sheets['CANCELAMENTOS']
-                    for col_num, value in enumerate(df_cancel.columns.values):
-                        worksheet_cancel.write(0, col_num, value, format_header)
-                    
-                    col_percent = df_cancel.columns.get_loc('Percentual')
-                    for row in range(1, len(df_cancel) + 1):
-                        worksheet_cancel.write(row, col_percent, df_cancel.iloc[row-1]['Percentual']/100, format_percent)
-                    
-                    worksheet_cancel.autofit()
-                
-                # 4. ABA: MODALIDADES
-                dados_modalidades = []
-                for curso_nome, dados_curso in dados_consolidados['cursos'].items():
-                    for periodo, dados_periodo in dados_curso['periodos'].items():
-                        periodo_display = f"{periodo[:4]}/{periodo[4:]}"
-                        total = dados_periodo.get('total_registros', 0)
-                        ampla = dados_periodo.get('ampla_concorrencia', 0)
-                        acoes = dados_periodo.get('acoes_afirmativas', 0)
-                        
-                        if total > 0:
-                            dados_modalidades.append({
-                                'Curso': curso_nome,
-                                'Período': periodo_display,
-                                'Total': total,
-                                'Ampla Concorrência': ampla,
-                                '% Ampla': round((ampla / total * 100), 2),
-                                'Ações Afirmativas': acoes,
-                                '% Ações': round((acoes / total * 100), 2)
-                            })
-                
-                if dados_modalidades:
-                    df_modal = pd.DataFrame(dados_modalidades)
-                    df_modal.to_excel(writer, sheet_name='MODALIDADES', index=False)
-                    
-                    # Formatar a aba MODALIDADES
-                    worksheet_modal = writer.sheets['MODALIDADES']
-                    for col_num, value in enumerate(df_modal.columns.values):
-                        worksheet_modal.write(0, col_num, value, format_header)
-                    
-                    # Formatar percentuais
-                    for col_name in ['% Ampla', '% Ações']:
-                        if col_name in df_modal.columns:
-                            col_idx = df_modal.columns.get_loc(col_name)
-                            for row in range(1, len(df_modal) + 1):
-                                worksheet_modal.write(row, col_idx, df_modal.iloc[row-1][col_name]/100, format_percent)
-                    
-                    worksheet_modal.autofit()
-                
-                logger.info(f"Planilha consolidada gerada: {caminho_saida}")
-                return True
+            from escritor_planilha import escrever_planilha
+            
+            # RESUMO GERAL, DETALHES, CANCELAMENTOS e MODALIDADES
+            abas = dados_consolidados['tabela'].abas()
+            escrever_planilha(abas, caminho_saida)
+            definir_atributos(bytes=os.path.getsize(caminho_saida))
+            
+            logger.info(f"Planilha consolidada gerada: {caminho_saida}")
+            return True
                 
         except Exception as e:
             logger.error(f"Erro ao gerar planilha: {str(e)}")
             return False
+    
+    def processar_lote(self, resultados_geracao, tarefa=None, analise=None):
+        """Consolida, indexa alunos, gera a planilha e exporta as linhas de alunos
+        
+        Com `analise` (AnaliseIncremental alimentada durante a geração), a
+        consolidação e o índice de alunos já calculados são reaproveitados.
+        """
+        if tarefa is not None:
+            tarefa.atualizar(concluidos=0, total=3, mensagem="Consolidando relatórios")
+        
+        from indice_alunos import IndiceAlunos
+        
+        dados_consolidados = analise.dados_consolidados(resultados_geracao) if analise is not None else None
+        if dados_consolidados is not None:
+            indice_alunos = analise.indice_alunos
+        else:
+            indice_alunos = IndiceAlunos()
+            dados_consolidados = self.consolidar_dados_todos_relatorios(resultados_geracao, indice_alunos=indice_alunos)
+        indice_alunos.salvar(os.path.join(self.pasta_relatorios, "indice_alunos.pkl"))
+        
+        if tarefa is not None:
+            tarefa.atualizar(concluidos=1, mensagem="Gerando planilha consolidada")
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        caminho_planilha = os.path.join(self.pasta_relatorios, f"estatisticas_evasao_{timestamp}.xlsx")
+        if not self.gerar_planilha_consolidada(dados_consolidados, caminho_planilha):
+            raise RuntimeError("Erro ao gerar planilha consolidada")
+        
+        if tarefa is not None:
+            tarefa.atualizar(concluidos=2, mensagem="Exportando dados de alunos")
+        caminho_alunos = os.path.join(self.pasta_relatorios, f"alunos_evasao_{timestamp}.xlsx")
+        total_alunos = self.exportar_dados_alunos(resultados_geracao, caminho_alunos)
+        
+        if tarefa is not None:
+            tarefa.atualizar(concluidos=3, mensagem="Processamento concluído")
+        return {
+            'dados_consolidados': dados_consolidados,
+            'indice_alunos': indice_alunos,
+            'caminho_planilha': caminho_planilha,
+            'caminho_alunos': caminho_alunos if total_alunos is not None else ''
+        }
+    
+    def exportar_dados_alunos(self, resultados_geracao, caminho_saida, formato=None):
+        """Exporta as linhas de alunos de todos os relatórios em um único arquivo (streaming)"""
+        try:
+            from exportador_alunos import exportar_alunos
+            
+            return exportar_alunos(resultados_geracao, caminho_saida, formato)
+        except Exception as e:
+            logger.error(f"Erro ao exportar dados de alunos: {str(e)}")
+            return None
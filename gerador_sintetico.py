@@ -0,0 +1,138 @@
+"""
+gerador_sintetico.py - Relatórios sintéticos no formato da listagem de alunos do portal
+
+Gera arquivos XLSX com as colunas e distribuições realistas de SITUAÇÃO,
+MOTIVO DO CANCELAMENTO e MODALIDADE, de 100 a 1 milhão de linhas, para
+testes de desempenho sem acesso ao sistema da UFF.
+
+Uso:
+    python gerador_sintetico.py 100000 relatorio_sintetico.xlsx
+"""
+import argparse
+import logging
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import xlsxwriter
+
+logger = logging.getLogger(__name__)
+
+COLUNAS_RELATORIO = [
+    'MATRÍCULA', 'NOME', 'CURSO', 'DESDOBRAMENTO', 'ANO/SEMESTRE DE INGRESSO',
+    'FORMA DE INGRESSO', 'MODALIDADE', 'SITUAÇÃO', 'MOTIVO DO CANCELAMENTO',
+    'ANO/SEMESTRE DE DESVINCULAÇÃO'
+]
+
+# Distribuições aproximadas observadas nas listagens (probabilidades somam 1)
+DISTRIBUICAO_SITUACAO = {
+    'Inscrito': 0.34,
+    'Pendente': 0.04,
+    'Concluinte': 0.03,
+    'Trancado': 0.05,
+    'Formado': 0.18,
+    'Formando': 0.02,
+    'Permanência de Vínculo': 0.01,
+    'Cancelado': 0.33
+}
+DISTRIBUICAO_MOTIVO = {
+    'Cancelamento por solicitação oficial': 0.22,
+    'Abandono de curso': 0.38,
+    'Insuficiência de aproveitamento': 0.12,
+    'Ingressante - insuficiência de aproveitamento': 0.08,
+    'Mudança de curso': 0.12,
+    'Falecimento': 0.01,
+    'Outros motivos': 0.07
+}
+DISTRIBUICAO_MODALIDADE = {
+    'A0': 0.50,
+    'L1': 0.08,
+    'L2': 0.10,
+    'L5': 0.08,
+    'L6': 0.10,
+    'L9': 0.03,
+    'L10': 0.03,
+    'L13': 0.04,
+    'L14': 0.04
+}
+SITUACOES_COM_SAIDA = {'Cancelado', 'Formado'}
+
+TAMANHO_BLOCO = 50000
+
+
+def _sortear(rng, distribuicao: Dict[str, float], n: int) -> np.ndarray:
+    valores = list(distribuicao)
+    pesos = np.array(list(distribuicao.values()), dtype=float)
+    return rng.choice(valores, size=n, p=pesos / pesos.sum())
+
+
+def _bloco(rng, inicio: int, n: int, periodo: str, curso: str, desdobramento: str) -> Dict[str, np.ndarray]:
+    """Gera um bloco de n linhas com colunas independentes"""
+    ano, semestre = int(periodo[:4]), int(periodo[4:5])
+    situacao = _sortear(rng, DISTRIBUICAO_SITUACAO, n)
+    cancelado = situacao == 'Cancelado'
+
+    motivo = np.full(n, None, dtype=object)
+    motivo[cancelado] = _sortear(rng, DISTRIBUICAO_MOTIVO, int(cancelado.sum()))
+
+    saida = np.full(n, None, dtype=object)
+    com_saida = np.isin(situacao, list(SITUACOES_COM_SAIDA))
+    semestres = rng.integers(0, 12, int(com_saida.sum())) + (semestre - 1)
+    saida[com_saida] = [f"{ano + s // 2}/{s % 2 + 1}" for s in semestres]
+
+    return {
+        'MATRÍCULA': np.array([f"{periodo[:4]}{semestre}{i:07d}" for i in range(inicio, inicio + n)]),
+        'NOME': np.array([f"ALUNO SINTÉTICO {i}" for i in range(inicio, inicio + n)]),
+        'CURSO': np.full(n, curso),
+        'DESDOBRAMENTO': np.full(n, desdobramento),
+        'ANO/SEMESTRE DE INGRESSO': np.full(n, f"{ano}/{semestre}"),
+        'FORMA DE INGRESSO': np.full(n, 'SISU 1ª Edição' if semestre == 1 else 'SISU 2ª Edição'),
+        'MODALIDADE': _sortear(rng, DISTRIBUICAO_MODALIDADE, n),
+        'SITUAÇÃO': situacao,
+        'MOTIVO DO CANCELAMENTO': motivo,
+        'ANO/SEMESTRE DE DESVINCULAÇÃO': saida
+    }
+
+
+def gerar_relatorio_sintetico(n_linhas: int, caminho_saida: str, periodo: str = '20131',
+                              curso: str = 'Química', desdobramento: str = 'Química (Licenciatura) (12700)',
+                              semente: Optional[int] = 42) -> str:
+    """Escreve um relatório sintético com n_linhas em caminho_saida (memória constante)"""
+    rng = np.random.default_rng(semente)
+    pasta = os.path.dirname(caminho_saida)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+
+    workbook = xlsxwriter.Workbook(caminho_saida, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet('Listagem')
+        worksheet.write_row(0, 0, COLUNAS_RELATORIO)
+        linha = 1
+        for inicio in range(0, n_linhas, TAMANHO_BLOCO):
+            n = min(TAMANHO_BLOCO, n_linhas - inicio)
+            bloco = _bloco(rng, inicio, n, periodo, curso, desdobramento)
+            colunas = [bloco[coluna].tolist() for coluna in COLUNAS_RELATORIO]
+            for valores in zip(*colunas):
+                worksheet.write_row(linha, 0, valores)
+                linha += 1
+    finally:
+        workbook.close()
+
+    logger.info(f"Relatório sintético gerado: {caminho_saida} ({n_linhas} linhas)")
+    return caminho_saida
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera relatórios sintéticos no formato do portal")
+    parser.add_argument('linhas', type=int, help="Número de linhas (alunos)")
+    parser.add_argument('saida', help="Arquivo XLSX de saída")
+    parser.add_argument('--periodo', default='20131', help="Período de ingresso (ex.: 20131)")
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    gerar_relatorio_sintetico(args.linhas, args.saida, periodo=args.periodo, semente=args.semente)
+    print(f"Relatório sintético criado: {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
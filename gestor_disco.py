@@ -0,0 +1,357 @@
+"""
+gestor_disco.py - Orçamento de disco da pasta de relatórios
+
+Cada execução grava um XLSX com timestamp por relatório, e a pasta crescia
+sem limite. O gestor mantém um índice JSON dos relatórios baixados
+(tamanho, último acesso, curso|período, se já foi substituído por um
+download mais novo e se está comprimido), com consulta O(1) por caminho e
+por curso|período. Quando a pasta passa do orçamento, ou o disco fica com
+pouco espaço livre, remove primeiro os downloads substituídos usados há
+mais tempo e depois os demais (LRU). Relatórios frios podem ficar
+comprimidos com zstd (pacote opcional `zstandard`) e são restaurados
+quando voltam a ser usados: todo leitor de relatórios baixados obtém o
+caminho por caminho_disponivel(), que descomprime o arquivo se preciso.
+
+As planilhas geradas pelo processamento ficam fora do índice, inclusive
+as do CLI com nome livre (--saida), reconhecidas pelo manifesto gravado
+ao lado.
+
+Lotes simultâneos (interface e CLI) têm cada um o seu gestor sobre o mesmo
+índice: manter() e salvar() mesclam o índice do disco, sob trava, antes de
+agir e de gravar.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from config import (
+    ARQUIVO_INDICE_DISCO, COMPRIMIR_RELATORIOS_APOS_DIAS, ESPACO_LIVRE_MINIMO_MB, ORCAMENTO_DISCO_MB,
+    PASTA_RELATORIOS, PROTECAO_ACESSO_RECENTE, SUFIXO_MANIFESTO
+)
+from utils import bloqueio_arquivo, verificar_espaco_disco
+
+logger = logging.getLogger(__name__)
+
+EXTENSOES_RELATORIO = ('.xlsx', '.xls')
+EXTENSAO_COMPRIMIDA = '.zst'
+# Planilhas geradas pelo processamento (não são relatórios baixados)
+PREFIXOS_SAIDA = ('estatisticas_evasao_', 'alunos_evasao_')
+SUFIXO_ALUNOS = '_alunos'
+
+
+def _zstd():
+    """Módulo zstandard, ou None se não estiver instalado"""
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def planilha_de_saida(caminho: str) -> bool:
+    """Planilha gerada pelo processamento (prefixo padrão ou saída do CLI com manifesto ao lado)"""
+    if os.path.basename(caminho).startswith(PREFIXOS_SAIDA):
+        return True
+    base = os.path.splitext(caminho)[0]
+    if base.endswith(SUFIXO_ALUNOS) and os.path.exists(base[:-len(SUFIXO_ALUNOS)] + SUFIXO_MANIFESTO):
+        return True
+    return os.path.exists(base + SUFIXO_MANIFESTO)
+
+
+def _descomprimir(caminho: str) -> bool:
+    """Restaura `caminho` a partir de `caminho`.zst, com o mtime original; False se não for possível"""
+    comprimido = caminho + EXTENSAO_COMPRIMIDA
+    zstd = _zstd()
+    if zstd is None or not os.path.exists(comprimido):
+        return False
+    try:
+        info = os.stat(comprimido)
+        with open(comprimido, 'rb') as origem, open(f"{caminho}.parte", 'wb') as destino:
+            zstd.ZstdDecompressor().copy_stream(origem, destino)
+        # Mesmo tamanho e mtime de antes: o armazém e os caches por assinatura continuam válidos
+        os.utime(f"{caminho}.parte", ns=(info.st_atime_ns, info.st_mtime_ns))
+        os.replace(f"{caminho}.parte", caminho)
+        os.remove(comprimido)
+    except Exception as e:
+        logger.error(f"Erro ao descomprimir {comprimido}: {str(e)}")
+        return False
+    return True
+
+
+def caminho_disponivel(caminho: str, gestor: Optional['GestorDisco'] = None) -> Optional[str]:
+    """Caminho de um relatório baixado pronto para leitura; None se ele não existir mais
+
+    Um relatório comprimido é restaurado (pelo `gestor`, se houver, que
+    atualiza o índice; sem gestor, o índice é corrigido na próxima
+    sincronização).
+    """
+    if not caminho:
+        return None
+    if gestor is not None:
+        return caminho if gestor.restaurar(caminho) else None
+    return caminho if os.path.exists(caminho) or _descomprimir(caminho) else None
+
+
+class GestorDisco:
+    """Índice e política de retenção dos relatórios de PASTA_RELATORIOS"""
+
+    def __init__(self, pasta: str = PASTA_RELATORIOS, caminho_indice: str = ARQUIVO_INDICE_DISCO,
+                 orcamento_mb: float = ORCAMENTO_DISCO_MB,
+                 comprimir_apos_dias: Optional[float] = COMPRIMIR_RELATORIOS_APOS_DIAS):
+        self.pasta = pasta
+        self.caminho_indice = caminho_indice
+        self.orcamento_mb = orcamento_mb
+        self.comprimir_apos_dias = comprimir_apos_dias
+        self._lock = threading.RLock()
+        self._entradas = self._ler_indice()  # caminho -> entrada
+        self._atuais = {}  # curso|período -> caminho do download mais recente
+        self._recalcular_atuais()
+
+    def _ler_indice(self) -> Dict:
+        if not os.path.exists(self.caminho_indice):
+            return {}
+        try:
+            with open(self.caminho_indice, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao carregar índice de disco: {str(e)}")
+            return {}
+
+    def _recalcular_atuais(self):
+        """Um download atual por curso|período (o usado por último); os demais ficam substituídos"""
+        self._atuais = {}
+        for caminho, entrada in sorted(self._entradas.items(), key=lambda item: item[1]['acesso']):
+            chave = entrada.get('chave')
+            if not chave or entrada['substituido']:
+                continue
+            anterior = self._atuais.get(chave)
+            if anterior is not None:
+                self._entradas[anterior]['substituido'] = True
+            self._atuais[chave] = caminho
+
+    def _mesclar_indice(self):
+        """Incorpora o que outros gestores gravaram no índice (downloads, acessos e substituições)"""
+        with self._lock:
+            for caminho, entrada in self._ler_indice().items():
+                atual = self._entradas.get(caminho)
+                if atual is None:
+                    # Ausente aqui: registrado por outro lote, ou removido por este
+                    if (os.path.exists(caminho) or os.path.exists(caminho + EXTENSAO_COMPRIMIDA)) \
+                            and not planilha_de_saida(caminho):
+                        self._entradas[caminho] = entrada
+                    continue
+                if entrada.get('chave') and not atual.get('chave'):
+                    # Adotado por sincronizar() antes de o outro lote salvar o registro
+                    atual.update(chave=entrada['chave'], substituido=entrada['substituido'])
+                elif entrada['substituido']:
+                    atual['substituido'] = True
+                atual['acesso'] = max(atual['acesso'], entrada['acesso'])
+            self._recalcular_atuais()
+
+    @staticmethod
+    def _normalizar(caminho: str) -> str:
+        return os.path.normpath(caminho)
+
+    def registrar(self, caminho: str, curso: Optional[str] = None, periodo: Optional[str] = None):
+        """Registra um download; o anterior do mesmo curso × período passa a ser substituído"""
+        caminho = self._normalizar(caminho)
+        if not os.path.exists(caminho):
+            return
+        chave = f"{curso}|{periodo}" if curso and periodo else None
+        with self._lock:
+            anterior = self._atuais.get(chave) if chave else None
+            if anterior and anterior != caminho and anterior in self._entradas:
+                self._entradas[anterior]['substituido'] = True
+            self._entradas[caminho] = {
+                'tamanho': os.path.getsize(caminho),
+                'acesso': time.time(),
+                'chave': chave,
+                'substituido': chave is None,
+                'comprimido': False
+            }
+            if chave:
+                self._atuais[chave] = caminho
+
+    def registrar_resultados(self, resultados_geracao: Dict):
+        """Registra os downloads novos de um lote e marca como usados os reaproveitados"""
+        for resultados_curso in resultados_geracao.values():
+            for resultado in resultados_curso:
+                if not resultado.get('success') or not resultado.get('caminho_arquivo'):
+                    continue
+                caminho = self._normalizar(resultado['caminho_arquivo'])
+                if resultado.get('origem') or caminho in self._entradas:
+                    self.tocar(caminho)
+                else:
+                    self.registrar(caminho, resultado.get('curso'), resultado.get('periodo'))
+                if resultado.get('consulta_origem'):
+                    # Consulta ampla já separada por curso × período: primeira a ser removida
+                    self.registrar(resultado['consulta_origem'])
+
+    def tocar(self, caminho: str):
+        with self._lock:
+            entrada = self._entradas.get(self._normalizar(caminho))
+            if entrada:
+                entrada['acesso'] = time.time()
+
+    def uso_bytes(self) -> int:
+        with self._lock:
+            return sum(entrada['tamanho'] for entrada in self._entradas.values())
+
+    def restaurar(self, caminho: str) -> bool:
+        """Garante o arquivo descomprimido em `caminho`; False se ele não existir mais"""
+        caminho = self._normalizar(caminho)
+        if os.path.exists(caminho):
+            self.tocar(caminho)
+            return True
+        with self._lock:
+            if not _descomprimir(caminho):
+                return False
+            entrada = self._entradas.setdefault(caminho, {'chave': None, 'substituido': True})
+            entrada.update(tamanho=os.path.getsize(caminho), acesso=time.time(), comprimido=False)
+        return True
+
+    def caminho_disponivel(self, caminho: str) -> Optional[str]:
+        return caminho_disponivel(caminho, self)
+
+    def sincronizar(self):
+        """Inclui relatórios da pasta fora do índice (execuções antigas) e esquece os apagados
+
+        Entradas comprimidas ou restauradas por outro processo são corrigidas
+        pelo que está no disco; planilhas de saída saem do índice.
+        """
+        with self._lock:
+            for caminho in list(self._entradas):
+                entrada = self._entradas[caminho]
+                if planilha_de_saida(caminho):
+                    self._remover_entrada(caminho)
+                elif os.path.exists(caminho):
+                    if entrada['comprimido']:
+                        # Restaurado sem este gestor: o ctime marca o uso
+                        info = os.stat(caminho)
+                        entrada.update(tamanho=info.st_size, acesso=max(entrada['acesso'], info.st_ctime),
+                                       comprimido=False)
+                elif os.path.exists(caminho + EXTENSAO_COMPRIMIDA):
+                    if not entrada['comprimido']:
+                        entrada.update(tamanho=os.path.getsize(caminho + EXTENSAO_COMPRIMIDA), comprimido=True)
+                else:
+                    self._remover_entrada(caminho)
+
+            for nome in os.listdir(self.pasta):
+                base = nome[:-len(EXTENSAO_COMPRIMIDA)] if nome.endswith(EXTENSAO_COMPRIMIDA) else nome
+                if not base.endswith(EXTENSOES_RELATORIO):
+                    continue
+                caminho = self._normalizar(os.path.join(self.pasta, base))
+                if caminho in self._entradas or planilha_de_saida(caminho):
+                    continue
+                info = os.stat(os.path.join(self.pasta, nome))
+                self._entradas[caminho] = {
+                    'tamanho': info.st_size,
+                    'acesso': info.st_mtime,
+                    'chave': None,
+                    'substituido': True,
+                    'comprimido': base != nome
+                }
+
+    def _remover_entrada(self, caminho: str):
+        entrada = self._entradas.pop(caminho, None)
+        if entrada and entrada.get('chave') and self._atuais.get(entrada['chave']) == caminho:
+            del self._atuais[entrada['chave']]
+
+    def _remover_arquivo(self, caminho: str) -> int:
+        entrada = self._entradas[caminho]
+        alvo = caminho + EXTENSAO_COMPRIMIDA if entrada['comprimido'] else caminho
+        try:
+            os.remove(alvo)
+        except FileNotFoundError:
+            pass
+        self._remover_entrada(caminho)
+        return entrada['tamanho']
+
+    def _protegido(self, caminho: str, protegidos: set, agora: float) -> bool:
+        return caminho in protegidos or agora - self._entradas[caminho]['acesso'] < PROTECAO_ACESSO_RECENTE
+
+    def comprimir_frios(self, protegidos: Iterable[str] = ()) -> int:
+        """Comprime os relatórios sem acesso há mais de comprimir_apos_dias; retorna quantos"""
+        zstd = _zstd()
+        if zstd is None or self.comprimir_apos_dias is None:
+            return 0
+        protegidos = {self._normalizar(c) for c in protegidos}
+        limite = time.time() - self.comprimir_apos_dias * 86400
+        comprimidos = 0
+        with self._lock:
+            for caminho, entrada in list(self._entradas.items()):
+                if entrada['comprimido'] or entrada['acesso'] >= limite or caminho in protegidos:
+                    continue
+                try:
+                    info = os.stat(caminho)
+                    with open(caminho, 'rb') as origem, open(caminho + EXTENSAO_COMPRIMIDA, 'wb') as destino:
+                        zstd.ZstdCompressor(level=10).copy_stream(origem, destino)
+                    os.utime(caminho + EXTENSAO_COMPRIMIDA, ns=(info.st_atime_ns, info.st_mtime_ns))
+                    os.remove(caminho)
+                except Exception as e:
+                    logger.error(f"Erro ao comprimir {caminho}: {str(e)}")
+                    continue
+                entrada['tamanho'] = os.path.getsize(caminho + EXTENSAO_COMPRIMIDA)
+                entrada['comprimido'] = True
+                comprimidos += 1
+        return comprimidos
+
+    def aplicar_orcamento(self, protegidos: Iterable[str] = ()) -> int:
+        """Remove relatórios (substituídos primeiro, depois LRU) até caber no orçamento; retorna quantos"""
+        protegidos = {self._normalizar(c) for c in protegidos}
+        limite = self.orcamento_mb * 1024 * 1024
+        espaco_ok = verificar_espaco_disco(self.pasta, ESPACO_LIVRE_MINIMO_MB)
+        agora = time.time()
+        removidos = 0
+        with self._lock:
+            uso = self.uso_bytes()
+            if uso <= limite and espaco_ok:
+                return 0
+            candidatos = sorted(
+                (c for c in self._entradas if not self._protegido(c, protegidos, agora)),
+                key=lambda c: (not self._entradas[c]['substituido'], self._entradas[c]['acesso'])
+            )
+            for caminho in candidatos:
+                if uso <= limite and espaco_ok:
+                    break
+                uso -= self._remover_arquivo(caminho)
+                removidos += 1
+                if not espaco_ok:
+                    espaco_ok = verificar_espaco_disco(self.pasta, ESPACO_LIVRE_MINIMO_MB)
+
+        if uso > limite:
+            logger.warning(f"Relatórios em uso ocupam {uso / (1024 * 1024):.0f}MB, "
+                           f"acima do orçamento de {self.orcamento_mb}MB")
+        logger.info(f"Orçamento de disco: {removidos} relatório(s) removido(s)")
+        return removidos
+
+    def manter(self, protegidos: Iterable[str] = ()) -> Dict:
+        """Mescla e sincroniza o índice, comprime os frios, aplica o orçamento e salva
+
+        Tudo sob a trava do índice: os acessos e registros salvos por outros
+        lotes entram antes de escolher o que comprimir ou remover.
+        """
+        protegidos = list(protegidos)
+        os.makedirs(self.pasta, exist_ok=True)
+        with bloqueio_arquivo(self.caminho_indice):
+            self._mesclar_indice()
+            self.sincronizar()
+            comprimidos = self.comprimir_frios(protegidos)
+            removidos = self.aplicar_orcamento(protegidos)
+            self._gravar()
+        return {'comprimidos': comprimidos, 'removidos': removidos, 'uso_mb': round(self.uso_bytes() / (1024 * 1024), 1)}
+
+    def salvar(self):
+        with bloqueio_arquivo(self.caminho_indice):
+            self._mesclar_indice()
+            self._gravar()
+
+    def _gravar(self):
+        with self._lock:
+            temporario = f"{self.caminho_indice}.tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(self._entradas, f, ensure_ascii=False)
+            os.replace(temporario, self.caminho_indice)
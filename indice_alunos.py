@@ -0,0 +1,235 @@
+"""
+indice_alunos.py - Índice de alunos por matrícula entre todos os relatórios baixados
+
+O índice guarda uma linha por (aluno, relatório) com a situação normalizada e
+um dicionário matrícula -> posições, de modo que o histórico de um aluno é
+obtido em O(1) e as curvas de retenção/evasão por coorte são calculadas de
+forma vetorizada, sem reler os arquivos XLSX.
+"""
+import logging
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from consolidacao import (
+    CATEGORIA_FORMADOS, CATEGORIAS_ATIVAS, classificar_motivos, normalizar_situacoes
+)
+
+logger = logging.getLogger(__name__)
+
+# Nomes de coluna aceitos para a matrícula e para o período de desvinculação
+COLUNAS_MATRICULA = ['MATRÍCULA', 'MATRICULA', 'Matrícula', 'Matricula']
+PADRAO_COLUNA_DESVINCULACAO = re.compile(r'DESVINCULA', re.IGNORECASE)
+
+STATUS_ATIVO = 'Ativo'
+STATUS_FORMADO = 'Formado'
+STATUS_EVADIDO = 'Evadido'
+STATUS_OUTRO = 'Outro'
+
+COLUNAS_INDICE = [
+    'matricula', 'curso', 'coorte', 'situacao', 'status', 'motivo',
+    'modalidade', 'periodo_saida', 'origem'
+]
+
+
+def _encontrar_coluna(df: pd.DataFrame, candidatas: List[str]) -> Optional[str]:
+    for coluna in candidatas:
+        if coluna in df.columns:
+            return coluna
+    return None
+
+
+def periodo_para_indice(periodos: pd.Series) -> pd.Series:
+    """Converte '2015/2', '2015 / 2º' ou '20152' em um índice sequencial de semestres"""
+    texto = periodos.astype(str).str.replace(r'\D', '', regex=True)
+    ano = pd.to_numeric(texto.str[:4], errors='coerce')
+    semestre = pd.to_numeric(texto.str[4:5], errors='coerce')
+    indice = ano * 2 + (semestre - 1)
+    return indice.where(semestre.isin([1, 2]))
+
+
+class IndiceAlunos:
+    """Índice hash por matrícula com o histórico de situação de cada aluno"""
+
+    def __init__(self, eventos: Optional[pd.DataFrame] = None):
+        self._partes: List[pd.DataFrame] = []
+        self._eventos = None
+        self._posicoes = None
+        if eventos is not None:
+            self._partes.append(eventos[COLUNAS_INDICE])
+
+    def adicionar_relatorio(self, df: pd.DataFrame, curso: str, periodo: str, origem: str = '') -> int:
+        """Indexa os alunos de um relatório já lido; retorna quantos foram indexados"""
+        if df is None or df.empty:
+            return 0
+        coluna_matricula = _encontrar_coluna(df, COLUNAS_MATRICULA)
+        if coluna_matricula is None:
+            logger.warning(f"Relatório sem coluna de matrícula não indexado: {origem or curso}")
+            return 0
+
+        coluna = df[coluna_matricula]
+        if pd.api.types.is_float_dtype(coluna):
+            # Matrículas numéricas com células vazias chegam como float (ex.: 123.0)
+            coluna = coluna.astype('Int64')
+        matriculas = coluna.astype(str).str.strip()
+        validas = coluna.notna() & (matriculas != '')
+        df = df[validas]
+        n = len(df)
+
+        situacao = df['SITUAÇÃO'] if 'SITUAÇÃO' in df.columns else pd.Series(np.nan, index=df.index)
+        categoria = normalizar_situacoes(situacao)
+        motivo_texto = (
+            df['MOTIVO DO CANCELAMENTO'].fillna('').astype(str)
+            if 'MOTIVO DO CANCELAMENTO' in df.columns else pd.Series('', index=df.index)
+        )
+        cancelado = motivo_texto != ''
+        motivo = pd.Series('', index=df.index, dtype=object)
+        if cancelado.any():
+            motivo[cancelado] = classificar_motivos(pd.Index(motivo_texto[cancelado]))
+
+        status = np.select(
+            [cancelado.to_numpy(), (categoria == CATEGORIA_FORMADOS).to_numpy(),
+             categoria.isin(CATEGORIAS_ATIVAS).to_numpy()],
+            [STATUS_EVADIDO, STATUS_FORMADO, STATUS_ATIVO],
+            default=STATUS_OUTRO
+        )
+
+        colunas_saida = [c for c in df.columns if PADRAO_COLUNA_DESVINCULACAO.search(str(c))]
+        periodo_saida = (
+            periodo_para_indice(df[colunas_saida[0]]) if colunas_saida
+            else pd.Series(np.nan, index=df.index)
+        )
+
+        eventos = pd.DataFrame({
+            'matricula': matriculas[validas].to_numpy(),
+            'curso': curso,
+            'coorte': str(periodo),
+            'situacao': situacao.astype(object).to_numpy(),
+            'status': status,
+            'motivo': motivo.to_numpy(),
+            'modalidade': (df['MODALIDADE'].astype(object).to_numpy()
+                           if 'MODALIDADE' in df.columns else np.full(n, None)),
+            'periodo_saida': periodo_saida.to_numpy(dtype=float),
+            'origem': origem
+        })
+        self._partes.append(eventos)
+        self._eventos = None
+        self._posicoes = None
+        return n
+
+    @property
+    def eventos(self) -> pd.DataFrame:
+        """Todas as linhas (aluno, relatório), na ordem de inclusão"""
+        if self._eventos is None:
+            if self._partes:
+                self._eventos = pd.concat(self._partes, ignore_index=True)
+                self._partes = [self._eventos]
+            else:
+                self._eventos = pd.DataFrame(columns=COLUNAS_INDICE)
+        return self._eventos
+
+    @property
+    def posicoes(self) -> Dict[str, np.ndarray]:
+        """Dicionário matrícula -> posições em `eventos`"""
+        if self._posicoes is None:
+            eventos = self.eventos
+            self._posicoes = eventos.groupby('matricula', sort=False).indices if len(eventos) else {}
+        return self._posicoes
+
+    def __len__(self):
+        return len(self.posicoes)
+
+    def __contains__(self, matricula):
+        return str(matricula) in self.posicoes
+
+    def historico(self, matricula) -> pd.DataFrame:
+        """Histórico de situações de um aluno em todos os relatórios (lookup O(1))"""
+        posicoes = self.posicoes.get(str(matricula))
+        if posicoes is None:
+            return self.eventos.iloc[0:0]
+        return self.eventos.iloc[posicoes]
+
+    def duplicadas(self) -> pd.DataFrame:
+        """Alunos que aparecem em mais de um relatório (relatórios sobrepostos)"""
+        eventos = self.eventos
+        repetidas = eventos['matricula'].duplicated(keep=False)
+        return eventos[repetidas].sort_values(['matricula', 'coorte'], kind='stable')
+
+    def alunos(self) -> pd.DataFrame:
+        """Uma linha por aluno, mantendo a ocorrência do relatório mais recente incluído"""
+        return self.eventos.drop_duplicates('matricula', keep='last')
+
+    def taxas_por_coorte(self) -> pd.DataFrame:
+        """Situação atual por curso/coorte: quantidade e proporção de cada status"""
+        alunos = self.alunos()
+        if alunos.empty:
+            return pd.DataFrame()
+        contagem = pd.crosstab([alunos['curso'], alunos['coorte']], alunos['status'])
+        for status in [STATUS_ATIVO, STATUS_FORMADO, STATUS_EVADIDO, STATUS_OUTRO]:
+            if status not in contagem.columns:
+                contagem[status] = 0
+        total = contagem.sum(axis=1)
+        taxas = contagem[[STATUS_ATIVO, STATUS_FORMADO, STATUS_EVADIDO, STATUS_OUTRO]].copy()
+        taxas['Total'] = total
+        taxas['Retenção'] = (contagem[STATUS_ATIVO] / total).round(4)
+        taxas['Evasão'] = (contagem[STATUS_EVADIDO] / total).round(4)
+        return taxas
+
+    def curvas_por_coorte(self, max_semestres: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+        """Curvas de evasão acumulada e retenção por curso/coorte, por semestre desde o ingresso
+
+        Usa o período de desvinculação informado no relatório (guardado como
+        índice de semestre); saídas sem período conhecido não entram na curva,
+        apenas em taxas_por_coorte.
+        """
+        alunos = self.alunos()
+        if alunos.empty:
+            return {'evasao': pd.DataFrame(), 'retencao': pd.DataFrame()}
+
+        chave = [alunos['curso'], alunos['coorte']]
+        tamanho = alunos.groupby(['curso', 'coorte']).size()
+        semestres = alunos['periodo_saida'] - periodo_para_indice(alunos['coorte'])
+        semestres = semestres.where(semestres >= 0)
+        saiu = alunos['status'].isin([STATUS_EVADIDO, STATUS_FORMADO]) & semestres.notna()
+        evadiu = (alunos['status'] == STATUS_EVADIDO) & semestres.notna()
+
+        limite = int(semestres.max()) if semestres.notna().any() else 0
+        if max_semestres is not None:
+            limite = min(limite, max_semestres)
+        colunas = range(limite + 1)
+
+        def acumulado(mascara):
+            if not mascara.any():
+                return pd.DataFrame(0.0, index=tamanho.index,
+                                    columns=pd.Index(colunas, name='semestres_desde_ingresso'))
+            tabela = pd.crosstab(
+                [chave[0][mascara], chave[1][mascara]], semestres[mascara].astype(int)
+            )
+            tabela = tabela.reindex(index=tamanho.index, columns=colunas, fill_value=0).fillna(0)
+            tabela.columns.name = 'semestres_desde_ingresso'
+            return tabela.cumsum(axis=1).div(tamanho, axis=0)
+
+        evasao = acumulado(evadiu).round(4)
+        retencao = (1 - acumulado(saiu)).round(4)
+        return {'evasao': evasao, 'retencao': retencao}
+
+    def salvar(self, caminho: str) -> bool:
+        """Persiste o índice para ser recarregado sem reler os relatórios"""
+        try:
+            self.eventos.to_pickle(caminho)
+            logger.info(f"Índice de alunos salvo: {caminho} ({len(self)} alunos)")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao salvar índice de alunos: {str(e)}")
+            return False
+
+    @classmethod
+    def carregar(cls, caminho: str) -> Optional['IndiceAlunos']:
+        """Carrega um índice salvo com `salvar`"""
+        try:
+            return cls(pd.read_pickle(caminho))
+        except Exception as e:
+            logger.error(f"Erro ao carregar índice de alunos: {str(e)}")
+            return None
@@ -0,0 +1,142 @@
+"""
+instrumentacao_http.py - Registro de latência e tamanho de cada requisição HTTP
+
+Um hook de resposta na sessão compartilhada guarda, em um buffer circular,
+método, rota normalizada, status, latência, bytes e número de redirecionamentos
+de cada requisição. O resumo por rota (p50/p95/p99) mostra qual endpoint
+domina o tempo total.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+from config import TAMANHO_BUFFER_HTTP
+from metricas import normalizar_rota, observar_resposta
+
+logger = logging.getLogger(__name__)
+
+
+def _percentil(valores_ordenados: List[float], percentil: float) -> float:
+    """Percentil pelo método nearest-rank"""
+    if not valores_ordenados:
+        return 0.0
+    posicao = max(1, math.ceil(percentil / 100 * len(valores_ordenados)))
+    return valores_ordenados[posicao - 1]
+
+
+class MonitorHTTP:
+    """Buffer circular com as últimas requisições HTTP e o resumo por rota"""
+
+    def __init__(self, capacidade: int = TAMANHO_BUFFER_HTTP):
+        self._registros = deque(maxlen=capacidade)
+        self._lock = threading.Lock()
+        self._redirecionamentos = threading.local()
+
+    def hook(self, response, *args, **kwargs):
+        """Hook de resposta do requests (recebe stream/timeout em kwargs)"""
+        try:
+            self._registrar(response, kwargs.get('stream', False))
+        except Exception as e:
+            logger.debug(f"Falha ao registrar requisição HTTP: {str(e)}")
+        return response
+
+    def _registrar(self, response, stream: bool):
+        # Cada salto de redirecionamento passa pelo hook; o número de saltos
+        # é atribuído à resposta final da mesma thread.
+        pendentes = getattr(self._redirecionamentos, 'pendentes', 0)
+        if response.is_redirect:
+            self._redirecionamentos.pendentes = pendentes + 1
+            redirecionamentos = 0
+        else:
+            self._redirecionamentos.pendentes = 0
+            redirecionamentos = pendentes
+
+        # Downloads em stream não são lidos aqui: usa-se o Content-Length
+        if stream:
+            tamanho = int(response.headers.get('content-length', 0) or 0)
+        else:
+            tamanho = len(response.content or b'')
+
+        registro = {
+            'instante': time.time(),
+            'metodo': response.request.method,
+            'rota': normalizar_rota(response.request.url),
+            'status': response.status_code,
+            'latencia_s': response.elapsed.total_seconds(),
+            'bytes': tamanho,
+            'redirecionamentos': redirecionamentos
+        }
+        with self._lock:
+            self._registros.append(registro)
+
+    def instrumentar(self, session):
+        """Adiciona os hooks de registro e de métricas à sessão (idempotente)"""
+        hooks = session.hooks.setdefault('response', [])
+        for hook in (self.hook, observar_resposta):
+            if hook not in hooks:
+                hooks.append(hook)
+        return session
+
+    def registros(self) -> List[Dict]:
+        with self._lock:
+            return list(self._registros)
+
+    def limpar(self):
+        with self._lock:
+            self._registros.clear()
+
+    def resumo(self) -> List[Dict]:
+        """Estatísticas por método/rota, ordenadas pelo tempo total (maior primeiro)"""
+        registros_atuais = self.registros()
+        por_rota = {}
+        for registro in registros_atuais:
+            por_rota.setdefault((registro['metodo'], registro['rota']), []).append(registro)
+
+        tempo_geral = sum(r['latencia_s'] for r in registros_atuais) or 1.0
+        linhas = []
+        for (metodo, rota), registros in por_rota.items():
+            latencias = sorted(r['latencia_s'] for r in registros)
+            total_bytes = sum(r['bytes'] for r in registros)
+            tempo_total = sum(latencias)
+            linhas.append({
+                'metodo': metodo,
+                'rota': rota,
+                'requisicoes': len(registros),
+                'erros': sum(1 for r in registros if r['status'] >= 400),
+                'redirecionamentos': sum(r['redirecionamentos'] for r in registros),
+                'tempo_total_s': round(tempo_total, 3),
+                'fracao_tempo': round(tempo_total / tempo_geral, 4),
+                'p50_s': round(_percentil(latencias, 50), 3),
+                'p95_s': round(_percentil(latencias, 95), 3),
+                'p99_s': round(_percentil(latencias, 99), 3),
+                'max_s': round(latencias[-1], 3),
+                'bytes_total': total_bytes,
+                'bytes_medio': int(total_bytes / len(registros))
+            })
+        linhas.sort(key=lambda linha: linha['tempo_total_s'], reverse=True)
+        return linhas
+
+    def relatorio_texto(self) -> str:
+        """Resumo por rota em texto tabular (para logs e CLI)"""
+        linhas = [f"{'MÉTODO':<6} {'ROTA':<55} {'N':>5} {'TOTAL(s)':>9} {'%':>6} "
+                  f"{'p50':>7} {'p95':>7} {'p99':>7} {'KB méd':>8}"]
+        for linha in self.resumo():
+            linhas.append(
+                f"{linha['metodo']:<6} {linha['rota'][:55]:<55} {linha['requisicoes']:>5} "
+                f"{linha['tempo_total_s']:>9.2f} {linha['fracao_tempo'] * 100:>5.1f}% "
+                f"{linha['p50_s']:>7.3f} {linha['p95_s']:>7.3f} {linha['p99_s']:>7.3f} "
+                f"{linha['bytes_medio'] / 1024:>8.1f}"
+            )
+        return '\n'.join(linhas)
+
+
+# Monitor compartilhado pelo processo
+monitor_http = MonitorHTTP()
+
+
+def instrumentar_sessao(session):
+    """Instrumenta uma sessão requests com o monitor compartilhado"""
+    return monitor_http.instrumentar(session)
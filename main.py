@@ -3,10 +3,8 @@ import streamlit as st
 import os
 import sys
 from datetime import datetime
-import pandas as pd
 import time
 import logging
-from bs4 import BeautifulSoup
 import re
 
 # Configurar logging
@@ -17,13 +15,32 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from auth import UFFAuthenticator
+from cache_interface import (
+    arquivo_grande, bytes_arquivo, guardar_processamento, hash_resultados, obter_form_params,
+    previa_planilha, processamento_em_cache
+)
+from config import INTERVALO_ATUALIZACAO_UI, METRICAS_NA_INTERFACE
+from analise_incremental import AnaliseIncremental
+from executor_tarefas import executor_tarefas
+from politica_atualizacao import gerar_com_politica
+from pool_sessoes import PoolSessoes, SessaoCompartilhada
+from utils import criar_soup
 from gerador_relatorios import GeradorRelatorios, ProcessadorDadosRelatorios
+from instrumentacao_http import monitor_http
+from metricas import iniciar_servidor_metricas
 
 # URLs do sistema
 BASE_URL = "https://app.uff.br"
 APLICACAO_URL = "https://app.uff.br/graduacao/administracaoacademica"
 PASTA_RELATORIOS = 'relatorios'
 
+
+@st.cache_resource(show_spinner=False)
+def _servidor_metricas():
+    """Endpoint local de métricas, se habilitado: uma tentativa por processo, não a cada rerun"""
+    return iniciar_servidor_metricas() if METRICAS_NA_INTERFACE else None
+
+
 # Configuração da página
 st.set_page_config(
     page_title="Automação de Relatórios UFF - Química",
@@ -32,6 +49,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+_servidor_metricas()
+
 # Inicializar estado da sessão
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
@@ -71,6 +90,18 @@ if 'planilha_gerada' not in st.session_state:
     st.session_state.planilha_gerada = False
 if 'caminho_planilha' not in st.session_state:
     st.session_state.caminho_planilha = ''
+if 'caminho_alunos' not in st.session_state:
+    st.session_state.caminho_alunos = ''
+if 'indice_alunos' not in st.session_state:
+    st.session_state.indice_alunos = None
+if 'tarefa_geracao' not in st.session_state:
+    st.session_state.tarefa_geracao = None
+if 'tarefa_processamento' not in st.session_state:
+    st.session_state.tarefa_processamento = None
+if 'chave_processamento' not in st.session_state:
+    st.session_state.chave_processamento = ''
+if 'analise_incremental' not in st.session_state:
+    st.session_state.analise_incremental = None
 
 # Função para extrair parâmetros do formulário
 def extract_form_parameters(session):
@@ -85,7 +116,7 @@ def extract_form_parameters(session):
             logger.error(f"Status code {response.status_code} ao acessar formulário")
             return None
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = criar_soup(response.text)
         form = soup.find('form', {'id': 'rel_filtros'})
         if not form:
             logger.warning("Formulário com id 'rel_filtros' não encontrado")
@@ -192,6 +223,64 @@ def converter_periodo_para_valor(periodo_texto):
         return f"{ano}{semestre}"
     return None
 
+def montar_cursos_config(cursos_selecionados):
+    """Mapeia os cursos selecionados para a configuração do gerador
+
+    A interface cobre os cursos de Química; o catálogo de toda a universidade
+    (descoberta_cursos) é usado pelo CLI (executar_lote --descobrir-cursos).
+    """
+    cursos_config = []
+    for curso_obj in cursos_selecionados:
+        if 'Licenciatura' in curso_obj['nome']:
+            cursos_config.append({
+                'nome': curso_obj['nome'],
+                'codigo_curso': '12700',
+                'codigo_desdobramento': '12700',
+                'tipo': 'Licenciatura'
+            })
+        elif 'Bacharelado' in curso_obj['nome'] and 'Industrial' not in curso_obj['nome']:
+            cursos_config.append({
+                'nome': curso_obj['nome'],
+                'codigo_curso': '12700',
+                'codigo_desdobramento': '312700',
+                'tipo': 'Bacharelado'
+            })
+        elif 'Industrial' in curso_obj['nome']:
+            cursos_config.append({
+                'nome': curso_obj['nome'],
+                'codigo_curso': '12709',
+                'codigo_desdobramento': '12709',
+                'tipo': 'Bacharelado'
+            })
+    return cursos_config
+
+def aplicar_resultado_processamento(resultado):
+    """Copia o resultado de processar_lote para a sessão e avança para a Etapa 5"""
+    st.session_state.dados_consolidados = resultado['dados_consolidados']
+    st.session_state.indice_alunos = resultado['indice_alunos']
+    st.session_state.caminho_alunos = resultado['caminho_alunos']
+    st.session_state.planilha_gerada = True
+    st.session_state.caminho_planilha = resultado['caminho_planilha']
+    st.session_state.etapa_atual = 5
+
+def botao_download(rotulo, caminho, tipo):
+    """st.download_button do arquivo; um arquivo grande só é lido depois de o usuário pedir"""
+    chave = f"preparar_download_{caminho}"
+    if arquivo_grande(caminho) and not st.session_state.get(chave):
+        st.button(f"{rotulo} (preparar arquivo)", key=f"botao_{chave}", type=tipo, use_container_width=True,
+                  on_click=lambda: st.session_state.update({chave: True}))
+        return
+    st.download_button(
+        label=rotulo,
+        data=bytes_arquivo(caminho),
+        file_name=os.path.basename(caminho),
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        type=tipo,
+        use_container_width=True,
+        # Depois do download, o conteúdo não volta a ser lido nos próximos reruns
+        on_click=lambda: st.session_state.pop(chave, None)
+    )
+
 # Título principal
 st.title("📊 Sistema de Análise de Evasão - UFF")
 st.markdown("---")
@@ -264,6 +353,14 @@ else:
     
     st.markdown("---")
     
+    # Retomar geração em andamento deste usuário (ex.: após recarregar a página)
+    if st.session_state.tarefa_geracao is None and not st.session_state.consulta_concluida:
+        tarefa_em_andamento = executor_tarefas.tarefa_ativa(st.session_state.username, 'geracao')
+        if tarefa_em_andamento is not None:
+            st.session_state.tarefa_geracao = tarefa_em_andamento.tarefa_id
+            st.session_state.selected_cursos = tarefa_em_andamento.parametros['selected_cursos']
+            st.session_state.selected_periodos = tarefa_em_andamento.parametros['selected_periodos']
+    
     # Progresso das etapas
     st.markdown("### 📋 Progresso do Processo")
     
@@ -308,7 +405,9 @@ else:
         # Carregar dados do formulário se necessário
         if st.session_state.form_params is None:
             with st.spinner("Carregando dados do sistema..."):
-                st.session_state.form_params = extract_form_parameters(
+                st.session_state.form_params = obter_form_params(
+                    st.session_state.username,
+                    extract_form_parameters,
                     st.session_state.authenticator.session
                 )
         
@@ -569,86 +668,76 @@ else:
                 5. Após o download, processará os dados para gerar estatísticas
                 """)
                 
-                if st.button("🚀 Iniciar Geração de Relatórios", type="primary", use_container_width=True):
-                    # Inicializar gerador
-                    st.session_state.gerador = GeradorRelatorios(st.session_state.authenticator.session)
-                    
-                    # Obter cursos predefinidos
-                    cursos_config = []
-                    for curso_obj in st.session_state.selected_cursos:
-                        # Mapear curso selecionado para configuração do gerador
-                        if 'Licenciatura' in curso_obj['nome']:
-                            cursos_config.append({
-                                'nome': curso_obj['nome'],
-                                'codigo_curso': '12700',
-                                'codigo_desdobramento': '12700',
-                                'tipo': 'Licenciatura'
-                            })
-                        elif 'Bacharelado' in curso_obj['nome'] and 'Industrial' not in curso_obj['nome']:
-                            cursos_config.append({
-                                'nome': curso_obj['nome'],
-                                'codigo_curso': '12700',
-                                'codigo_desdobramento': '312700',
-                                'tipo': 'Bacharelado'
-                            })
-                        elif 'Industrial' in curso_obj['nome']:
-                            cursos_config.append({
-                                'nome': curso_obj['nome'],
-                                'codigo_curso': '12709',
-                                'codigo_desdobramento': '12709',
-                                'tipo': 'Bacharelado'
-                            })
-                    
-                    # Gerar lista de períodos
-                    periodo_inicial_valor = converter_periodo_para_valor(periodos['inicial'])
-                    periodo_final_valor = converter_periodo_para_valor(periodos['final'])
-                    
-                    periodos_lista = st.session_state.gerador.processar_periodos_intervalo(
-                        periodo_inicial_valor, 
-                        periodo_final_valor
-                    )
-                    
-                    # Criar placeholder para progresso
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    # Gerar relatórios em lote
-                    total_gerar = len(cursos_config) * len(periodos_lista)
-                    gerados = 0
-                    
-                    for curso in cursos_config:
-                        status_text.text(f"Gerando relatórios para: {curso['nome']}")
+                tarefa = executor_tarefas.obter(st.session_state.tarefa_geracao)
+                
+                if tarefa is None:
+                    if st.button("🚀 Iniciar Geração de Relatórios", type="primary", use_container_width=True):
+                        # Inicializar gerador
+                        # Uma sessão por thread de trabalho, todas com o mesmo login
+                        pool_sessoes = PoolSessoes(st.session_state.authenticator)
+                        st.session_state.gerador = GeradorRelatorios(SessaoCompartilhada(pool_sessoes))
+                        cursos_config = montar_cursos_config(st.session_state.selected_cursos)
                         
-                        for periodo in periodos_lista:
-                            # Atualizar progresso
-                            progresso = gerados / total_gerar
-                            progress_bar.progress(progresso)
-                            
-                            status_text.text(f"Curso: {curso['nome']} - Período: {periodo[:4]}/{periodo[4:]}")
-                            
-                            # Gerar relatório individual
-                            resultado = st.session_state.gerador.gerar_relatorio_individual(
-                                curso, 
-                                periodo, 
-                                st.session_state.gerador._determinar_forma_ingresso(periodo)
-                            )
-                            
-                            # Armazenar resultado
-                            if curso['nome'] not in st.session_state.resultados_geracao:
-                                st.session_state.resultados_geracao[curso['nome']] = []
-                            
-                            st.session_state.resultados_geracao[curso['nome']].append(resultado)
-                            gerados += 1
-                            
-                            time.sleep(2)  # Aguardar entre requisições
+                        # Gerar lista de períodos
+                        periodo_inicial_valor = converter_periodo_para_valor(periodos['inicial'])
+                        periodo_final_valor = converter_periodo_para_valor(periodos['final'])
+                        
+                        periodos_lista = st.session_state.gerador.processar_periodos_intervalo(
+                            periodo_inicial_valor, 
+                            periodo_final_valor
+                        )
+                        
+                        # Relatórios baixados já são consolidados enquanto os demais são gerados
+                        if st.session_state.analise_incremental is not None:
+                            st.session_state.analise_incremental.finalizar()
+                        analise = AnaliseIncremental([curso['nome'] for curso in cursos_config])
+                        st.session_state.analise_incremental = analise
+                        
+                        # Gerar relatórios em lote em segundo plano
+                        gerador = st.session_state.gerador
+                        
+                        def gerar(t):
+                            try:
+                                return gerar_com_politica(
+                                    gerador, cursos_config, periodos_lista, tarefa=t, intervalo=2,
+                                    consumidor=analise.enviar
+                                )
+                            finally:
+                                # Conexões das threads de trabalho não ficam abertas após a tarefa
+                                pool_sessoes.fechar()
+                        
+                        tarefa = executor_tarefas.submeter(
+                            st.session_state.username,
+                            'geracao',
+                            gerar,
+                            parametros={
+                                'selected_cursos': st.session_state.selected_cursos,
+                                'selected_periodos': st.session_state.selected_periodos
+                            }
+                        )
+                        st.session_state.tarefa_geracao = tarefa.tarefa_id
+                        st.rerun()
+                elif tarefa.ativa:
+                    # Acompanhar o progresso da tarefa em segundo plano
+                    estado = tarefa.snapshot()
+                    st.progress(tarefa.progresso())
+                    st.text(f"{estado['concluidos']}/{estado['total']} relatórios - {estado['mensagem']}")
+                    st.caption(f"⏱️ {estado['decorrido_s']:.0f}s - a geração continua mesmo se a página for recarregada")
                     
-                    # Finalizar
-                    progress_bar.progress(1.0)
-                    status_text.text("✅ Geração de relatórios concluída!")
+                    if st.button("⏹️ Cancelar Geração", type="secondary", use_container_width=True):
+                        executor_tarefas.cancelar(tarefa.tarefa_id)
                     
-                    st.session_state.consulta_concluida = True
-                    time.sleep(2)
+                    time.sleep(INTERVALO_ATUALIZACAO_UI)
                     st.rerun()
+                else:
+                    # Tarefa finalizada: resultados (completos ou parciais) passam para a sessão
+                    st.session_state.resultados_geracao = tarefa.resultado or tarefa.parcial or {}
+                    st.session_state.tarefa_geracao = None
+                    st.session_state.consulta_concluida = True
+                    if tarefa.estado == 'ERRO':
+                        st.error(f"❌ Erro na geração: {tarefa.erro}")
+                    else:
+                        st.rerun()
                 
                 # Botão para refazer configuração
                 if st.button("🔄 Alterar Configuração", type="secondary", use_container_width=True):
@@ -699,6 +788,14 @@ else:
                         percentual = (totais['sucesso'] / totais['total'] * 100) if totais['total'] > 0 else 0
                         st.metric("Taxa de Sucesso", f"{percentual:.1f}%")
                     
+                    # Latência por endpoint do portal
+                    with st.expander("⏱️ Tempo por endpoint do portal", expanded=False):
+                        resumo_http = monitor_http.resumo()
+                        if resumo_http:
+                            st.dataframe(resumo_http, use_container_width=True)
+                        else:
+                            st.info("Nenhuma requisição registrada.")
+                    
                     # Botão para avançar
                     if st.button("📊 Processar Dados e Gerar Estatísticas", type="primary", use_container_width=True):
                         st.session_state.etapa_atual = 4
@@ -731,34 +828,48 @@ else:
             5. **Gerando planilha consolidada** com todas as informações
             """)
             
-            if st.button("▶️ Iniciar Processamento", type="primary", use_container_width=True):
-                with st.spinner("Processando dados dos relatórios..."):
-                    # Processar dados
-                    processador = ProcessadorDadosRelatorios()
-                    
-                    # Consolidar dados de todos os relatórios
-                    st.session_state.dados_consolidados = processador.consolidar_dados_todos_relatorios(
-                        st.session_state.resultados_geracao
-                    )
-                    
-                    # Gerar planilha
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    caminho_planilha = os.path.join(PASTA_RELATORIOS, f"estatisticas_evasao_{timestamp}.xlsx")
-                    
-                    sucesso = processador.gerar_planilha_consolidada(
-                        st.session_state.dados_consolidados,
-                        caminho_planilha
+            tarefa = executor_tarefas.obter(st.session_state.tarefa_processamento)
+            
+            if tarefa is None:
+                if st.button("▶️ Iniciar Processamento", type="primary", use_container_width=True):
+                    # Consolidar, indexar alunos, gerar planilha e exportar alunos em segundo plano
+                    resultados_geracao = st.session_state.resultados_geracao
+                    st.session_state.chave_processamento = hash_resultados(resultados_geracao)
+                    resultado = processamento_em_cache(
+                        st.session_state.username, st.session_state.chave_processamento
                     )
                     
-                    if sucesso:
-                        st.session_state.planilha_gerada = True
-                        st.session_state.caminho_planilha = caminho_planilha
-                        st.session_state.etapa_atual = 5
-                        st.success("✅ Processamento concluído com sucesso!")
-                        time.sleep(1)
-                        st.rerun()
+                    if resultado is not None:
+                        # Mesmos relatórios já processados: reaproveitar planilha e consolidação
+                        aplicar_resultado_processamento(resultado)
                     else:
-                        st.error("❌ Erro ao gerar planilha consolidada.")
+                        processador = ProcessadorDadosRelatorios()
+                        analise = st.session_state.analise_incremental
+                        tarefa = executor_tarefas.submeter(
+                            st.session_state.username,
+                            'processamento',
+                            lambda t: processador.processar_lote(resultados_geracao, tarefa=t, analise=analise)
+                        )
+                        st.session_state.tarefa_processamento = tarefa.tarefa_id
+                    st.rerun()
+            elif tarefa.ativa:
+                estado = tarefa.snapshot()
+                st.progress(tarefa.progresso())
+                st.text(f"⚙️ {estado['mensagem']}")
+                time.sleep(INTERVALO_ATUALIZACAO_UI)
+                st.rerun()
+            else:
+                st.session_state.tarefa_processamento = None
+                if tarefa.estado == 'CONCLUIDA':
+                    guardar_processamento(
+                        st.session_state.username, st.session_state.chave_processamento, tarefa.resultado
+                    )
+                    aplicar_resultado_processamento(tarefa.resultado)
+                    st.success("✅ Processamento concluído com sucesso!")
+                    time.sleep(1)
+                    st.rerun()
+                else:
+                    st.error(f"❌ Erro ao gerar planilha consolidada: {tarefa.erro}")
             
             if st.button("🔙 Voltar para Etapa 3", type="secondary", use_container_width=True):
                 st.session_state.etapa_atual = 3
@@ -786,25 +897,18 @@ else:
                     st.metric("Total Cancelamentos", resumo.get('total_cancelamentos', 0))
                 
                 # Botão para download
-                with open(st.session_state.caminho_planilha, 'rb') as f:
-                    st.download_button(
-                        label="📥 Baixar Planilha Consolidada",
-                        data=f,
-                        file_name=os.path.basename(st.session_state.caminho_planilha),
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        type="primary",
-                        use_container_width=True
-                    )
+                botao_download("📥 Baixar Planilha Consolidada", st.session_state.caminho_planilha, "primary")
+                
+                if st.session_state.caminho_alunos and os.path.exists(st.session_state.caminho_alunos):
+                    botao_download("📥 Baixar Dados de Alunos (todos os relatórios)",
+                                   st.session_state.caminho_alunos, "secondary")
                 
                 # Mostrar preview da planilha
                 with st.expander("🔍 Visualizar Estrutura da Planilha", expanded=False):
                     try:
-                        # Ler a planilha para mostrar abas
-                        xls = pd.ExcelFile(st.session_state.caminho_planilha)
-                        st.info(f"**Abas disponíveis:** {', '.join(xls.sheet_names)}")
-                        
-                        # Mostrar preview da primeira aba
-                        df_preview = pd.read_excel(st.session_state.caminho_planilha, sheet_name='RESUMO GERAL')
+                        # Abas e prévia da primeira aba (lidas uma vez por versão do arquivo)
+                        abas, df_preview = previa_planilha(st.session_state.caminho_planilha)
+                        st.info(f"**Abas disponíveis:** {', '.join(abas)}")
                         st.dataframe(df_preview, use_container_width=True)
                     except Exception as e:
                         st.warning(f"Não foi possível visualizar a planilha: {str(e)}")
@@ -826,8 +930,13 @@ else:
                     st.session_state.consulta_concluida = False
                     st.session_state.resultados_geracao = {}
                     st.session_state.dados_consolidados = None
+                    st.session_state.indice_alunos = None
                     st.session_state.planilha_gerada = False
                     st.session_state.caminho_planilha = ''
+                    st.session_state.caminho_alunos = ''
+                    st.session_state.tarefa_geracao = None
+                    st.session_state.tarefa_processamento = None
+                    st.session_state.analise_incremental = None
                     st.session_state.etapa_atual = 2
                     st.rerun()
         else:
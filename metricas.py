@@ -0,0 +1,266 @@
+"""
+metricas.py - Métricas de execução expostas em HTTP local (Prometheus e JSON)
+
+Contadores, gauges e histogramas com rótulos, registrados pelos módulos da
+automação (HTTP, polling, downloads, leitura) e servidos em:
+    http://127.0.0.1:<PORTA_METRICAS>/metrics       (formato Prometheus)
+    http://127.0.0.1:<PORTA_METRICAS>/metrics.json  (snapshot JSON)
+"""
+import bisect
+import json
+import logging
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from config import PORTA_METRICAS
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 1800, 3600)
+BUCKETS_CONTAGEM = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _chave_rotulos(nomes: Sequence[str], rotulos: Dict) -> Tuple:
+    return tuple(str(rotulos.get(nome, '')) for nome in nomes)
+
+
+def _formatar_rotulos(nomes: Sequence[str], valores: Tuple, extra: str = '') -> str:
+    pares = [f'{nome}="{valor}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _cabecalho(self):
+        return [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    """Valor que só aumenta (requisições, falhas, bytes)"""
+    tipo = 'counter'
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = _chave_rotulos(self.rotulos, rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def exportar_texto(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        return self._cabecalho() + [
+            f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {valor}" for chave, valor in itens
+        ]
+
+    def snapshot(self):
+        with self._lock:
+            return [{'rotulos': dict(zip(self.rotulos, chave)), 'valor': valor}
+                    for chave, valor in self._valores.items()]
+
+
+class Gauge(Contador):
+    """Valor instantâneo (profundidade de fila, vazão do último download)"""
+    tipo = 'gauge'
+
+    def set(self, valor: float, **rotulos):
+        chave = _chave_rotulos(self.rotulos, rotulos)
+        with self._lock:
+            self._valores[chave] = valor
+
+
+class Histograma(_Metrica):
+    """Distribuição de valores em buckets cumulativos (latências, durações)"""
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_SEGUNDOS):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor: float, **rotulos):
+        chave = _chave_rotulos(self.rotulos, rotulos)
+        with self._lock:
+            estado = self._valores.get(chave)
+            if estado is None:
+                estado = self._valores[chave] = {'buckets': [0] * len(self.buckets), 'soma': 0.0, 'contagem': 0}
+            posicao = bisect.bisect_left(self.buckets, valor)
+            if posicao < len(self.buckets):
+                estado['buckets'][posicao] += 1
+            estado['soma'] += valor
+            estado['contagem'] += 1
+
+    def exportar_texto(self):
+        linhas = self._cabecalho()
+        with self._lock:
+            itens = [(chave, dict(estado, buckets=list(estado['buckets']))) for chave, estado in self._valores.items()]
+        for chave, estado in itens:
+            acumulado = 0
+            for limite, quantidade in zip(self.buckets, estado['buckets']):
+                acumulado += quantidade
+                rotulos = _formatar_rotulos(self.rotulos, chave, f'le="{limite}"')
+                linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+            rotulos = _formatar_rotulos(self.rotulos, chave, 'le="+Inf"')
+            linhas.append(f"{self.nome}_bucket{rotulos} {estado['contagem']}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {estado['soma']}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {estado['contagem']}")
+        return linhas
+
+    def snapshot(self):
+        with self._lock:
+            return [{
+                'rotulos': dict(zip(self.rotulos, chave)),
+                'contagem': estado['contagem'],
+                'soma': round(estado['soma'], 6),
+                'media': round(estado['soma'] / estado['contagem'], 6) if estado['contagem'] else 0
+            } for chave, estado in self._valores.items()]
+
+
+class RegistroMetricas:
+    """Conjunto de métricas nomeadas"""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, classe, nome, descricao, rotulos=(), **kwargs):
+        with self._lock:
+            if nome not in self._metricas:
+                self._metricas[nome] = classe(nome, descricao, rotulos, **kwargs)
+            return self._metricas[nome]
+
+    def contador(self, nome, descricao, rotulos=()) -> Contador:
+        return self._registrar(Contador, nome, descricao, rotulos)
+
+    def gauge(self, nome, descricao, rotulos=()) -> Gauge:
+        return self._registrar(Gauge, nome, descricao, rotulos)
+
+    def histograma(self, nome, descricao, rotulos=(), buckets=BUCKETS_SEGUNDOS) -> Histograma:
+        return self._registrar(Histograma, nome, descricao, rotulos, buckets=buckets)
+
+    def exportar_prometheus(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas = []
+        for metrica in metricas:
+            linhas.extend(metrica.exportar_texto())
+        return '\n'.join(linhas) + '\n'
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return {metrica.nome: {'tipo': metrica.tipo, 'valores': metrica.snapshot()} for metrica in metricas}
+
+
+registro = RegistroMetricas()
+
+# Métricas da automação
+HTTP_REQUISICOES = registro.contador(
+    'uff_http_requisicoes_total', 'Requisições HTTP ao portal por rota e status', ('metodo', 'rota', 'status'))
+HTTP_DURACAO = registro.histograma(
+    'uff_http_duracao_segundos', 'Latência das requisições HTTP por rota', ('rota',))
+POLLS_TOTAL = registro.contador(
+    'uff_polls_total', 'Verificações de status de relatórios')
+POLLS_SEM_ALTERACAO = registro.contador(
+    'uff_polls_sem_alteracao_total', 'Verificações de status sem mudança na página (sem novo parse)', ('motivo',))
+POLLS_POR_RELATORIO = registro.histograma(
+    'uff_polls_por_relatorio', 'Verificações de status necessárias por relatório', buckets=BUCKETS_CONTAGEM)
+PROCESSAMENTO_SERVIDOR = registro.histograma(
+    'uff_processamento_servidor_segundos', 'Tempo entre a submissão e o relatório ficar pronto')
+DOWNLOAD_BYTES = registro.contador(
+    'uff_download_bytes_total', 'Bytes baixados de relatórios')
+DOWNLOAD_DURACAO = registro.histograma(
+    'uff_download_duracao_segundos', 'Duração dos downloads de relatórios')
+DOWNLOAD_VAZAO = registro.gauge(
+    'uff_download_vazao_bytes_por_segundo', 'Vazão do último download')
+PARSE_DURACAO = registro.histograma(
+    'uff_parse_duracao_segundos', 'Tempo de leitura (parse) dos relatórios XLSX')
+LIMITE_CONCORRENCIA = registro.gauge(
+    'uff_limite_concorrencia', 'Limite AIMD de requisições simultâneas por classe', ('classe',))
+FILA_RELATORIOS = registro.gauge(
+    'uff_fila_relatorios', 'Relatórios do lote ainda não concluídos')
+FALHAS = registro.contador(
+    'uff_falhas_total', 'Falhas por etapa', ('etapa',))
+
+_ROTAS_NUMERICAS = re.compile(r'/\d+(?=/|$)')
+
+
+def normalizar_rota(url: str) -> str:
+    """Caminho da URL com IDs numéricos trocados por ':id' (baixa cardinalidade)"""
+    caminho = urlparse(url).path or '/'
+    return _ROTAS_NUMERICAS.sub('/:id', caminho)
+
+
+def observar_resposta(response, *args, **kwargs):
+    """Hook de resposta do requests: conta a requisição e registra a latência"""
+    try:
+        rota = normalizar_rota(response.request.url)
+        HTTP_REQUISICOES.inc(metodo=response.request.method, rota=rota, status=response.status_code)
+        HTTP_DURACAO.observar(response.elapsed.total_seconds(), rota=rota)
+    except Exception as e:
+        logger.debug(f"Falha ao registrar métrica HTTP: {str(e)}")
+    return response
+
+
+class _HandlerMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            corpo = json.dumps(registro.snapshot(), ensure_ascii=False).encode('utf-8')
+            tipo = 'application/json; charset=utf-8'
+        elif self.path.startswith('/metrics'):
+            corpo = registro.exportar_prometheus().encode('utf-8')
+            tipo = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+_servidor = None
+_servidor_lock = threading.Lock()
+
+
+def iniciar_servidor_metricas(porta: Optional[int] = PORTA_METRICAS, host: str = '127.0.0.1'):
+    """Inicia (uma única vez por processo) o servidor HTTP de métricas em segundo plano"""
+    global _servidor
+    if not porta:
+        return None
+    with _servidor_lock:
+        if _servidor is not None:
+            return _servidor
+        try:
+            _servidor = ThreadingHTTPServer((host, porta), _HandlerMetricas)
+        except OSError as e:
+            logger.warning(f"Servidor de métricas não iniciado na porta {porta}: {str(e)}")
+            return None
+        thread = threading.Thread(target=_servidor.serve_forever, name='servidor-metricas', daemon=True)
+        thread.start()
+        logger.info(f"Métricas disponíveis em http://{host}:{porta}/metrics")
+        return _servidor
+
+
+def parar_servidor_metricas():
+    global _servidor
+    with _servidor_lock:
+        if _servidor is not None:
+            _servidor.shutdown()
+            _servidor.server_close()
+            _servidor = None
@@ -0,0 +1,156 @@
+"""
+planejador_consultas.py - Planejamento de poucas consultas amplas ao portal
+
+Em vez de um relatório por curso × período × forma de ingresso, agrupa os
+pedidos por código de curso em consultas mais amplas (todos os períodos, ou
+todos os desdobramentos de um período) e separa localmente as linhas
+retornadas por período de ingresso, desdobramento e forma de ingresso.
+Quando a estimativa de linhas de uma consulta ampla passa do limite,
+recorre a consultas mais estreitas.
+"""
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    COBERTURA_MINIMA_PARTICAO, FORMAS_INGRESSO, LIMITE_LINHAS_CONSULTA, LINHAS_ESTIMADAS_POR_RELATORIO,
+    PRIMEIRO_PERIODO_PORTAL
+)
+
+logger = logging.getLogger(__name__)
+
+# Tipos de consulta, da mais ampla para a mais estreita
+CONSULTA_AMPLA = 'ampla'  # um código de curso, todos os períodos e desdobramentos
+CONSULTA_POR_PERIODO = 'por_periodo'  # um código de curso e período, todos os desdobramentos
+CONSULTA_ESTREITA = 'estreita'  # um curso (desdobramento) e período
+
+COLUNA_INGRESSO = 'ANO/SEMESTRE DE INGRESSO'
+COLUNA_DESDOBRAMENTO = 'DESDOBRAMENTO'
+COLUNA_FORMA_INGRESSO = 'FORMA DE INGRESSO'
+
+# Códigos do select de forma de ingresso por semestre (ver _determinar_forma_ingresso)
+CODIGOS_FORMA_INGRESSO = {'1': '125', '2': '124'}
+
+# Código do desdobramento no texto da coluna, ex.: "Química (312700)"
+_CODIGO_DESDOBRAMENTO = re.compile(r'\((\d+)\)')
+
+
+def contar_periodos(periodo_inicial: str, periodo_final: str) -> int:
+    """Número de semestres entre dois períodos AAAAS (inclusive)"""
+    inicio = int(periodo_inicial[:4]) * 2 + int(periodo_inicial[4]) - 1
+    fim = int(periodo_final[:4]) * 2 + int(periodo_final[4]) - 1
+    return max(0, fim - inicio + 1)
+
+
+def estimar_linhas(curso: Dict, periodo: str, estimativas: Optional[Dict] = None) -> int:
+    """Linhas esperadas do relatório curso × período (observadas ou padrão)"""
+    if estimativas:
+        return estimativas.get((curso['nome'], periodo), LINHAS_ESTIMADAS_POR_RELATORIO)
+    return LINHAS_ESTIMADAS_POR_RELATORIO
+
+
+def planejar_consultas(cursos: List[Dict], periodos: List[str], limite_linhas: int = LIMITE_LINHAS_CONSULTA,
+                       estimativas: Optional[Dict] = None) -> List[Dict]:
+    """Menor conjunto de consultas que cobre todos os pares curso × período
+
+    Cada consulta é um dict com 'tipo', 'codigo_curso', 'cursos', 'periodos'
+    e 'linhas_estimadas'. `estimativas` mapeia (nome do curso, período) para
+    o número de linhas já observado. Cursos de localidades diferentes não
+    são agrupados.
+    """
+    grupos = {}
+    for curso in cursos:
+        grupos.setdefault((curso.get('localidade', '1'), curso['codigo_curso']), []).append(curso)
+
+    consultas = []
+    for (_, codigo_curso), grupo in grupos.items():
+        # A consulta ampla traz todas as coortes do curso, não só as pedidas
+        media_periodo = sum(estimar_linhas(c, p, estimativas) for c in grupo for p in periodos) / max(1, len(periodos))
+        linhas_ampla = int(media_periodo * contar_periodos(PRIMEIRO_PERIODO_PORTAL, max(periodos)))
+        if len(periodos) > 1 and linhas_ampla <= limite_linhas:
+            consultas.append({'tipo': CONSULTA_AMPLA, 'codigo_curso': codigo_curso, 'cursos': grupo,
+                              'periodos': list(periodos), 'linhas_estimadas': linhas_ampla})
+            continue
+
+        for periodo in periodos:
+            linhas_periodo = sum(estimar_linhas(c, periodo, estimativas) for c in grupo)
+            if len(grupo) > 1 and linhas_periodo <= limite_linhas:
+                consultas.append({'tipo': CONSULTA_POR_PERIODO, 'codigo_curso': codigo_curso, 'cursos': grupo,
+                                  'periodos': [periodo], 'linhas_estimadas': linhas_periodo})
+                continue
+            for curso in grupo:
+                consultas.append({'tipo': CONSULTA_ESTREITA, 'codigo_curso': codigo_curso, 'cursos': [curso],
+                                  'periodos': [periodo], 'linhas_estimadas': estimar_linhas(curso, periodo, estimativas)})
+
+    logger.info(f"Plano: {len(consultas)} consultas para {len(cursos) * len(periodos)} relatórios")
+    return consultas
+
+
+def filtros_consulta(consulta: Dict) -> Dict:
+    """Filtros do formulário de listagem para uma consulta ampla ou por período"""
+    if consulta['tipo'] == CONSULTA_AMPLA:
+        periodo, forma_ingresso = '', ''
+    else:
+        periodo = consulta['periodos'][0]
+        forma_ingresso = CODIGOS_FORMA_INGRESSO[periodo[4]]
+    desdobramento = consulta['cursos'][0]['codigo_desdobramento'] if len(consulta['cursos']) == 1 else ''
+    return {
+        'idlocalidade': consulta['cursos'][0].get('localidade', '1'),  # Niterói, se não informada
+        'idcurso': consulta['codigo_curso'],
+        'iddesdobramento': desdobramento,
+        'idturno': '',
+        'idstatusaluno': '',
+        'idsituacaoaluno': '',
+        'idformaingresso': forma_ingresso,
+        'idacaoafirmativa': '',
+        'anosem_ingresso': periodo,
+        'anosem_desvinculacao': '',
+        'format': 'xls'
+    }
+
+
+def particionar_relatorio(df, consulta: Dict) -> Dict[Tuple[str, str], object]:
+    """Separa as linhas de uma consulta ampla em um DataFrame por (nome do curso, período)
+
+    Mantém as mesmas linhas que o relatório estreito equivalente traria:
+    desdobramento do curso, período de ingresso e a edição do SISU do semestre.
+    Levanta ValueError se o relatório não tiver as colunas necessárias ou se
+    as partes não cobrirem as linhas dos períodos pedidos (ex.: DESDOBRAMENTO
+    em outro formato), para que os pares sejam gerados com relatórios estreitos.
+    """
+    faltantes = [c for c in (COLUNA_INGRESSO, COLUNA_DESDOBRAMENTO, COLUNA_FORMA_INGRESSO) if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Relatório sem as colunas {faltantes}; não é possível particionar")
+
+    periodo = df[COLUNA_INGRESSO].astype(str).str.replace(r'\D', '', regex=True).str[:5]
+    desdobramento = df[COLUNA_DESDOBRAMENTO].astype(str)
+    forma = df[COLUNA_FORMA_INGRESSO].astype(str)
+
+    partes = {}
+    esperadas = None
+    for p in consulta['periodos']:
+        edicao = FORMAS_INGRESSO[p[4]]
+        do_periodo = (periodo == p) & forma.str.contains(re.escape(edicao), regex=True)
+        esperadas = do_periodo if esperadas is None else esperadas | do_periodo
+        for curso in consulta['cursos']:
+            do_curso = desdobramento.str.contains(f"({curso['codigo_desdobramento']})", regex=False)
+            partes[(curso['nome'], p)] = df.loc[(do_curso & do_periodo).to_numpy()].reset_index(drop=True)
+    _verificar_cobertura(partes, esperadas, desdobramento, consulta)
+    return partes
+
+
+def _verificar_cobertura(partes: Dict, esperadas, desdobramento, consulta: Dict):
+    """Levanta ValueError se as partes deixarem de fora linhas que deveriam conter
+
+    Linhas dos períodos pedidos cujo DESDOBRAMENTO traz o código de outro
+    desdobramento (não pedido) ficam de fora de propósito; as demais devem
+    estar em alguma parte.
+    """
+    codigos = {str(curso['codigo_desdobramento']) for curso in consulta['cursos']}
+    codigo_linha = desdobramento.str.extract(_CODIGO_DESDOBRAMENTO, expand=False)
+    de_outro_curso = codigo_linha.notna() & ~codigo_linha.isin(codigos)
+    total = int((esperadas & ~de_outro_curso).sum())
+    cobertas = sum(len(parte) for parte in partes.values())
+    if total and cobertas < total * COBERTURA_MINIMA_PARTICAO:
+        raise ValueError(f"Partes cobrem {cobertas} de {total} linhas dos períodos pedidos; "
+                         f"formato de {COLUNA_DESDOBRAMENTO} não reconhecido")
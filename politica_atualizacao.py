@@ -0,0 +1,199 @@
+"""
+politica_atualizacao.py - Política de atualização por idade da coorte
+
+Coortes antigas (ex.: ingresso 2013/1) quase não mudam; coortes recentes
+mudam a cada semestre. Cada relatório curso × período baixado fica
+registrado em um índice local com o instante do download e ganha um prazo
+de validade que cresce com a idade da coorte. Só os relatórios vencidos
+são gerados de novo; os demais são servidos do disco.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional
+
+from config import ARQUIVO_CACHE_RELATORIOS, ORCAMENTO_FRESCOR, VALIDADE_COORTES_ANTIGAS_HORAS
+from utils import bloqueio_arquivo
+
+logger = logging.getLogger(__name__)
+
+
+def periodo_atual(referencia: Optional[date] = None) -> str:
+    """Período letivo AAAAS da data de referência (1º semestre até junho)"""
+    referencia = referencia or date.today()
+    return f"{referencia.year}{1 if referencia.month <= 6 else 2}"
+
+
+def idade_coorte(periodo: str, referencia: Optional[date] = None) -> int:
+    """Semestres decorridos desde o ingresso da coorte até o período atual"""
+    atual = periodo_atual(referencia)
+    return (int(atual[:4]) * 2 + int(atual[4])) - (int(periodo[:4]) * 2 + int(periodo[4]))
+
+
+def validade_horas(periodo: str, referencia: Optional[date] = None) -> float:
+    """Prazo de validade (horas) do relatório de uma coorte, conforme ORCAMENTO_FRESCOR"""
+    idade = idade_coorte(periodo, referencia)
+    for idade_maxima, horas in ORCAMENTO_FRESCOR:
+        if idade <= idade_maxima:
+            return horas
+    return VALIDADE_COORTES_ANTIGAS_HORAS
+
+
+class CacheRelatorios:
+    """Índice JSON (curso|período -> arquivo baixado e instante do download)
+
+    Vários lotes podem usar o mesmo índice ao mesmo tempo (tarefas da
+    interface, CLI): salvar() relê o arquivo e mescla, sob trava, em vez de
+    sobrescrever as entradas gravadas pelos outros.
+    """
+
+    def __init__(self, caminho: str = ARQUIVO_CACHE_RELATORIOS, gestor=None):
+        self.caminho = caminho
+        self.gestor = gestor  # GestorDisco: restaura relatórios comprimidos
+        self._lock = threading.Lock()
+        self._entradas = self._ler_indice()
+
+    def _ler_indice(self) -> Dict:
+        if not os.path.exists(self.caminho):
+            return {}
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao carregar índice de relatórios: {str(e)}")
+            return {}
+
+    def _mesclar(self, entradas: Dict):
+        """Fica, por curso|período, a entrada do download mais recente"""
+        with self._lock:
+            for chave, entrada in entradas.items():
+                atual = self._entradas.get(chave)
+                if atual is None or entrada['baixado_em'] > atual['baixado_em']:
+                    self._entradas[chave] = entrada
+
+    def recarregar(self):
+        """Acrescenta os downloads registrados por outros lotes desde a carga"""
+        self._mesclar(self._ler_indice())
+
+    @staticmethod
+    def _chave(curso: str, periodo: str) -> str:
+        return f"{curso}|{periodo}"
+
+    def registrar(self, resultado: Dict, baixado_em: Optional[float] = None):
+        """Registra um resultado de geração bem-sucedido"""
+        if not resultado.get('success') or not resultado.get('caminho_arquivo'):
+            return
+        if resultado.get('origem'):
+            # Reaproveitado (cache, manifesto): mantém o instante do download original
+            return
+        with self._lock:
+            self._entradas[self._chave(resultado['curso'], resultado['periodo'])] = {
+                'curso': resultado['curso'],
+                'periodo': resultado['periodo'],
+                'caminho_arquivo': resultado['caminho_arquivo'],
+                'relatorio_id': resultado.get('relatorio_id'),
+                'baixado_em': baixado_em or time.time()
+            }
+
+    def registrar_resultados(self, resultados_geracao: Dict):
+        for resultados_curso in resultados_geracao.values():
+            for resultado in resultados_curso:
+                self.registrar(resultado)
+
+    def salvar(self):
+        with bloqueio_arquivo(self.caminho):
+            self.recarregar()
+            with self._lock:
+                temporario = f"{self.caminho}.tmp"
+                with open(temporario, 'w', encoding='utf-8') as f:
+                    json.dump(self._entradas, f, ensure_ascii=False, indent=2)
+                os.replace(temporario, self.caminho)
+
+    def obter(self, curso: str, periodo: str) -> Optional[Dict]:
+        """Entrada do índice, se o arquivo ainda existir"""
+        with self._lock:
+            entrada = self._entradas.get(self._chave(curso, periodo))
+        if entrada is None:
+            return None
+        from gestor_disco import caminho_disponivel
+
+        if caminho_disponivel(entrada['caminho_arquivo'], self.gestor):
+            return entrada
+        return None
+
+    def esta_fresco(self, curso: str, periodo: str, agora: Optional[float] = None) -> bool:
+        entrada = self.obter(curso, periodo)
+        if entrada is None:
+            return False
+        idade_horas = ((agora or time.time()) - entrada['baixado_em']) / 3600
+        return idade_horas < validade_horas(periodo)
+
+    def frescos(self, cursos: List[Dict], periodos: List[str], agora: Optional[float] = None) -> Dict:
+        """Resultados reaproveitáveis, por (nome do curso, período), dentro do prazo de validade"""
+        self.recarregar()
+        reaproveitados = {}
+        for curso in cursos:
+            for periodo in periodos:
+                if self.esta_fresco(curso['nome'], periodo, agora):
+                    entrada = self.obter(curso['nome'], periodo)
+                    reaproveitados[(curso['nome'], periodo)] = {
+                        'success': True,
+                        'relatorio_id': entrada.get('relatorio_id'),
+                        'caminho_arquivo': entrada['caminho_arquivo'],
+                        'curso': curso['nome'],
+                        'periodo': periodo,
+                        'origem': 'cache',
+                        'baixado_em': entrada['baixado_em']
+                    }
+        logger.info(f"Política de atualização: {len(reaproveitados)} de {len(cursos) * len(periodos)} "
+                    f"relatórios dentro do prazo de validade")
+        return reaproveitados
+
+
+def gerar_com_politica(gerador, cursos: List[Dict], periodos: List[str], cache: Optional[CacheRelatorios] = None,
+                       planejado: bool = False, forcar: bool = False, ignorar=(),
+                       reaproveitados: Optional[Dict] = None, gestor=None, **kwargs) -> Dict:
+    """Gera só os relatórios vencidos e junta os reaproveitados do cache
+
+    Com forcar=True todos são gerados de novo (e o índice é atualizado).
+    `reaproveitados` acrescenta resultados de outra origem (ex.: manifesto
+    de uma execução anterior). Antes e depois do lote, o GestorDisco
+    aplica o orçamento de disco sem tocar nos relatórios do lote. Os demais
+    argumentos seguem para gerar_relatorios_em_lote / gerar_relatorios_planejados.
+    """
+    from gestor_disco import GestorDisco
+
+    gestor = gestor or GestorDisco()
+    cache = cache or CacheRelatorios(gestor=gestor)
+    reaproveitados = dict(reaproveitados or {})
+    if not forcar:
+        reaproveitados.update(cache.frescos(cursos, periodos))
+    gestor.manter(protegidos=[r['caminho_arquivo'] for r in reaproveitados.values()])
+
+    # Relatórios já no disco seguem para o consumidor enquanto os vencidos são gerados
+    consumidor = kwargs.get('consumidor')
+    if consumidor is not None:
+        for resultado in reaproveitados.values():
+            consumidor(resultado)
+
+    metodo = gerador.gerar_relatorios_planejados if planejado else gerador.gerar_relatorios_em_lote
+    novos = metodo(cursos, periodos, ignorar=set(ignorar) | set(reaproveitados), **kwargs)
+    cache.registrar_resultados(novos)
+    cache.salvar()
+
+    resultados = {curso['nome']: [] for curso in cursos}
+    for (curso_nome, _), resultado in reaproveitados.items():
+        if curso_nome in resultados:
+            resultados[curso_nome].append(resultado)
+    for curso_nome, resultados_curso in novos.items():
+        resultados[curso_nome].extend(resultados_curso)
+    for resultados_curso in resultados.values():
+        resultados_curso.sort(key=lambda resultado: resultado.get('periodo', ''))
+
+    gestor.registrar_resultados(resultados)
+    gestor.manter(protegidos=[r['caminho_arquivo'] for lista in resultados.values()
+                              for r in lista if r.get('caminho_arquivo')])
+    return resultados
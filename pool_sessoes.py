@@ -0,0 +1,150 @@
+"""
+pool_sessoes.py - Uma sessão HTTP por thread, todas com o mesmo login
+
+requests.Session não é segura para uso concorrente. O pool guarda uma
+cópia (cookies e cabeçalhos, incluindo o X-CSRF-Token) da sessão
+autenticada e entrega a cada thread a sua própria sessão clonada dessa
+cópia. Um novo login publica uma nova versão da cópia; cada thread
+atualiza a sua sessão na próxima requisição, e só uma thread faz o login
+quando várias percebem a sessão expirada ao mesmo tempo.
+
+As sessões ficam registradas pela thread viva que as usa: quando a
+thread termina (ex.: threads temporárias de um ThreadPoolExecutor), a
+sessão e o seu pool de conexões são fechados. fechar() encerra as
+restantes ao fim de uma execução; uma thread que volte a usar o pool
+recebe uma sessão nova.
+
+SessaoCompartilhada tem a interface de requests.Session e pode ser
+passada no lugar dela para GeradorRelatorios, FormularioHandler e
+RelatorioUFFAutomator.
+"""
+import itertools
+import logging
+import threading
+import weakref
+from typing import Dict
+
+import requests
+
+from cassete_http import montar_cassete
+from instrumentacao_http import instrumentar_sessao
+
+logger = logging.getLogger(__name__)
+
+
+def _descartar_sessao(sessoes: Dict[int, requests.Session], lock, chave: int):
+    # Não referencia o pool: um pool sem uso pode ser coletado mesmo com threads vivas
+    with lock:
+        sessao = sessoes.pop(chave, None)
+    if sessao is not None:
+        sessao.close()
+
+
+class _SessaoDaThread:
+    """Guardada no threading.local do pool; descartada (e a sessão fechada) quando a thread termina"""
+
+    __slots__ = ('chave', 'sessao', '__weakref__')
+
+    def __init__(self, chave: int, sessao: requests.Session):
+        self.chave = chave
+        self.sessao = sessao
+
+
+class PoolSessoes:
+    """Sessões por thread clonadas de um único login"""
+
+    def __init__(self, authenticator, controlador=None):
+        self.authenticator = authenticator
+        self.controlador = controlador  # ControladorConcorrencia (limite AIMD), opcional
+        self.versao = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sessoes: Dict[int, requests.Session] = {}  # sessões das threads vivas
+        self._sessoes_lock = threading.RLock()
+        self._chaves = itertools.count()
+        self._publicar(authenticator.session)
+
+    def _publicar(self, session: requests.Session):
+        """Copia cookies e cabeçalhos da sessão autenticada como nova versão"""
+        cookies = requests.cookies.RequestsCookieJar()
+        cookies.update(session.cookies)
+        self._cookies = cookies
+        self._headers = dict(session.headers)
+        self.versao += 1
+
+    def _clonar(self, sessao: requests.Session):
+        # Chamado com o lock: cookies e cabeçalhos da mesma versão
+        sessao.cookies.clear()
+        sessao.cookies.update(self._cookies)
+        sessao.headers.clear()
+        sessao.headers.update(self._headers)
+        self._local.versao = self.versao
+
+    def _nova_sessao(self) -> requests.Session:
+        sessao = requests.Session()
+        instrumentar_sessao(sessao)
+        if self.controlador is not None:
+            from controle_concorrencia import montar_controle
+            montar_controle(sessao, self.controlador)
+        montar_cassete(sessao)
+
+        registro = _SessaoDaThread(next(self._chaves), sessao)
+        with self._sessoes_lock:
+            self._sessoes[registro.chave] = sessao
+        weakref.finalize(registro, _descartar_sessao, self._sessoes, self._sessoes_lock, registro.chave)
+        self._local.registro = registro
+        with self._lock:
+            self._clonar(sessao)
+        return sessao
+
+    def sessao(self) -> requests.Session:
+        """Sessão da thread atual, atualizada para a versão mais recente do login"""
+        registro = getattr(self._local, 'registro', None)
+        if registro is None or registro.chave not in self._sessoes:
+            return self._nova_sessao()
+        if self._local.versao != self.versao:
+            with self._lock:
+                self._clonar(registro.sessao)
+        return registro.sessao
+
+    def abertas(self) -> int:
+        """Sessões abertas (uma por thread viva que usou o pool)"""
+        return len(self._sessoes)
+
+    def reautenticar(self) -> bool:
+        """Refaz o login e publica a nova sessão para todas as threads
+
+        Se outra thread já renovou o login depois que esta obteve a sua
+        sessão, apenas usa a versão nova.
+        """
+        versao_vista = getattr(self._local, 'versao', self.versao)
+        with self._lock:
+            if self.versao != versao_vista:
+                return True
+            logger.info("Sessão expirada; refazendo login")
+            if not self.authenticator.login():
+                logger.error("Falha ao refazer login")
+                return False
+            self._publicar(self.authenticator.session)
+        return True
+
+    def fechar(self):
+        """Fecha as sessões de todas as threads (ao fim de uma execução)"""
+        with self._sessoes_lock:
+            sessoes = list(self._sessoes.values())
+            self._sessoes.clear()
+        for sessao in sessoes:
+            sessao.close()
+
+
+class SessaoCompartilhada:
+    """Fachada com a interface de requests.Session que usa a sessão da thread atual"""
+
+    def __init__(self, pool: PoolSessoes):
+        self.pool = pool
+
+    def reautenticar(self) -> bool:
+        return self.pool.reautenticar()
+
+    def __getattr__(self, nome):
+        return getattr(self.pool.sessao(), nome)
@@ -0,0 +1,105 @@
+"""
+portal_simulado.py - Servidor HTTP local que imita um portal que degrada sob carga
+
+Usado pelo benchmark de concorrência (python benchmark.py concorrencia).
+Até `capacidade` requisições simultâneas respondem em `latencia_base`;
+acima disso cada requisição extra acrescenta `penalidade` × latência de
+base (fila no servidor), e acima de `limite_rejeicao` o servidor responde
+503 na hora, como um proxy sobrecarregado.
+"""
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class PortalSimulado:
+    """Servidor em thread própria; use como context manager"""
+
+    def __init__(self, capacidade: int = 6, latencia_base: float = 0.02, penalidade: float = 0.5,
+                 limite_rejeicao: int = 12, tamanho_download: int = 64 * 1024):
+        self.capacidade = capacidade
+        self.latencia_base = latencia_base
+        self.penalidade = penalidade
+        self.limite_rejeicao = limite_rejeicao
+        self.corpo_download = b'x' * tamanho_download
+        self.ativos = 0
+        self.pico = 0
+        self.rejeitadas = 0
+        self._lock = threading.Lock()
+        self._servidor = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._servidor.server_port}"
+
+    def _entrar(self):
+        with self._lock:
+            self.ativos += 1
+            self.pico = max(self.pico, self.ativos)
+            ativos = self.ativos
+        if ativos > self.limite_rejeicao:
+            with self._lock:
+                self.rejeitadas += 1
+            return None
+        excesso = max(0, ativos - self.capacidade)
+        return self.latencia_base * (1 + excesso * self.penalidade)
+
+    def _sair(self):
+        with self._lock:
+            self.ativos -= 1
+
+    def _criar_handler(self):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _responder(self):
+                latencia = portal._entrar()
+                try:
+                    if latencia is None:
+                        self._enviar(503, b'Servidor sobrecarregado')
+                        return
+                    time.sleep(latencia)
+                    if re.search(r'/relatorios/\d+/?$', self.path):
+                        self._enviar(200, b'<div id="relatorioStepsBar"><div class="step">'
+                                          b'<span class="label-active">Gerando</span></div></div>')
+                    elif 'download' in self.path:
+                        self._enviar(200, portal.corpo_download)
+                    else:
+                        self._enviar(200, b'<div class="alert-success">Sucesso</div>')
+                finally:
+                    portal._sair()
+
+            def _enviar(self, status, corpo):
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            do_GET = _responder
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self._responder()
+
+        return Handler
+
+    def iniciar(self):
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', 0), self._criar_handler())
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        return self
+
+    def parar(self):
+        if self._servidor:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *args):
+        self.parar()
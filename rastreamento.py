@@ -0,0 +1,195 @@
+"""
+rastreamento.py - Spans de tempo aninhados para as etapas da automação
+
+Cada etapa (login, submissão, polling, download, leitura, escrita) é medida
+por um span com atributos (curso, período, relatorio_id, bytes...). Os spans
+são gravados em um arquivo JSON-lines, que pode ser convertido para o
+formato Chrome Trace e aberto no Perfetto/chrome://tracing como linha do tempo.
+
+Uso:
+    python rastreamento.py trace.jsonl trace_chrome.json
+"""
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from config import ARQUIVO_RASTREAMENTO
+
+logger = logging.getLogger(__name__)
+
+_span_atual = contextvars.ContextVar('span_atual', default=None)
+_ids = itertools.count(1)
+_exportador = None
+
+
+class Span:
+    """Intervalo de tempo nomeado com atributos e span pai"""
+
+    __slots__ = ('nome', 'span_id', 'parent_id', 'atributos', 'inicio', '_t0')
+
+    def __init__(self, nome: str, parent_id: Optional[int], atributos: Dict):
+        self.nome = nome
+        self.span_id = next(_ids)
+        self.parent_id = parent_id
+        self.atributos = atributos
+        self.inicio = time.time()
+        self._t0 = time.perf_counter()
+
+    def definir(self, **atributos):
+        self.atributos.update(atributos)
+
+
+class _SpanNulo:
+    """Span usado quando o rastreamento está desativado"""
+
+    def definir(self, **atributos):
+        pass
+
+
+SPAN_NULO = _SpanNulo()
+
+
+class ExportadorJSONL:
+    """Grava um span finalizado por linha em um arquivo JSON-lines"""
+
+    def __init__(self, caminho: str):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self._arquivo = open(caminho, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def exportar(self, span: Span, duracao: float):
+        registro = {
+            'nome': span.nome,
+            'span_id': span.span_id,
+            'parent_id': span.parent_id,
+            'inicio': round(span.inicio, 6),
+            'duracao_ms': round(duracao * 1000, 3),
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'atributos': span.atributos
+        }
+        linha = json.dumps(registro, ensure_ascii=False, default=str)
+        with self._lock:
+            self._arquivo.write(linha + '\n')
+            self._arquivo.flush()
+
+    def fechar(self):
+        with self._lock:
+            self._arquivo.close()
+
+
+def configurar_rastreamento(caminho: Optional[str]):
+    """Ativa a exportação de spans para `caminho` (None desativa)"""
+    global _exportador
+    if _exportador is not None:
+        _exportador.fechar()
+        _exportador = None
+    if caminho:
+        _exportador = ExportadorJSONL(caminho)
+        logger.info(f"Rastreamento ativado: {caminho}")
+
+
+def rastreamento_ativo() -> bool:
+    return _exportador is not None
+
+
+@contextmanager
+def span(nome: str, **atributos):
+    """Abre um span filho do span atual; exceções ficam registradas no atributo 'erro'"""
+    if _exportador is None:
+        yield SPAN_NULO
+        return
+
+    pai = _span_atual.get()
+    atual = Span(nome, pai.span_id if pai else None, atributos)
+    token = _span_atual.set(atual)
+    try:
+        yield atual
+    except BaseException as e:
+        atual.atributos['erro'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _span_atual.reset(token)
+        exportador = _exportador
+        if exportador is not None:
+            exportador.exportar(atual, time.perf_counter() - atual._t0)
+
+
+def definir_atributos(**atributos):
+    """Acrescenta atributos ao span atual (sem efeito se não houver span)"""
+    atual = _span_atual.get()
+    if atual is not None:
+        atual.definir(**atributos)
+
+
+def rastrear(nome: Optional[str] = None, argumentos=()):
+    """Decorador que envolve a função em um span, copiando os argumentos nomeados como atributos"""
+    def decorador(funcao):
+        nome_span = nome or funcao.__qualname__
+        assinatura = inspect.signature(funcao)
+
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            if _exportador is None:
+                return funcao(*args, **kwargs)
+            atributos = {}
+            if argumentos:
+                ligados = assinatura.bind_partial(*args, **kwargs).arguments
+                atributos = {arg: ligados[arg] for arg in argumentos if arg in ligados}
+            with span(nome_span, **atributos):
+                return funcao(*args, **kwargs)
+
+        return envoltorio
+    return decorador
+
+
+def converter_para_chrome_trace(caminho_jsonl: str, caminho_saida: str) -> int:
+    """Converte o JSON-lines para o formato Chrome Trace (Perfetto, chrome://tracing)"""
+    eventos = []
+    threads = {}
+    with open(caminho_jsonl, 'r', encoding='utf-8') as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            registro = json.loads(linha)
+            tid = threads.setdefault((registro['pid'], registro['thread']), len(threads) + 1)
+            eventos.append({
+                'name': registro['nome'],
+                'ph': 'X',
+                'ts': registro['inicio'] * 1e6,
+                'dur': registro['duracao_ms'] * 1000,
+                'pid': registro['pid'],
+                'tid': tid,
+                'args': registro['atributos']
+            })
+    for (pid, nome_thread), tid in threads.items():
+        eventos.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                        'args': {'name': nome_thread}})
+
+    with open(caminho_saida, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': eventos}, f, ensure_ascii=False)
+    return len(eventos)
+
+
+if ARQUIVO_RASTREAMENTO:
+    configurar_rastreamento(ARQUIVO_RASTREAMENTO)
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        print("Uso: python rastreamento.py trace.jsonl trace_chrome.json")
+        sys.exit(1)
+    total = converter_para_chrome_trace(sys.argv[1], sys.argv[2])
+    print(f"{total} eventos convertidos para {sys.argv[2]}")
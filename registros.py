@@ -0,0 +1,156 @@
+"""
+registros.py - Registros compactos de cada trabalho de geração
+
+Cada curso × período passava pelo código como dicionários soltos: os
+filtros, o resultado da submissão (com o HTML inteiro da resposta), o
+status_info (etapas, detalhes e filtros da página) e o resultado final,
+que carregava o status_info completo e ficava em
+st.session_state.resultados_geracao. Com milhares de trabalhos, isso
+domina a memória da sessão.
+
+As classes abaixo usam __slots__ (sem __dict__ por instância) e guardam
+só o que é usado depois: a submissão não guarda o HTML, e o resultado
+guarda o resumo do status. Para não mudar quem consome esses dados, elas
+têm a interface de leitura de dict (r['curso'], r.get('error'),
+'origem' in r, dict(r)). Um campo None conta como chave ausente, como nos
+dicionários antigos, que só tinham as chaves preenchidas.
+"""
+from typing import Dict, Optional
+
+
+class Registro:
+    """Base com a interface de dict sobre os campos de __slots__"""
+
+    __slots__ = ()
+
+    def __getitem__(self, chave):
+        valor = getattr(self, chave) if chave in self.__slots__ else None
+        if valor is None:
+            raise KeyError(chave)
+        return valor
+
+    def __setitem__(self, chave, valor):
+        if chave not in self.__slots__:
+            raise KeyError(f"{type(self).__name__} não tem o campo {chave!r}")
+        setattr(self, chave, valor)
+
+    def get(self, chave, padrao=None):
+        valor = getattr(self, chave) if chave in self.__slots__ else None
+        return padrao if valor is None else valor
+
+    def __contains__(self, chave) -> bool:
+        return self.get(chave) is not None
+
+    def keys(self):
+        return [campo for campo in self.__slots__ if getattr(self, campo) is not None]
+
+    def items(self):
+        return [(campo, getattr(self, campo)) for campo in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __eq__(self, outro) -> bool:
+        if isinstance(outro, (Registro, dict)):
+            return self.para_dict() == dict(outro)
+        return NotImplemented
+
+    def copia(self):
+        novo = object.__new__(type(self))
+        for campo in self.__slots__:
+            setattr(novo, campo, getattr(self, campo))
+        return novo
+
+    def para_dict(self) -> Dict:
+        return {campo: valor.para_dict() if isinstance(valor, Registro) else valor
+                for campo, valor in self.items()}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.para_dict()!r})"
+
+
+def para_json(objeto):
+    """`default` de json.dump para estruturas com registros"""
+    if isinstance(objeto, Registro):
+        return objeto.para_dict()
+    return str(objeto)
+
+
+class FiltrosRelatorio(Registro):
+    """Campos do formulário de listagem de alunos para um curso × período"""
+
+    __slots__ = ('idlocalidade', 'idcurso', 'iddesdobramento', 'idturno', 'idstatusaluno', 'idsituacaoaluno',
+                 'idformaingresso', 'idacaoafirmativa', 'anosem_ingresso', 'anosem_desvinculacao', 'format')
+
+    def __init__(self, idcurso: str, iddesdobramento: str, idformaingresso: str, anosem_ingresso: str,
+                 idlocalidade: str = '1', idturno: str = '', idstatusaluno: str = '', idsituacaoaluno: str = '',
+                 idacaoafirmativa: str = '', anosem_desvinculacao: str = '', format: str = 'xls'):
+        self.idlocalidade = idlocalidade
+        self.idcurso = idcurso
+        self.iddesdobramento = iddesdobramento
+        self.idturno = idturno
+        self.idstatusaluno = idstatusaluno
+        self.idsituacaoaluno = idsituacaoaluno
+        self.idformaingresso = idformaingresso
+        self.idacaoafirmativa = idacaoafirmativa
+        self.anosem_ingresso = anosem_ingresso
+        self.anosem_desvinculacao = anosem_desvinculacao
+        self.format = format
+
+
+class SubmissaoFormulario(Registro):
+    """Resultado da submissão do formulário (sem o HTML da resposta)"""
+
+    __slots__ = ('success', 'relatorio_id', 'url_relatorio', 'error')
+
+    def __init__(self, success: bool, relatorio_id: Optional[str] = None, url_relatorio: Optional[str] = None,
+                 error: Optional[str] = None):
+        self.success = success
+        self.relatorio_id = relatorio_id
+        self.url_relatorio = url_relatorio
+        self.error = error
+
+
+class StatusRelatorio(Registro):
+    """Situação de um relatório lida da página de status"""
+
+    __slots__ = ('id', 'status', 'titulo', 'etapas', 'detalhes', 'filtros', 'download_url', 'erro')
+
+    def __init__(self, id, status: str = 'DESCONHECIDO', titulo: Optional[str] = None, etapas=None,
+                 detalhes: Optional[Dict] = None, filtros: Optional[Dict] = None,
+                 download_url: Optional[str] = None, erro: Optional[str] = None):
+        self.id = id
+        self.status = status
+        self.titulo = titulo
+        self.etapas = etapas
+        self.detalhes = detalhes
+        self.filtros = filtros
+        self.download_url = download_url
+        self.erro = erro
+
+    def resumo(self) -> 'StatusRelatorio':
+        """Só identificação, situação e link: o que o resultado guarda depois do download"""
+        return StatusRelatorio(self.id, self.status, self.titulo, download_url=self.download_url, erro=self.erro)
+
+
+class ResultadoRelatorio(Registro):
+    """Resultado de um curso × período, guardado em resultados_geracao"""
+
+    __slots__ = ('success', 'curso', 'periodo', 'relatorio_id', 'caminho_arquivo', 'status_info', 'error',
+                 'consulta_origem', 'origem')
+
+    def __init__(self, success: bool, curso: str, periodo: str, relatorio_id: Optional[str] = None,
+                 caminho_arquivo: Optional[str] = None, status_info: Optional[StatusRelatorio] = None,
+                 error: Optional[str] = None, consulta_origem: Optional[str] = None, origem: Optional[str] = None):
+        self.success = success
+        self.curso = curso
+        self.periodo = periodo
+        self.relatorio_id = relatorio_id
+        self.caminho_arquivo = caminho_arquivo
+        self.status_info = status_info
+        self.error = error
+        self.consulta_origem = consulta_origem
+        self.origem = origem
@@ -1,19 +1,30 @@
 """
 relatorio_automator.py - Monitoramento e download de relatórios
 """
+import hashlib
 import requests
-from bs4 import BeautifulSoup
+import threading
 import time
 import os
 import re
 from datetime import datetime
-import pandas as pd
+from urllib.parse import urljoin
 import logging
 from config import *
 from utils import *
+from metricas import (
+    DOWNLOAD_BYTES, DOWNLOAD_DURACAO, DOWNLOAD_VAZAO, FALHAS, POLLS_POR_RELATORIO,
+    POLLS_SEM_ALTERACAO, POLLS_TOTAL, PROCESSAMENTO_SERVIDOR
+)
+from download_retomavel import DownloadRetomavel
+from rastreamento import definir_atributos, rastrear
+from registros import StatusRelatorio
 
 logger = logging.getLogger(__name__)
 
+# Situações em que não adianta continuar verificando o relatório
+STATUS_FALHA = ('ERRO', 'SESSAO_EXPIRADA')
+
 class RelatorioUFFAutomator:
     """Classe para monitorar e baixar relatórios do sistema UFF"""
     
@@ -21,33 +32,88 @@ class RelatorioUFFAutomator:
         self.session = session
         self.base_url = APLICACAO_URL
         
+        # Última página de status de cada relatório (hash, ETag, Last-Modified e status_info)
+        self._paginas_status = {}
+        self._paginas_lock = threading.Lock()
+        
+    @rastrear('automator.verificar_status', argumentos=('relatorio_id',))
     def verificar_status_relatorio(self, relatorio_id):
-        """Verifica o status de processamento de um relatório"""
+        """Verifica o status de processamento de um relatório
+        
+        Se a página não mudou desde a última verificação (304 para a
+        requisição condicional, ou corpo com o mesmo hash), devolve o
+        status_info anterior sem analisar o HTML de novo.
+        """
         url = f"{self.base_url}/relatorios/{relatorio_id}"
         
         try:
             logger.info(f"Verificando status do relatório #{relatorio_id}")
-            response = self.session.get(url, timeout=TIMEOUT_REQUESTS)
+            POLLS_TOTAL.inc()
+            with self._paginas_lock:
+                anterior = self._paginas_status.get(relatorio_id)
+            
+            headers = {}
+            if anterior and anterior['etag']:
+                headers['If-None-Match'] = anterior['etag']
+            if anterior and anterior['last_modified']:
+                headers['If-Modified-Since'] = anterior['last_modified']
+            response = self.session.get(url, timeout=TIMEOUT_REQUESTS, headers=headers)
+            
+            if response.status_code == 304 and anterior:
+                POLLS_SEM_ALTERACAO.inc(motivo='304')
+                return anterior['status_info'].copia()
+            if self._sessao_expirada(response):
+                return self._status_sessao_expirada(relatorio_id)
+            if response.status_code == 404:
+                return StatusRelatorio(relatorio_id, 'ERRO', erro="Relatório não encontrado no portal")
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            return self._parse_status_page(soup, relatorio_id)
+            digest = hashlib.sha256(response.content).hexdigest()
+            if anterior and anterior['hash'] == digest:
+                POLLS_SEM_ALTERACAO.inc(motivo='hash')
+                return anterior['status_info'].copia()
+            # Corpo novo: só agora vale procurar o formulário de login (nos bytes, sem decodificar)
+            if b'kc-form-login' in response.content:
+                return self._status_sessao_expirada(relatorio_id)
+            
+            soup = criar_soup(response.text)
+            status_info = self._parse_status_page(soup, relatorio_id)
+            with self._paginas_lock:
+                self._paginas_status[relatorio_id] = {
+                    'hash': digest,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'status_info': status_info
+                }
+            return status_info.copia()
             
         except Exception as e:
             logger.error(f"Erro ao verificar status do relatório {relatorio_id}: {str(e)}")
+            FALHAS.inc(etapa='verificar_status')
             return None
     
+    def esquecer_status(self, relatorio_id):
+        """Descarta a última página de status guardada (relatório finalizado)"""
+        with self._paginas_lock:
+            self._paginas_status.pop(relatorio_id, None)
+    
+    def _sessao_expirada(self, response):
+        """Resposta redirecionada para o login (ou negada) em vez da página do relatório
+        
+        Só olha status e URLs; o corpo é verificado depois da comparação de hash.
+        """
+        if response.status_code in (401, 403):
+            return True
+        urls = [response.url] + [r.headers.get('Location', '') for r in response.history]
+        return any('/auth/realms/' in (url or '') for url in urls)
+    
+    def _status_sessao_expirada(self, relatorio_id):
+        logger.warning(f"Sessão expirada ao verificar o relatório {relatorio_id}")
+        return StatusRelatorio(relatorio_id, 'SESSAO_EXPIRADA', erro="Sessão expirada (redirecionada para o login)")
+    
     def _parse_status_page(self, soup, relatorio_id):
         """Analisa a página de status do relatório"""
-        status_info = {
-            'id': relatorio_id,
-            'status': 'DESCONHECIDO',
-            'etapas': [],
-            'detalhes': {},
-            'filtros': {},
-            'download_url': None,
-            'titulo': None
-        }
+        status_info = StatusRelatorio(relatorio_id, etapas=[], detalhes={}, filtros={})
         
         # Extrair título
         h1 = soup.find('h1')
@@ -71,9 +137,13 @@ class RelatorioUFFAutomator:
         
         # Procurar link de download
         download_link = self._find_download_link(soup)
+        erro = None if download_link else self._detectar_falha(soup, status_info)
         if download_link:
             status_info['download_url'] = download_link
             status_info['status'] = 'PRONTO'
+        elif erro:
+            status_info['erro'] = erro
+            status_info['status'] = 'ERRO'
         elif status_info.get('detalhes', {}).get('processado_em') not in [None, '---', '']:
             status_info['status'] = 'PROCESSADO'
         elif status_info['etapas']:
@@ -81,6 +151,44 @@ class RelatorioUFFAutomator:
         
         return status_info
     
+    def _detectar_falha(self, soup, status_info):
+        """Mensagem de falha no servidor (banner de erro, etapa com falha ou situação do pedido)
+        
+        Só contam banners dentro do card do relatório (etapas ou detalhes):
+        avisos gerais do site não são falha do pedido.
+        """
+        for area in self._areas_relatorio(soup):
+            for banner in area.select('.alert-danger, .alert-error'):
+                texto = banner.get_text(' ', strip=True)
+                if texto:
+                    return texto
+        
+        steps_bar = soup.find('div', {'id': 'relatorioStepsBar'})
+        if steps_bar:
+            for step in steps_bar.find_all('div', class_='step'):
+                if any(classe in CLASSES_ETAPA_FALHA for classe in step.get('class', [])):
+                    return f"Etapa com falha: {step.get_text(' ', strip=True)}"
+        
+        for chave in ('status', 'situação', 'situacao'):
+            valor = status_info.get('detalhes', {}).get(chave, '')
+            if any(termo in valor.lower() for termo in TERMOS_FALHA_RELATORIO):
+                return f"Situação do pedido: {valor}"
+        return None
+    
+    def _areas_relatorio(self, soup):
+        """Cards com a barra de etapas e os detalhes do pedido"""
+        areas = []
+        for elemento in (soup.find('div', {'id': 'relatorioStepsBar'}), soup.find('div', class_='card-body')):
+            if elemento is None:
+                continue
+            area = elemento.find_parent('div', class_='card')
+            if area is None:
+                # Sem card: o contêiner imediato, desde que não seja a página inteira
+                area = elemento.parent if elemento.parent.name not in ('body', 'html', '[document]') else elemento
+            if all(area is not outra for outra in areas):
+                areas.append(area)
+        return areas
+    
     def _parse_steps_bar(self, steps_bar):
         """Analisa a barra de etapas do processamento"""
         etapas = []
@@ -165,23 +273,58 @@ class RelatorioUFFAutomator:
         
         return None
     
+    @rastrear('automator.aguardar_conclusao', argumentos=('relatorio_id',))
     def aguardar_conclusao(self, relatorio_id, callback_progresso=None, 
-                          intervalo=INTERVALO_VERIFICACAO, timeout=TIMEOUT_PROCESSAMENTO):
-        """Aguarda a conclusão do processamento do relatório"""
+                          intervalo=INTERVALO_VERIFICACAO, timeout=TIMEOUT_PROCESSAMENTO,
+                          fator_backoff=1.0, intervalo_maximo=None,
+                          max_erros_consecutivos=MAX_ERROS_CONSECUTIVOS_STATUS):
+        """Aguarda a conclusão do processamento do relatório
+        
+        Com fator_backoff > 1, o intervalo entre verificações é multiplicado
+        pelo fator a cada consulta, até intervalo_maximo.
+        
+        Retorna o status_info quando o relatório fica PRONTO ou assim que uma
+        falha é detectada (status em STATUS_FALHA, com a mensagem em 'erro'),
+        inclusive após max_erros_consecutivos verificações com erro seguidas.
+        Retorna None no timeout.
+        """
         logger.info(f"Iniciando monitoramento do relatório #{relatorio_id}")
         logger.info(f"Timeout: {timeout}s, Intervalo: {intervalo}s")
         
+        espera = intervalo
         tempo_inicio = time.time()
         ultimo_status = None
+        verificacoes = 0
+        erros_consecutivos = 0
         
         while time.time() - tempo_inicio < timeout:
             status_info = self.verificar_status_relatorio(relatorio_id)
+            verificacoes += 1
             
             if not status_info:
+                erros_consecutivos += 1
+                if erros_consecutivos >= max_erros_consecutivos:
+                    status_info = StatusRelatorio(
+                        relatorio_id, 'ERRO', erro=f"{erros_consecutivos} verificações de status seguidas falharam"
+                    )
+                else:
+                    if callback_progresso:
+                        callback_progresso(0, "Erro ao verificar status", False)
+                    time.sleep(espera)
+                    continue
+            else:
+                erros_consecutivos = 0
+            
+            # Falha detectada: libera o relatório sem esperar o timeout
+            if status_info['status'] in STATUS_FALHA:
+                definir_atributos(status=status_info['status'], espera_s=round(time.time() - tempo_inicio, 1))
+                FALHAS.inc(etapa=status_info['status'].lower())
+                POLLS_POR_RELATORIO.observar(verificacoes)
+                self.esquecer_status(relatorio_id)
+                logger.warning(f"Relatório #{relatorio_id} abandonado: {status_info['erro']}")
                 if callback_progresso:
-                    callback_progresso(0, "Erro ao verificar status", False)
-                time.sleep(intervalo)
-                continue
+                    callback_progresso(1.0, f"❌ {status_info['erro']}", False)
+                return status_info
             
             # Calcular progresso baseado no tempo
             tempo_decorrido = time.time() - tempo_inicio
@@ -198,6 +341,10 @@ class RelatorioUFFAutomator:
             
             # Verificar se está pronto
             if status_info['status'] == 'PRONTO':
+                definir_atributos(status='PRONTO', espera_s=round(time.time() - tempo_inicio, 1))
+                PROCESSAMENTO_SERVIDOR.observar(time.time() - tempo_inicio)
+                POLLS_POR_RELATORIO.observar(verificacoes)
+                self.esquecer_status(relatorio_id)
                 if callback_progresso:
                     callback_progresso(1.0, "✅ Relatório pronto para download!", True)
                 logger.info(f"Relatório #{relatorio_id} está pronto!")
@@ -210,9 +357,16 @@ class RelatorioUFFAutomator:
                     logger.info(f"Detalhes: {status_info['detalhes']}")
                 ultimo_status = status_info
             
-            time.sleep(intervalo)
+            time.sleep(espera)
+            espera = espera * fator_backoff
+            if intervalo_maximo:
+                espera = min(espera, intervalo_maximo)
         
         # Timeout atingido
+        definir_atributos(status='TIMEOUT')
+        FALHAS.inc(etapa='timeout')
+        POLLS_POR_RELATORIO.observar(verificacoes)
+        self.esquecer_status(relatorio_id)
         timeout_msg = f"Timeout após {timeout//60} minutos"
         logger.warning(timeout_msg)
         if callback_progresso:
@@ -220,6 +374,7 @@ class RelatorioUFFAutomator:
         
         return None
     
+    @rastrear('automator.baixar_relatorio')
     def baixar_relatorio(self, status_info, pasta_destino=PASTA_RELATORIOS):
         """Baixa o relatório quando estiver pronto"""
         if not status_info or not status_info.get('download_url'):
@@ -237,30 +392,18 @@ class RelatorioUFFAutomator:
             logger.info(f"Iniciando download: {nome_arquivo}")
             logger.info(f"URL: {status_info['download_url']}")
             
-            # Fazer download
-            response = self.session.get(
-                status_info['download_url'],
-                stream=True,
-                timeout=TIMEOUT_REQUESTS
-            )
-            response.raise_for_status()
-            
-            # Salvar arquivo
-            tamanho_total = int(response.headers.get('content-length', 0))
-            tamanho_baixado = 0
-            
-            with open(caminho_completo, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        tamanho_baixado += len(chunk)
-                        
-                        # Log progresso a cada 1MB
-                        if tamanho_baixado % (1024 * 1024) < 8192:
-                            progresso = (tamanho_baixado / tamanho_total * 100) if tamanho_total > 0 else 0
-                            logger.info(f"Download: {tamanho_baixado/(1024*1024):.1f}MB ({progresso:.1f}%)")
+            # Fazer download (retomado com Range se a conexão cair; verificado pelo Content-Length)
+            inicio_download = time.time()
+            download = DownloadRetomavel(self.session, progresso=self._log_progresso_download)
+            tamanho_baixado = download.baixar(status_info['download_url'], caminho_completo)
             
             logger.info(f"Download concluído: {caminho_completo} ({tamanho_baixado/(1024*1024):.1f}MB)")
+            definir_atributos(relatorio_id=status_info.get('id'), bytes=tamanho_baixado)
+            duracao_download = time.time() - inicio_download
+            DOWNLOAD_BYTES.inc(tamanho_baixado)
+            DOWNLOAD_DURACAO.observar(duracao_download)
+            if duracao_download > 0:
+                DOWNLOAD_VAZAO.set(tamanho_baixado / duracao_download)
             
             # Validar arquivo
             if self._validar_arquivo_excel(caminho_completo):
@@ -272,8 +415,13 @@ class RelatorioUFFAutomator:
             
         except Exception as e:
             logger.error(f"Erro ao baixar relatório: {str(e)}")
+            FALHAS.inc(etapa='download')
             return None
     
+    def _log_progresso_download(self, tamanho_baixado, tamanho_total):
+        progresso = (tamanho_baixado / tamanho_total * 100) if tamanho_total > 0 else 0
+        logger.info(f"Download: {tamanho_baixado/(1024*1024):.1f}MB ({progresso:.1f}%)")
+    
     def _gerar_nome_arquivo(self, status_info):
         """Gera um nome descritivo para o arquivo"""
         filtros = status_info.get('filtros', {})
@@ -308,6 +456,8 @@ class RelatorioUFFAutomator:
     def _validar_arquivo_excel(self, caminho_arquivo):
         """Valida se o arquivo é um Excel válido"""
         try:
+            import pandas as pd
+            
             # Tentar ler as primeiras linhas
             df = pd.read_excel(caminho_arquivo, nrows=5)
             logger.info(f"Arquivo válido: {len(df)} linhas, {len(df.columns)} colunas")
@@ -0,0 +1,102 @@
+"""Gravação com credenciais ocultas e reprodução do cassete HTTP"""
+import json
+
+import pytest
+import requests
+
+from cassete_http import OCULTO, AdaptadorReproducao, GravadorCassete, Redator, ReprodutorCassete
+
+URL = 'https://app.uff.br/graduacao/administracaoacademica/relatorios'
+
+
+def _resposta(request, status=200, corpo=b'', tipo='text/html; charset=utf-8', cabecalhos=None):
+    response = requests.Response()
+    response.status_code = status
+    response.reason = 'OK'
+    response.headers = requests.structures.CaseInsensitiveDict({'Content-Type': tipo, **(cabecalhos or {})})
+    response._content = corpo
+    response.encoding = 'utf-8'
+    response.url = request.url
+    response.request = request
+    return response
+
+
+def _requisicao(metodo, url, **kwargs):
+    return requests.Request(metodo, url, **kwargs).prepare()
+
+
+def _sessao(caminho):
+    session = requests.Session()
+    adaptador = AdaptadorReproducao(ReprodutorCassete(str(caminho), escala_tempo=0))
+    session.mount('https://', adaptador)
+    return session
+
+
+def test_redator_oculta_segredos_campos_e_cabecalhos():
+    redator = Redator(['aluno.teste', 's3nh@'])
+
+    assert redator.texto('login de aluno.teste com s3nh@') == f'login de {OCULTO} com {OCULTO}'
+    url = redator.url(f'{URL}?token=abc&pagina=2')
+    assert 'abc' not in url and url.endswith('&pagina=2')
+    html = '<input type="hidden" name="csrf_token" value="xyz"><input name="curso" value="12">'
+    assert redator.texto(html) == f'<input type="hidden" name="csrf_token" value="{OCULTO}"><input name="curso" value="12">'
+
+    cabecalhos = redator.cabecalhos({'Cookie': 'sessao=1', 'Accept': 'text/html'})
+    assert cabecalhos == {'Cookie': OCULTO, 'Accept': 'text/html'}
+
+    corpo = redator.corpo_requisicao('username=aluno.teste&password=s3nh@&idcurso=12',
+                                     'application/x-www-form-urlencoded')
+    assert 'aluno.teste' not in corpo and 's3nh@' not in corpo
+    assert 'idcurso=12' in corpo
+
+
+def test_gravador_nao_grava_credenciais(tmp_path):
+    caminho = tmp_path / 'cassete.jsonl'
+    gravador = GravadorCassete(str(caminho), segredos=['s3nh@'])
+    request = _requisicao('POST', f'{URL}/login', data={'username': 'aluno', 'password': 's3nh@'},
+                          headers={'Authorization': 'Bearer 123'})
+    gravador.registrar(request, _resposta(request, corpo=b'<p>bem-vindo</p>',
+                                          cabecalhos={'Set-Cookie': 'sessao=abc'}), latencia=0.1)
+    gravador.fechar()
+
+    texto = caminho.read_text(encoding='utf-8')
+    for segredo in ('s3nh@', 'Bearer 123', 'sessao=abc'):
+        assert segredo not in texto
+    assert json.loads(texto)['texto'] == '<p>bem-vindo</p>'
+
+
+def test_reprodutor_segue_a_ordem_gravada_e_repete_a_ultima(tmp_path):
+    caminho = tmp_path / 'cassete.jsonl'
+    gravador = GravadorCassete(str(caminho))
+    url_status = f'{URL}/42'
+    for estado in ('PROCESSANDO', 'PROCESSANDO', 'CONCLUIDO'):
+        request = _requisicao('GET', url_status)
+        gravador.registrar(request, _resposta(request, corpo=estado.encode()))
+    gravador.fechar()
+
+    session = _sessao(caminho)
+    estados = [session.get(url_status).text for _ in range(4)]
+    assert estados == ['PROCESSANDO', 'PROCESSANDO', 'CONCLUIDO', 'CONCLUIDO']
+
+    with pytest.raises(requests.ConnectionError):
+        session.get(f'{URL}/nao-gravada')
+
+
+def test_reprodutor_serve_faixas_a_partir_do_download_completo(tmp_path):
+    caminho = tmp_path / 'cassete.jsonl'
+    corpo = bytes(range(256)) * 4
+    url_arquivo = f'{URL}/42/download'
+    gravador = GravadorCassete(str(caminho))
+    request = _requisicao('GET', url_arquivo)
+    gravador.registrar(request, _resposta(request, corpo=corpo, tipo='application/vnd.ms-excel'))
+    gravador.fechar()
+
+    session = _sessao(caminho)
+    response = session.get(url_arquivo, headers={'Range': 'bytes=100-299'})
+    assert response.status_code == 206
+    assert response.content == corpo[100:300]
+    assert response.headers['Content-Range'] == f'bytes 100-299/{len(corpo)}'
+
+    # Faixa aberta e fim além do arquivo: recorta até o último byte
+    assert session.get(url_arquivo, headers={'Range': 'bytes=1000-'}).content == corpo[1000:]
+    assert session.get(url_arquivo, headers={'Range': 'bytes=1000-5000'}).content == corpo[1000:]
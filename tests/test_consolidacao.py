@@ -0,0 +1,107 @@
+"""Abas da TabelaEvasao comparadas com as da consolidação antiga (por relatório, em dicionários)
+
+Os valores esperados foram obtidos com a implementação anterior ao formato
+longo para os mesmos dois relatórios; na planilha, os percentuais são
+frações (0,25 = 25%).
+"""
+import pandas as pd
+import pytest
+
+from consolidacao import TabelaEvasao
+from gerador_relatorios import ProcessadorDadosRelatorios
+
+RELATORIO_20131 = pd.DataFrame({
+    'SITUAÇÃO': ['Inscrito', 'Concluinte', 'Trancado', 'Formado', 'Cancelado', 'Cancelado', 'Cancelado',
+                 'Permanência de Vínculo'],
+    'MOTIVO DO CANCELAMENTO': ['', '', '', '', 'Abandono do curso', 'Solicitação oficial do aluno',
+                               'Falecimento', ''],
+    'MODALIDADE': ['A0', 'L1', 'A0', 'L2', 'A0', 'A0', 'L5', ''],
+})
+RELATORIO_20132 = pd.DataFrame({
+    'SITUAÇÃO': ['Inscrito', 'Cancelado', 'Trancado', 'Formando'],
+    'MOTIVO DO CANCELAMENTO': ['', 'Mudança de curso', 'Reprovação por frequência', 'Ingressante - insuf.'],
+    'MODALIDADE': ['A0', 'A0', 'L1', 'L1'],
+})
+
+MOTIVOS = ['Solicitação Oficial', 'Abandono', 'Insuficiência de Aproveitamento', 'Ingressante - Insuf. Aproveit.',
+           'Mudança de Curso', 'Outros']
+
+PLANILHA_ANTIGA = {
+    'RESUMO GERAL': {
+        'Curso': ['ENG', 'MAT'], 'Total Matrículas': [12, 0], 'Total Cancelamentos': [6, 0],
+        'Total Formados': [3, 0], 'Total Ativos': [5, 0], '% Cancelamentos': [0.5, 0.0],
+        '% Formados': [0.25, 0.0], '% Ativos': [0.4167, 0.0],
+    },
+    'DETALHES': {
+        'Curso': ['ENG', 'ENG'], 'Período': ['2013/1', '2013/2'], 'Total Registros': [8, 4],
+        'Matrículas Ativas': [3, 2], 'Ampla Concorrência': [4, 2], 'Ações Afirmativas': [3, 2],
+        'Inscritos/Pendentes/Concluintes (qtd)': [2, 1], 'Inscritos/Pendentes/Concluintes (%)': [0.25, 0.25],
+        'Trancados (qtd)': [1, 1], 'Trancados (%)': [0.125, 0.25],
+        'Formados (qtd)': [2, 1], 'Formados (%)': [0.25, 0.25],
+        'Cancel: Solicitação Oficial': [1, 0], 'Cancel: Abandono': [1, 0],
+        'Cancel: Insuficiência de Aproveitamento': [0, 1], 'Cancel: Ingressante - Insuf. Aproveit.': [0, 1],
+        'Cancel: Mudança de Curso': [0, 1], 'Cancel: Outros': [1, 0],
+    },
+    'CANCELAMENTOS': {
+        'Curso': ['ENG'] * 12, 'Período': ['2013/1'] * 6 + ['2013/2'] * 6, 'Motivo Cancelamento': MOTIVOS * 2,
+        'Quantidade': [1, 1, 0, 0, 0, 1, 0, 0, 1, 1, 1, 0],
+        'Percentual': [0.3333, 0.3333, 0.0, 0.0, 0.0, 0.3333, 0.0, 0.0, 0.3333, 0.3333, 0.3333, 0.0],
+    },
+    'MODALIDADES': {
+        'Curso': ['ENG', 'ENG'], 'Período': ['2013/1', '2013/2'], 'Total': [8, 4],
+        'Ampla Concorrência': [4, 2], '% Ampla': [0.5, 0.5], 'Ações Afirmativas': [3, 2], '% Ações': [0.375, 0.5],
+    },
+}
+RESUMO_ANTIGO = {'total_cursos': 2, 'total_periodos': 2, 'total_matriculas': 12, 'total_cancelamentos': 6,
+                 'total_formados': 3, 'total_ativos': 5}
+
+
+def _tabela():
+    tabela = TabelaEvasao()
+    tabela.adicionar_relatorio(RELATORIO_20131, 'ENG', '20131')
+    tabela.adicionar_relatorio(RELATORIO_20132, 'ENG', '20132')
+    tabela.registrar_curso('MAT')  # sem relatórios válidos: aparece zerado no resumo
+    return tabela
+
+
+def _em_fracao(aba):
+    """A tabela dá percentuais de 0 a 100; a planilha antiga, frações com 4 casas"""
+    aba = aba.copy()
+    for coluna in aba.columns:
+        if coluna.startswith('%') or coluna.endswith('(%)') or coluna == 'Percentual':
+            aba[coluna] = (aba[coluna] / 100).round(4)
+    return aba
+
+
+def test_resumo_geral_igual_ao_antigo():
+    assert _tabela().resumo_geral() == RESUMO_ANTIGO
+
+
+@pytest.mark.parametrize('nome', list(PLANILHA_ANTIGA))
+def test_abas_iguais_as_antigas(nome):
+    aba = _em_fracao(_tabela().abas()[nome])
+    pd.testing.assert_frame_equal(aba.reset_index(drop=True), pd.DataFrame(PLANILHA_ANTIGA[nome]),
+                                  check_dtype=False)
+
+
+def test_planilha_gravada_igual_a_antiga(tmp_path):
+    relatorios = {}
+    for periodo, df in (('20131', RELATORIO_20131), ('20132', RELATORIO_20132)):
+        caminho = tmp_path / f'ENG_{periodo}.xlsx'
+        df.to_excel(caminho, index=False)
+        relatorios[periodo] = str(caminho)
+    resultados = {
+        'ENG': [{'success': True, 'caminho_arquivo': caminho, 'periodo': periodo}
+                for periodo, caminho in relatorios.items()],
+        'MAT': [{'success': False, 'periodo': '20131', 'error': 'Tempo esgotado'}],
+    }
+    processador = ProcessadorDadosRelatorios(str(tmp_path))
+    dados = processador.consolidar_dados_todos_relatorios(resultados)
+    saida = tmp_path / 'estatisticas_evasao.xlsx'
+    processador.gerar_planilha_consolidada(dados, str(saida))
+
+    assert dados['resumo_geral'] == RESUMO_ANTIGO
+    abas = pd.read_excel(saida, sheet_name=None)
+    assert list(abas) == list(PLANILHA_ANTIGA)
+    for nome, esperado in PLANILHA_ANTIGA.items():
+        pd.testing.assert_frame_equal(abas[nome], pd.DataFrame(esperado), check_dtype=False)
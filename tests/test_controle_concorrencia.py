@@ -0,0 +1,105 @@
+"""Limite AIMD: aumento aditivo, redução multiplicativa e vaga presa ao corpo da resposta"""
+import io
+import time
+
+from urllib3.response import HTTPResponse
+
+from controle_concorrencia import LimiteAIMD, _CorpoComVaga, _Vaga
+
+
+def _limite(**kwargs):
+    parametros = dict(inicial=4, minimo=1, maximo=8, fator_reducao=0.5, fator_latencia=3.0)
+    parametros.update(kwargs)
+    return LimiteAIMD('teste', **parametros)
+
+
+def test_sucessos_aumentam_o_limite_aditivamente():
+    limite = _limite()
+    for _ in range(4):
+        limite.adquirir()
+        limite.liberar(0.1, erro=False)
+    # +1/limite por sucesso: quatro sucessos com limite ~4 somam ~1
+    assert 4.9 < limite.limite < 5.0
+    assert limite.sucessos == 4 and limite.em_voo == 0
+
+
+def test_limite_nao_passa_do_maximo():
+    limite = _limite(inicial=8)
+    limite.adquirir()
+    limite.liberar(0.1, erro=False)
+    assert limite.limite == 8
+
+
+def test_erro_reduz_uma_vez_por_rodada():
+    limite = _limite()
+    limite.adquirir()
+    limite.liberar(0.1, erro=False)
+    inicial = limite.limite
+
+    limite.adquirir()
+    limite.adquirir()
+    limite.liberar(0.1, erro=True)
+    limite.liberar(0.1, erro=True)  # mesma rodada: não reduz de novo
+    assert limite.limite == inicial * 0.5
+    assert limite.erros == 2 and limite.reducoes == 1
+
+
+def test_resposta_lenta_reduz_e_minimo_e_respeitado():
+    limite = _limite(inicial=1.5, fator_reducao=0.25)
+    limite.adquirir()
+    limite.liberar(0.01, erro=False)
+    limite.adquirir()
+    limite.liberar(1.0, erro=False)  # 100x a latência de base
+    assert limite.limite == 1
+    assert limite.reducoes == 1 and limite.erros == 0
+
+
+def test_devolver_nao_ajusta_o_limite():
+    limite = _limite()
+    limite.adquirir()
+    limite.devolver()
+    assert limite.limite == 4 and limite.em_voo == 0
+    assert limite.sucessos == 0 and limite.erros == 0
+
+
+def _corpo(limite, dados=b'x' * 1000):
+    limite.adquirir()
+    raw = HTTPResponse(body=io.BytesIO(dados), preload_content=False)
+    return _CorpoComVaga(raw, _Vaga(limite))
+
+
+def test_vaga_fica_ocupada_ate_o_fim_do_stream():
+    limite = _limite()
+    corpo = _corpo(limite)
+    blocos = corpo.stream(100)
+    next(blocos)
+    assert limite.em_voo == 1
+    for _ in blocos:
+        pass
+    assert limite.em_voo == 0 and limite.sucessos == 1
+
+
+def test_corpo_fechado_antes_do_fim_devolve_sem_ajuste():
+    limite = _limite()
+    corpo = _corpo(limite)
+    corpo.read(10)
+    assert limite.em_voo == 1
+    corpo.close()
+    corpo.release_conn()  # a vaga é devolvida uma única vez
+    assert limite.em_voo == 0
+    assert limite.limite == 4 and limite.sucessos == 0
+
+
+def test_transferencia_longa_nao_conta_como_resposta_lenta():
+    limite = _limite()
+    limite.adquirir()
+    limite.liberar(0.001, erro=False)  # latência de base: 1ms
+
+    corpo = _corpo(limite)
+    corpo._vaga.cabecalhos_recebidos()  # cabeçalhos rápidos
+    time.sleep(0.05)  # corpo grande: 50x a latência de base para chegar
+    assert limite.em_voo == 1
+    corpo.read()
+
+    assert limite.em_voo == 0
+    assert limite.reducoes == 0 and limite.sucessos == 2
@@ -0,0 +1,108 @@
+"""Descoberta de cursos: novas tentativas, falhas registradas e catálogo incompleto não salvo"""
+import json
+import os
+
+import pytest
+import requests
+
+import descoberta_cursos
+from config import BUSCAR_CURSOS_URL, BUSCAR_DESDOBRAMENTOS_URL
+from descoberta_cursos import DescobertaCursos, obter_catalogo
+
+PAGINA = '''
+<form>
+  <input name="authenticity_token" value="t">
+  <select id="idlocalidade"><option value="1">Niterói</option><option value="2">Volta Redonda</option></select>
+  <select id="idcurso"></select>
+</form>
+'''
+CURSOS = {'1': [{'value': '12', 'text': 'Engenharia Civil'}, {'value': '13', 'text': 'Química'}],
+          '2': [{'value': '20', 'text': 'Engenharia Mecânica'}]}
+DESDOBRAMENTOS = {'12': [{'value': '120', 'text': 'Engenharia Civil (120)'}], '13': [], '20': [
+    {'value': '200', 'text': 'Engenharia Mecânica (200)'}]}
+
+
+class _Resposta:
+    def __init__(self, dados=None, texto='', status=200):
+        self._dados, self.text, self.status_code = dados, texto, status
+
+    def json(self):
+        if self._dados is None:
+            raise ValueError
+        return self._dados
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+
+class _PortalFalso:
+    """Responde o formulário e os endpoints AJAX; `falhas` conta erros 503 a dar por (url, código)"""
+
+    def __init__(self, falhas=None):
+        self.falhas = dict(falhas or {})
+
+    def get(self, url, **kwargs):
+        return _Resposta(texto=PAGINA)
+
+    def post(self, url, data, **kwargs):
+        codigo = data.get('idcurso') or data['idlocalidade']
+        if self.falhas.get((url, codigo), 0) > 0:
+            self.falhas[(url, codigo)] -= 1
+            return _Resposta(status=503)
+        if url == BUSCAR_CURSOS_URL:
+            return _Resposta({'cursos': CURSOS[codigo]})
+        return _Resposta({'desdobramentos': DESDOBRAMENTOS[codigo]})
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    monkeypatch.setattr(descoberta_cursos, 'ESPERA_DESCOBERTA', 0)
+
+
+def _desdobramentos(catalogo):
+    return sorted(curso['codigo_desdobramento'] for curso in catalogo)
+
+
+def test_descobre_todas_as_localidades():
+    descoberta = DescobertaCursos(_PortalFalso())
+    catalogo = descoberta.descobrir()
+    # Química não tem desdobramentos: o próprio curso é o desdobramento
+    assert _desdobramentos(catalogo) == ['120', '13', '200']
+    assert descoberta.falhas == []
+
+
+def test_falha_passageira_e_repetida():
+    descoberta = DescobertaCursos(_PortalFalso({(BUSCAR_DESDOBRAMENTOS_URL, '13'): 2}))
+    assert _desdobramentos(descoberta.descobrir()) == ['120', '13', '200']
+    assert descoberta.falhas == []
+
+
+def test_desdobramentos_sem_resposta_nao_viram_o_proprio_curso():
+    descoberta = DescobertaCursos(_PortalFalso({(BUSCAR_DESDOBRAMENTOS_URL, '12'): 10}))
+    assert _desdobramentos(descoberta.descobrir()) == ['13', '200']
+    assert [(f['idlocalidade'], f['idcurso']) for f in descoberta.falhas] == [('1', '12')]
+
+
+def test_localidade_sem_resposta_e_registrada():
+    descoberta = DescobertaCursos(_PortalFalso({(BUSCAR_CURSOS_URL, '2'): 10}))
+    assert _desdobramentos(descoberta.descobrir()) == ['120', '13']
+    assert [f['idlocalidade'] for f in descoberta.falhas] == ['2']
+
+
+def test_catalogo_com_falhas_nao_e_salvo(tmp_path):
+    caminho = str(tmp_path / 'catalogo_cursos.json')
+    portal = _PortalFalso({(BUSCAR_CURSOS_URL, '2'): 10})
+    assert _desdobramentos(obter_catalogo(portal, caminho=caminho)) == ['120', '13']
+    assert not os.path.exists(caminho)
+
+    # Com o portal respondendo, o catálogo completo é descoberto e salvo
+    assert _desdobramentos(obter_catalogo(_PortalFalso(), caminho=caminho)) == ['120', '13', '200']
+    with open(caminho, encoding='utf-8') as f:
+        assert _desdobramentos(json.load(f)['cursos']) == ['120', '13', '200']
+
+
+def test_catalogo_filtrado_nao_e_salvo(tmp_path):
+    caminho = str(tmp_path / 'catalogo_cursos.json')
+    assert _desdobramentos(obter_catalogo(_PortalFalso(), ['volta'], caminho=caminho)) == ['200']
+    assert not os.path.exists(caminho)
@@ -0,0 +1,137 @@
+"""Ordem de remoção do orçamento de disco e restauração dos relatórios comprimidos"""
+import os
+import time
+
+import pytest
+
+import gestor_disco
+from gestor_disco import EXTENSAO_COMPRIMIDA, GestorDisco, caminho_disponivel, planilha_de_saida
+
+KB = 1024
+
+
+@pytest.fixture
+def pasta(tmp_path, monkeypatch):
+    monkeypatch.setattr(gestor_disco, 'PROTECAO_ACESSO_RECENTE', 0)
+    monkeypatch.setattr(gestor_disco, 'verificar_espaco_disco', lambda *args, **kwargs: True)
+    return tmp_path
+
+
+def _relatorio(pasta, nome, tamanho=KB):
+    caminho = os.path.join(str(pasta), nome)
+    with open(caminho, 'wb') as f:
+        f.write(os.urandom(tamanho))
+    return caminho
+
+
+def _gestor(pasta, orcamento_kb, comprimir_apos_dias=None):
+    return GestorDisco(str(pasta), os.path.join(str(pasta), 'indice.json'),
+                       orcamento_mb=orcamento_kb / 1024, comprimir_apos_dias=comprimir_apos_dias)
+
+
+def _acessar(gestor, caminho, idade_horas):
+    gestor._entradas[os.path.normpath(caminho)]['acesso'] = time.time() - idade_horas * 3600
+
+
+def test_remove_substituidos_antes_e_depois_lru(pasta):
+    gestor = _gestor(pasta, orcamento_kb=1.5)
+    antigo = _relatorio(pasta, 'civil_20221_1.xlsx')
+    gestor.registrar(antigo, 'Civil', '20221')
+    novo = _relatorio(pasta, 'civil_20221_2.xlsx')
+    gestor.registrar(novo, 'Civil', '20221')
+    outro = _relatorio(pasta, 'quimica_20221_3.xlsx')
+    gestor.registrar(outro, 'Química', '20221')
+
+    # O substituído foi o último usado, mas sai primeiro; depois o menos usado
+    _acessar(gestor, antigo, 1)
+    _acessar(gestor, novo, 2)
+    _acessar(gestor, outro, 3)
+
+    assert gestor.aplicar_orcamento() == 2
+    assert not os.path.exists(antigo) and not os.path.exists(outro)
+    assert os.path.exists(novo)
+    assert gestor.uso_bytes() == KB
+
+
+def test_protegidos_e_usados_recentemente_ficam(pasta, monkeypatch):
+    gestor = _gestor(pasta, orcamento_kb=0)
+    usado = _relatorio(pasta, 'civil_20221_1.xlsx')
+    gestor.registrar(usado, 'Civil', '20221')
+    em_uso = _relatorio(pasta, 'quimica_20221_2.xlsx')
+    gestor.registrar(em_uso, 'Química', '20221')
+    _acessar(gestor, em_uso, 48)
+    monkeypatch.setattr(gestor_disco, 'PROTECAO_ACESSO_RECENTE', 3600)
+
+    assert gestor.aplicar_orcamento(protegidos=[em_uso]) == 0
+    assert os.path.exists(usado) and os.path.exists(em_uso)
+
+
+def test_comprimido_e_restaurado_com_o_mesmo_conteudo(pasta):
+    pytest.importorskip('zstandard')
+    gestor = _gestor(pasta, orcamento_kb=1024, comprimir_apos_dias=1)
+    caminho = _relatorio(pasta, 'civil_20221_1.xlsx')
+    with open(caminho, 'rb') as f:
+        conteudo = f.read()
+    mtime = os.stat(caminho).st_mtime_ns
+    gestor.registrar(caminho, 'Civil', '20221')
+    _acessar(gestor, caminho, 48)
+
+    assert gestor.comprimir_frios() == 1
+    assert not os.path.exists(caminho) and os.path.exists(caminho + EXTENSAO_COMPRIMIDA)
+
+    # Sem gestor (ex.: a interface): restaura, e o índice se corrige na sincronização
+    assert caminho_disponivel(caminho) == caminho
+    with open(caminho, 'rb') as f:
+        assert f.read() == conteudo
+    assert os.stat(caminho).st_mtime_ns == mtime
+    gestor.sincronizar()
+    assert gestor._entradas[os.path.normpath(caminho)]['comprimido'] is False
+
+    assert caminho_disponivel(os.path.join(str(pasta), 'inexistente.xlsx')) is None
+
+
+def test_planilhas_de_saida_ficam_fora_do_indice(pasta):
+    gestor = _gestor(pasta, orcamento_kb=1024)
+    _relatorio(pasta, 'estatisticas_evasao_20240101.xlsx')
+    saida = _relatorio(pasta, 'evasao.xlsx')
+    _relatorio(pasta, 'evasao_alunos.xlsx')
+    with open(os.path.join(str(pasta), 'evasao_resultados.json'), 'w') as f:
+        f.write('{}')
+    baixado = _relatorio(pasta, 'civil_20221_1.xlsx')
+
+    assert planilha_de_saida(saida)
+    gestor.sincronizar()
+    assert list(gestor._entradas) == [os.path.normpath(baixado)]
+
+
+def test_lotes_simultaneos_mesclam_o_indice(pasta):
+    lote_a, lote_b = _gestor(pasta, orcamento_kb=1024), _gestor(pasta, orcamento_kb=1024)
+    civil = _relatorio(pasta, 'civil_20221_1.xlsx')
+    lote_a.registrar(civil, 'Civil', '20221')
+    quimica = _relatorio(pasta, 'quimica_20221_2.xlsx')
+    lote_b.registrar(quimica, 'Química', '20221')
+    lote_a.salvar()
+    lote_b.salvar()
+
+    entradas = _gestor(pasta, orcamento_kb=1024)._entradas
+    assert entradas[os.path.normpath(civil)]['chave'] == 'Civil|20221'
+    assert entradas[os.path.normpath(quimica)]['chave'] == 'Química|20221'
+
+
+def test_download_de_outro_lote_nao_e_removido_como_substituido(pasta):
+    lote_a = _gestor(pasta, orcamento_kb=1.5)
+    antigo = _relatorio(pasta, 'civil_20221_1.xlsx')
+    lote_a.registrar(antigo, 'Civil', '20221')
+    _acessar(lote_a, antigo, 48)
+    lote_a.salvar()
+
+    # Outro lote baixa e registra enquanto este ainda está aberto
+    lote_b = _gestor(pasta, orcamento_kb=1024)
+    novo = _relatorio(pasta, 'quimica_20221_2.xlsx')
+    lote_b.registrar(novo, 'Química', '20221')
+    lote_b.salvar()
+
+    lote_a.manter()
+    assert os.path.exists(novo) and not os.path.exists(antigo)
+    entrada = lote_a._entradas[os.path.normpath(novo)]
+    assert entrada['chave'] == 'Química|20221' and not entrada['substituido']
@@ -0,0 +1,137 @@
+"""Plano de consultas amplas, separação local e recuo para relatórios estreitos"""
+import pandas as pd
+import pytest
+
+from gerador_relatorios import GeradorRelatorios
+from planejador_consultas import (
+    CONSULTA_AMPLA, CONSULTA_ESTREITA, CONSULTA_POR_PERIODO, particionar_relatorio, planejar_consultas
+)
+from registros import ResultadoRelatorio
+
+CURSOS = [
+    {'nome': 'Engenharia Civil (Niterói)', 'codigo_curso': '12', 'codigo_desdobramento': '120'},
+    {'nome': 'Engenharia Civil (Noturno)', 'codigo_curso': '12', 'codigo_desdobramento': '121'},
+]
+PERIODOS = ['20221', '20222']
+
+
+def test_plano_usa_a_consulta_mais_ampla_que_cabe_no_limite():
+    ampla = planejar_consultas(CURSOS, PERIODOS, limite_linhas=20000)
+    assert [c['tipo'] for c in ampla] == [CONSULTA_AMPLA]
+    assert ampla[0]['cursos'] == CURSOS and ampla[0]['periodos'] == PERIODOS
+
+    por_periodo = planejar_consultas(CURSOS, PERIODOS, limite_linhas=1000)
+    assert [(c['tipo'], c['periodos']) for c in por_periodo] == [
+        (CONSULTA_POR_PERIODO, ['20221']), (CONSULTA_POR_PERIODO, ['20222'])
+    ]
+
+    estreitas = planejar_consultas(CURSOS, PERIODOS, limite_linhas=200)
+    assert {c['tipo'] for c in estreitas} == {CONSULTA_ESTREITA}
+    assert len(estreitas) == len(CURSOS) * len(PERIODOS)
+
+
+def test_plano_recua_so_no_periodo_com_estimativa_alta():
+    estimativas = {(CURSOS[0]['nome'], '20222'): 900}
+    plano = planejar_consultas(CURSOS, PERIODOS, limite_linhas=1000, estimativas=estimativas)
+    assert [(c['tipo'], c['periodos'], len(c['cursos'])) for c in plano] == [
+        (CONSULTA_POR_PERIODO, ['20221'], 2),
+        (CONSULTA_ESTREITA, ['20222'], 1),
+        (CONSULTA_ESTREITA, ['20222'], 1),
+    ]
+
+
+def _relatorio_amplo():
+    return pd.DataFrame({
+        'MATRÍCULA': ['1', '2', '3', '4', '5'],
+        'ANO/SEMESTRE DE INGRESSO': ['2022/1', '2022/1', '2022/2', '2022/2', '2021/1'],
+        'DESDOBRAMENTO': ['Civil (120)', 'Civil Noturno (121)', 'Civil (120)', 'Civil (120)', 'Civil (120)'],
+        'FORMA DE INGRESSO': ['SISU 1ª Edição', 'SISU 1ª Edição', 'SISU 2ª Edição', 'Transferência', 'SISU 1ª Edição'],
+    })
+
+
+def test_particionar_separa_por_curso_e_periodo():
+    consulta = {'tipo': CONSULTA_AMPLA, 'codigo_curso': '12', 'cursos': CURSOS, 'periodos': PERIODOS}
+    partes = particionar_relatorio(_relatorio_amplo(), consulta)
+
+    matriculas = {chave: list(df['MATRÍCULA']) for chave, df in partes.items()}
+    assert matriculas == {
+        (CURSOS[0]['nome'], '20221'): ['1'],
+        (CURSOS[0]['nome'], '20222'): ['3'],
+        (CURSOS[1]['nome'], '20221'): ['2'],
+        (CURSOS[1]['nome'], '20222'): [],
+    }
+
+
+def test_particionar_sem_colunas_levanta_value_error():
+    consulta = {'tipo': CONSULTA_AMPLA, 'codigo_curso': '12', 'cursos': CURSOS, 'periodos': PERIODOS}
+    with pytest.raises(ValueError):
+        particionar_relatorio(_relatorio_amplo().drop(columns=['DESDOBRAMENTO']), consulta)
+
+
+def test_particionar_ignora_desdobramentos_nao_pedidos():
+    consulta = {'tipo': CONSULTA_POR_PERIODO, 'codigo_curso': '12', 'cursos': CURSOS[:1], 'periodos': ['20221']}
+    partes = particionar_relatorio(_relatorio_amplo(), consulta)
+    assert list(partes[(CURSOS[0]['nome'], '20221')]['MATRÍCULA']) == ['1']
+
+
+@pytest.mark.parametrize('formato', ['120 - Civil', 'Civil ( 120 )', 'Civil'])
+def test_particionar_com_desdobramento_em_outro_formato_levanta_value_error(formato):
+    consulta = {'tipo': CONSULTA_AMPLA, 'codigo_curso': '12', 'cursos': CURSOS, 'periodos': PERIODOS}
+    df = _relatorio_amplo()
+    df['DESDOBRAMENTO'] = formato
+    with pytest.raises(ValueError):
+        particionar_relatorio(df, consulta)
+
+
+class _GeradorFalso(GeradorRelatorios):
+    """Gerador sem portal: a consulta agrupada devolve `relatorio` e os estreitos só são anotados"""
+
+    def __init__(self, caminho_relatorio=None, erro=None):
+        self.caminho_relatorio = caminho_relatorio
+        self.erro = erro
+        self.estreitos = []
+
+    def _executar_consulta(self, filtros):
+        return ('99', self.caminho_relatorio, None, self.erro)
+
+    def gerar_relatorio_individual(self, curso_config, periodo, forma_ingresso):
+        self.estreitos.append((curso_config['nome'], periodo))
+        return ResultadoRelatorio(True, curso_config['nome'], periodo, relatorio_id='estreito')
+
+
+def _consulta():
+    return {'tipo': CONSULTA_AMPLA, 'codigo_curso': '12', 'cursos': CURSOS, 'periodos': PERIODOS}
+
+
+def test_consulta_ampla_e_separada_localmente(tmp_path):
+    caminho = tmp_path / 'amplo.xlsx'
+    _relatorio_amplo().to_excel(caminho, index=False)
+    gerador = _GeradorFalso(str(caminho))
+
+    resultados = gerador.gerar_consulta_agrupada(_consulta())
+
+    assert gerador.estreitos == []
+    assert [(r['curso'], r['periodo']) for r in resultados] == [
+        (curso['nome'], periodo) for curso in CURSOS for periodo in PERIODOS
+    ]
+    assert all(r['consulta_origem'] == str(caminho) for r in resultados)
+    assert list(pd.read_excel(resultados[1]['caminho_arquivo'])['MATRÍCULA']) == [3]
+
+
+@pytest.mark.parametrize('caso', ['falha', 'sem_colunas', 'limite', 'desdobramento_sem_codigo'])
+def test_consulta_ampla_recua_para_relatorios_estreitos(tmp_path, caso):
+    caminho = tmp_path / 'amplo.xlsx'
+    df = _relatorio_amplo()
+    if caso == 'sem_colunas':
+        df = df.drop(columns=['FORMA DE INGRESSO'])
+    elif caso == 'desdobramento_sem_codigo':
+        # Partes vazias não podem virar relatórios "com sucesso" zerados
+        df['DESDOBRAMENTO'] = df['DESDOBRAMENTO'].str.replace(r' \((\d+)\)', r' - \1', regex=True)
+    df.to_excel(caminho, index=False)
+    gerador = _GeradorFalso(None, 'Erro no portal') if caso == 'falha' else _GeradorFalso(str(caminho))
+
+    resultados = gerador.gerar_consulta_agrupada(_consulta(), limite_linhas=5 if caso == 'limite' else 20000)
+
+    pares = [(curso['nome'], periodo) for curso in CURSOS for periodo in PERIODOS]
+    assert gerador.estreitos == pares
+    assert [r['relatorio_id'] for r in resultados] == ['estreito'] * len(pares)
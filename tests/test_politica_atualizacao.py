@@ -0,0 +1,49 @@
+"""Índice de relatórios compartilhado por lotes simultâneos"""
+import os
+
+from politica_atualizacao import CacheRelatorios
+
+
+def _resultado(pasta, curso, periodo, relatorio_id):
+    caminho = os.path.join(str(pasta), f'{curso}_{periodo}_{relatorio_id}.xlsx')
+    with open(caminho, 'wb') as f:
+        f.write(b'xlsx')
+    return {'success': True, 'curso': curso, 'periodo': periodo, 'relatorio_id': relatorio_id,
+            'caminho_arquivo': caminho}
+
+
+def test_lotes_simultaneos_nao_apagam_as_entradas_um_do_outro(tmp_path):
+    indice = str(tmp_path / 'cache_relatorios.json')
+    lote_a, lote_b = CacheRelatorios(indice), CacheRelatorios(indice)
+
+    lote_a.registrar(_resultado(tmp_path, 'Civil', '20131', '1'), baixado_em=100)
+    lote_b.registrar(_resultado(tmp_path, 'Química', '20131', '2'), baixado_em=100)
+    lote_a.salvar()
+    lote_b.salvar()
+
+    novo = CacheRelatorios(indice)
+    assert novo.obter('Civil', '20131')['relatorio_id'] == '1'
+    assert novo.obter('Química', '20131')['relatorio_id'] == '2'
+
+
+def test_mesmo_relatorio_fica_o_download_mais_recente(tmp_path):
+    indice = str(tmp_path / 'cache_relatorios.json')
+    lote_a, lote_b = CacheRelatorios(indice), CacheRelatorios(indice)
+
+    lote_a.registrar(_resultado(tmp_path, 'Civil', '20131', 'novo'), baixado_em=200)
+    lote_b.registrar(_resultado(tmp_path, 'Civil', '20131', 'antigo'), baixado_em=100)
+    lote_a.salvar()
+    lote_b.salvar()  # salva depois, mas o download dele é mais antigo
+
+    assert CacheRelatorios(indice).obter('Civil', '20131')['relatorio_id'] == 'novo'
+    assert lote_b.obter('Civil', '20131')['relatorio_id'] == 'novo'
+
+
+def test_frescos_ve_downloads_de_outro_lote(tmp_path):
+    indice = str(tmp_path / 'cache_relatorios.json')
+    interface, cli = CacheRelatorios(indice), CacheRelatorios(indice)
+    cli.registrar(_resultado(tmp_path, 'Civil', '20131', '1'))
+    cli.salvar()
+
+    frescos = interface.frescos([{'nome': 'Civil'}], ['20131'])
+    assert frescos[('Civil', '20131')]['origem'] == 'cache'
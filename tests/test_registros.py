@@ -0,0 +1,53 @@
+"""Interface de dict dos registros: campo None conta como chave ausente"""
+import json
+
+import pytest
+
+from registros import ResultadoRelatorio, StatusRelatorio, para_json
+
+
+def test_campo_none_e_chave_ausente():
+    resultado = ResultadoRelatorio(False, 'Civil', '20221', error='Tempo esgotado')
+
+    assert resultado['error'] == 'Tempo esgotado'
+    assert resultado['success'] is False  # False não é ausência
+    with pytest.raises(KeyError):
+        resultado['caminho_arquivo']
+    with pytest.raises(KeyError):
+        resultado['campo_inexistente']
+
+    assert resultado.get('caminho_arquivo') is None
+    assert resultado.get('caminho_arquivo', 'padrao') == 'padrao'
+    assert resultado.get('campo_inexistente', 'padrao') == 'padrao'
+    assert 'error' in resultado and 'origem' not in resultado
+
+
+def test_equivale_ao_dict_antigo():
+    resultado = ResultadoRelatorio(True, 'Civil', '20221', relatorio_id='7', caminho_arquivo='r.xlsx')
+    antigo = {'success': True, 'curso': 'Civil', 'periodo': '20221', 'relatorio_id': '7',
+              'caminho_arquivo': 'r.xlsx'}
+
+    assert dict(resultado) == antigo
+    assert resultado == antigo
+    assert len(resultado) == 5
+
+
+def test_escrita_so_em_campos_conhecidos():
+    resultado = ResultadoRelatorio(True, 'Civil', '20221')
+    resultado['origem'] = 'cache'
+    assert resultado['origem'] == 'cache'
+    with pytest.raises(KeyError):
+        resultado['extra'] = 1
+
+
+def test_copia_independente_e_json_aninhado():
+    status = StatusRelatorio('7', 'CONCLUIDO', etapas=['a', 'b'], download_url='/d/7')
+    resultado = ResultadoRelatorio(True, 'Civil', '20221', status_info=status.resumo())
+    copia = resultado.copia()
+    copia['error'] = 'x'
+
+    assert 'error' not in resultado
+    assert 'etapas' not in resultado['status_info']
+    assert json.loads(json.dumps(resultado, default=para_json))['status_info'] == {
+        'id': '7', 'status': 'CONCLUIDO', 'download_url': '/d/7'
+    }
@@ -3,11 +3,19 @@ utils.py - Funções utilitárias para o projeto
 """
 import json
 import csv
+import os
 import re
+from contextlib import contextmanager
 from datetime import datetime
 import logging
 from typing import Dict, List, Any, Optional
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 logger = logging.getLogger(__name__)
 
 def validar_email(email: str) -> bool:
@@ -115,6 +123,31 @@ def calcular_tempo_estimado(status: str, etapas: List[str]) -> int:
     
     return estimativas.get(status, 300)
 
+@contextmanager
+def bloqueio_arquivo(caminho: str):
+    """Trava exclusiva sobre `caminho`.lock, entre processos e entre threads
+
+    Usada por quem relê, mescla e regrava um índice JSON compartilhado por
+    lotes simultâneos (interface e CLI).
+    """
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(f"{caminho}.lock", 'a+b') as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        else:
+            trava.seek(0)
+            msvcrt.locking(trava.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_UN)
+            else:
+                trava.seek(0)
+                msvcrt.locking(trava.fileno(), msvcrt.LK_UNLCK, 1)
+
 def verificar_espaco_disco(caminho: str, tamanho_minimo_mb: int = 100) -> bool:
     """Verifica se há espaço em disco suficiente"""
     try:
@@ -131,3 +164,8 @@ def verificar_espaco_disco(caminho: str, tamanho_minimo_mb: int = 100) -> bool:
     except Exception as e:
         logger.error(f"Erro ao verificar espaço em disco: {str(e)}")
         return True  # Assume que há espaço para não bloquear o processo
+
+def criar_soup(html: str):
+    """BeautifulSoup com html.parser; bs4 só é importado no primeiro uso"""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser')